@@ -0,0 +1,135 @@
+"""
+Parsing and JSON round-trip of very large rules, against the recursive implementations
+
+Two shapes of rules with N comparisions: a flat chain (a AND b AND ...), which
+parses to a left-deep tree N levels deep, and right-nested parentheses
+(a OR (b OR (...))), which nests the rule string itself N levels deep. Time per
+comparision staying flat as N grows shows linear scaling.
+
+Usage: python -m benchmarks.large [--sizes N ...] [--repeat N]
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+
+from rule_engine.abstract_tree import ast_to_json, json_to_ast
+from rule_engine.parser import Lexer, Parser, Node, AND, OR
+
+###############################################################################
+#                                                                             #
+#  BASELINE                                                                   #
+#                                                                             #
+###############################################################################
+
+class RecursiveParser(Parser):
+    """ The parser before the explicit stack: `expr` and `term` recurse on every parenthesis """
+    def expr(self):
+        node = self.term()
+        while self.current_token.type in (AND, OR):
+            op = self.current_token
+            self.eat(op.type)
+            node = Node(type="operator", left=node, op=op.value, right=self.term())
+        return node
+
+
+def recursive_ast_to_json(root: Node) -> str:
+    return json.dumps(root, default=Node.to_dict)
+
+
+def recursive_convert(data: dict) -> Node:
+    node = Node(type=data['type'], op=data['op'], attrType=data['attrType'])
+    if data['type'] == 'operator':
+        node.left = recursive_convert(data.get('left'))
+        node.right = recursive_convert(data.get('right'))
+    else:
+        node.left = data['left']
+        node.right = data['right']
+    return node
+
+
+def recursive_json_to_ast(rule_json: str) -> Node:
+    return recursive_convert(json.loads(rule_json))
+
+###############################################################################
+#                                                                             #
+#  BENCHMARK                                                                  #
+#                                                                             #
+###############################################################################
+
+def chain_rule(count: int) -> str:
+    return " AND ".join("attr_{} > {}".format(i % 50, i) for i in range(count))
+
+
+def nested_rule(count: int) -> str:
+    return "".join("(attr_{} > {} OR ".format(i % 50, i) for i in range(count - 1)) + "attr_0 < 0" + ")" * (count - 1)
+
+
+SHAPES = {'chain': chain_rule, 'nested': nested_rule}
+
+
+def best_of(repeat, func, *args):
+    """
+    (best seconds, result), or (None, None) when `func` hits the recursion limit.
+    The garbage collector is paused while timing, like `timeit` does: its passes
+    over the growing number of live objects would otherwise blur the scaling.
+    """
+    best, result = float('inf'), None
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                result = func(*args)
+            except RecursionError:
+                return None, None
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return best, result
+
+
+def run(sizes: list[int] = (1000, 10000, 100000), repeat: int = 3) -> dict:
+    """
+    Time parsing, encoding to JSON and decoding from JSON rules of each shape
+    and size, with the current and the recursive implementations, best of `repeat`.
+
+    Returns:
+        dict of "shape/size" -> stage -> {"current", "recursive"}: microseconds
+        per comparision, None where the recursive implementation hit the recursion limit.
+    """
+    results = {}
+    for shape, make in SHAPES.items():
+        for size in sizes:
+            rule = make(size)
+            parse_sec, root = best_of(repeat, lambda: Parser(Lexer(rule)).expr())
+            encode_sec, rule_json = best_of(repeat, ast_to_json, root)
+            decode_sec, _ = best_of(repeat, json_to_ast, rule_json)
+            old_parse, _ = best_of(repeat, lambda: RecursiveParser(Lexer(rule)).expr())
+            old_encode, _ = best_of(repeat, recursive_ast_to_json, root)
+            old_decode, _ = best_of(repeat, recursive_json_to_ast, rule_json)
+
+            per = lambda seconds: seconds * 1e6 / size if seconds is not None else None
+            results['{}/{}'.format(shape, size)] = {
+                'parse': {'current': per(parse_sec), 'recursive': per(old_parse)},
+                'to_json': {'current': per(encode_sec), 'recursive': per(old_encode)},
+                'from_json': {'current': per(decode_sec), 'recursive': per(old_decode)},
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Large rule parsing and serialization benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="comparisions per rule")
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions, best one is kept")
+    args = parser.parse_args()
+
+    print("recursion limit {}, microseconds per comparision (current / recursive)".format(sys.getrecursionlimit()))
+    fmt = lambda value: "{:8.2f}".format(value) if value is not None else "  RecErr"
+    for label, stages in run(args.sizes, args.repeat).items():
+        print("{:<14}".format(label) + "".join(
+            "  {} {} / {}".format(stage, fmt(times['current']), fmt(times['recursive'])) for stage, times in stages.items()))
@@ -0,0 +1,134 @@
+"""
+Lexer and parser throughput, against the previous per-token regex lexer
+
+Usage: python -m benchmarks.lexer [--rules N] [--repeat N]
+"""
+
+import argparse
+import re
+import time
+
+from rule_engine.parser import Lexer, Parser, EOF
+
+###############################################################################
+#                                                                             #
+#  BASELINE                                                                   #
+#                                                                             #
+###############################################################################
+
+def legacy_tokenize(rule: str) -> list[str]:
+    token_pattern = re.compile(r'\s*(-?\d+.\d+?|<=|>=|!=|==|&&|\|\||[()><=]|[\w]+|[^ \t\n\r\f\v\w])\s*')
+    return [token for token in token_pattern.findall(rule) if token.strip()]
+
+
+class LegacyToken(object):
+    def __init__(self, type, value):
+        self.type = type
+        self.value = value
+        self.pos = None
+
+
+class LegacyLexer(object):
+    """ The lexer before the master regex: tokenize, then up to three re.match per token """
+    def __init__(self, text):
+        self.tokens = legacy_tokenize(text)
+        self.pos = -1
+
+    def get_next_token(self):
+        self.pos += 1
+        if self.pos < len(self.tokens):
+            val = self.tokens[self.pos]
+            if val in ('AND', '&&'):
+                return LegacyToken('AND', 'AND')
+            if val in ('OR', '||'):
+                return LegacyToken('OR', 'OR')
+            if val in ('>', '<', '>=', '<=', '=', '!='):
+                return LegacyToken('COMPARISION', val)
+            if val == '(':
+                return LegacyToken('LPAREN', '(')
+            if val == ')':
+                return LegacyToken('RPAREN', ')')
+            if re.match(r'^-?\d+(\.\d+)?$', val):
+                return LegacyToken('NUMBER', val)
+            if val == "'":
+                if self.pos + 2 < len(self.tokens) and self.tokens[self.pos + 2] == "'":
+                    token = LegacyToken('STRING', self.tokens[self.pos + 1])
+                    self.pos += 2
+                    return token
+            if re.match(r'^[\w]+$', val):
+                return LegacyToken('STRING', val)
+            raise ValueError(val)
+        return LegacyToken(EOF, None)
+
+###############################################################################
+#                                                                             #
+#  BENCHMARK                                                                  #
+#                                                                             #
+###############################################################################
+
+def sample_rules(count: int) -> list[str]:
+    """ Rules of growing size with numeric and quoted string comparisions """
+    rules = []
+    for i in range(count):
+        terms = ["(age > {} AND department = 'Sales{}')".format(i % 60, i % 7),
+                 "(salary >= {}.5 || experience < {})".format(1000 * i, i % 20)]
+        rules.append(" OR ".join(terms * (1 + i % 4)))
+    return rules
+
+
+def drain(lexer_class, rules):
+    count = 0
+    for rule in rules:
+        lexer = lexer_class(rule)
+        while lexer.get_next_token().type != EOF:
+            count += 1
+    return count
+
+
+def parse(lexer_class, rules):
+    for rule in rules:
+        Parser(lexer_class(rule)).expr()
+    return len(rules)
+
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def run(rules: int = 2000, repeat: int = 5) -> dict:
+    """
+    Time lexing, and lexing + parsing, `rules` synthetic rules with both lexers, best of `repeat`.
+
+    Returns:
+        dict with the throughput of each lexer and the speedups.
+    """
+    corpus = sample_rules(rules)
+    results = {}
+    for name, lexer_class in (('legacy', LegacyLexer), ('master_regex', Lexer)):
+        lex_seconds, tokens = best_of(repeat, drain, lexer_class, corpus)
+        parse_seconds, parsed = best_of(repeat, parse, lexer_class, corpus)
+        results[name] = {
+            'tokens_per_sec': tokens / lex_seconds,
+            'rules_per_sec': parsed / parse_seconds,
+        }
+    results['lex_speedup'] = results['master_regex']['tokens_per_sec'] / results['legacy']['tokens_per_sec']
+    results['parse_speedup'] = results['master_regex']['rules_per_sec'] / results['legacy']['rules_per_sec']
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lexer throughput benchmark")
+    parser.add_argument("--rules", type=int, default=2000, help="number of synthetic rules")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions, best one is kept")
+    args = parser.parse_args()
+
+    results = run(args.rules, args.repeat)
+    for name in ('legacy', 'master_regex'):
+        print("{:<14} {:>12,.0f} tokens/sec {:>10,.0f} rules/sec parsed".format(
+            name, results[name]['tokens_per_sec'], results[name]['rules_per_sec']))
+    print("speedup        {:>12.2f}x lexing {:>8.2f}x parsing".format(results['lex_speedup'], results['parse_speedup']))
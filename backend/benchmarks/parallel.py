@@ -0,0 +1,70 @@
+"""
+Scaling of parallel bulk evaluation with the number of worker processes
+
+Usage: python -m benchmarks.parallel [--records N] [--chunk-size N] [--workers 1 2 4 ...]
+"""
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.synthetic import make_rule, make_records
+from rule_engine.abstract_tree import AST
+from rule_engine.parallel import ParallelEvaluator, result_line
+
+
+def run(records: int = 200000, chunk_size: int = 2000, workers: list[int] = None, depth: int = 3, width: int = 3) -> dict:
+    """
+    Time serial compiled evaluation, then the process pool at each worker
+    count, on records (`evaluate`) and on NDJSON lines (`evaluate_ndjson`,
+    against parsing, evaluating and formatting serially).
+    Pool start-up is left out, the pool is warmed up before timing.
+
+    Returns:
+        dict of label -> records/sec and speedup over serial evaluation.
+    """
+    workers = workers or sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1})
+    ast = AST()
+    ast.create_rule(make_rule(depth, width))
+    data = make_records(records)
+    lines = [json.dumps(record) for record in data]
+
+    start = time.perf_counter()
+    ast.evaluate_many(data)
+    serial = time.perf_counter() - start
+    results = {'serial': {'records_per_sec': records / serial, 'speedup': 1.0}}
+
+    compiled = ast.compile()
+    start = time.perf_counter()
+    "".join(result_line(res) for res in compiled.evaluate_many(json.loads(line) for line in lines))
+    serial_ndjson = time.perf_counter() - start
+    results['ndjson serial'] = {'records_per_sec': records / serial_ndjson, 'speedup': 1.0}
+
+    for count in workers:
+        with ParallelEvaluator(ast.root, workers=count, chunk_size=chunk_size) as evaluator:
+            list(evaluator.evaluate(data[:chunk_size * count]))
+            start = time.perf_counter()
+            for _ in evaluator.evaluate(data):
+                pass
+            seconds = time.perf_counter() - start
+            results['workers={}'.format(count)] = {'records_per_sec': records / seconds, 'speedup': serial / seconds}
+
+            start = time.perf_counter()
+            for _ in evaluator.evaluate_ndjson(lines):
+                pass
+            seconds = time.perf_counter() - start
+            results['ndjson workers={}'.format(count)] = {'records_per_sec': records / seconds, 'speedup': serial_ndjson / seconds}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel bulk evaluation benchmark")
+    parser.add_argument("--records", type=int, default=200000, help="number of synthetic records")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="records per chunk")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="worker counts to time")
+    args = parser.parse_args()
+
+    print("{} CPUs".format(os.cpu_count()))
+    for label, result in run(args.records, args.chunk_size, args.workers).items():
+        print("{:<20} {:>12,.0f} records/sec {:>6.2f}x".format(label, result['records_per_sec'], result['speedup']))
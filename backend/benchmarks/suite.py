@@ -0,0 +1,205 @@
+"""
+Benchmark suite for the parse, serialize, load and evaluate hot paths
+
+Every case times one pass over a synthetic workload and reports the best
+and mean time of a pass over `repeat` runs. Results are written as JSON, and
+a previous results file can be compared against to spot regressions.
+"""
+
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+
+from benchmarks.synthetic import make_rules, make_records
+from rule_engine.abstract_tree import AST, ast_to_json, json_to_ast
+from rule_engine.adaptive import AdaptiveRule
+from rule_engine.parser import Lexer, Parser, tokenize, EOF
+
+# slowdown, as a fraction of the baseline time, reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def measure(func, items: int, repeat: int = 5, number: int = None) -> dict:
+    """
+    Time `func`, one pass over `items` work items, run `number` times per
+    timing (by default as many as fit in 0.2 seconds).
+
+    Returns:
+        dict with the best and mean seconds per pass, and items/sec of the best pass.
+    """
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    timings = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    best = min(timings)
+    return {
+        'best_sec': best,
+        'mean_sec': sum(timings) / len(timings),
+        'items': items,
+        'items_per_sec': items / best if best else None,
+        'passes': number * repeat,
+    }
+
+
+def drain_lexer(rule):
+    lexer = Lexer(rule)
+    while lexer.get_next_token().type != EOF:
+        pass
+
+
+def core_cases(rules: list[str], records: list[dict]) -> dict:
+    """ Cases exercising the library directly, name -> (func, items) """
+    ast = AST()
+    nodes = [ast.create_rule(rule) for rule in rules]
+    rule_jsons = [ast_to_json(node) for node in nodes]
+    root = nodes[0]
+    compiled = AST(root).compile()
+    adaptive = AdaptiveRule(root)
+
+    return {
+        'tokenize': (lambda: [tokenize(rule) for rule in rules], len(rules)),
+        'lexer': (lambda: [drain_lexer(rule) for rule in rules], len(rules)),
+        'parser': (lambda: [Parser(Lexer(rule)).expr() for rule in rules], len(rules)),
+        'ast_to_json': (lambda: [ast_to_json(node) for node in nodes], len(nodes)),
+        'json_to_ast': (lambda: [json_to_ast(rule_json) for rule_json in rule_jsons], len(rule_jsons)),
+        'node_evaluate': (lambda: [root.evaluate(data) for data in records], len(records)),
+        'compiled_evaluate': (lambda: compiled.evaluate_many(records), len(records)),
+        'adaptive_evaluate': (lambda: adaptive.evaluate_many(records), len(records)),
+        'strict_evaluate': (lambda: compiled.evaluate_many(records, strict=True), len(records)),
+        'combine_rules': (lambda: ast.combine_rules(rules, "AND"), len(rules)),
+    }
+
+
+def api_cases(client, rules: list[str], records: list[dict]) -> dict:
+    """ Cases going through the FastAPI endpoints, name -> (func, items) """
+    names = itertools.count()
+    for i, rule in enumerate(rules):
+        client.post("/create_rule", json={"name": f"bench_{i}", "rule": rule}).raise_for_status()
+
+    def create_rule():
+        client.post("/create_rule", json={"name": f"bench_new_{next(names)}", "rule": rules[0]}).raise_for_status()
+
+    def evaluate_rule():
+        for data in records[:100]:
+            client.post("/evaluate_rule", json={"rule_name": "bench_0", "data": data}).raise_for_status()
+
+    return {
+        'api_create_rule': (create_rule, 1),
+        'api_get_rule': (lambda: client.get("/get_rule", params={"rule_name": "bench_0"}).raise_for_status(), 1),
+        'api_evaluate_rule': (evaluate_rule, len(records[:100])),
+        'api_evaluate_rule_batch': (
+            lambda: client.post("/evaluate_rule_batch", json={"rule_name": "bench_0", "data": records}).raise_for_status(),
+            len(records)),
+        'api_combine_rules': (
+            lambda: client.post("/combine_rules", json={"rules": rules, "operator": "AND"}).raise_for_status(),
+            len(rules)),
+    }
+
+
+def run_api(rules: list[str], records: list[dict], repeat: int, number: int = None) -> dict:
+    """
+    Time the endpoints through a TestClient on a throwaway SQLite database.
+
+    The database URL is read when `rule_engine.models` is first imported, so
+    the API cases are skipped if it was already imported against another database.
+    """
+    if 'rule_engine.models' in sys.modules:
+        url = str(sys.modules['rule_engine.models'].DATABASE_URL)
+        if not url.startswith('sqlite'):
+            print(f"Skipping API benchmarks, already connected to {url.split('://')[0]}")
+            return {}
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    from fastapi.testclient import TestClient
+    from rule_engine.main import app
+
+    results = {}
+    with TestClient(app) as client:
+        for name, (func, items) in api_cases(client, rules, records).items():
+            results[name] = measure(func, items, repeat, number)
+    return results
+
+
+def run(rules: int = 200, depth: int = 3, width: int = 3, records: int = 1000, repeat: int = 5,
+        number: int = None, api: bool = True) -> dict:
+    """
+    Run the suite on synthetic rules of the given depth and width.
+
+    Returns:
+        dict with the run parameters and environment under 'meta', and one entry per case under 'results'.
+    """
+    rule_list = make_rules(rules, depth, width)
+    record_list = make_records(records)
+
+    results = {}
+    for name, (func, items) in core_cases(rule_list, record_list).items():
+        results[name] = measure(func, items, repeat, number)
+    if api:
+        results.update(run_api(rule_list, record_list, repeat, number))
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {'rules': rules, 'depth': depth, 'width': width, 'records': records, 'repeat': repeat},
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD) -> list[dict]:
+    """
+    Compare the best pass time of every case present in both runs.
+
+    Returns:
+        One entry per case with the time ratio current / baseline, flagged
+        as a regression when it's slower by more than `threshold`. The ratio
+        is None when the baseline time is 0 (below the timer resolution).
+    """
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        base_sec = baseline['results'][name]['best_sec']
+        ratio = result['best_sec'] / base_sec if base_sec > 0 else None
+        rows.append({'case': name, 'ratio': ratio, 'regression': ratio is not None and ratio > 1 + threshold})
+    return rows
+
+
+def report(results: dict, comparison: list[dict] = None) -> str:
+    lines = ["{:<26} {:>12} {:>16}".format("case", "best (ms)", "items/sec")]
+    for name, result in results['results'].items():
+        lines.append("{:<26} {:>12.3f} {:>16,.0f}".format(name, result['best_sec'] * 1000, result['items_per_sec'] or 0))
+    if comparison:
+        lines.append("{:<26} {:>12}".format("vs baseline", "time ratio"))
+    for row in comparison or []:
+        ratio = "{:>11.2f}x".format(row['ratio']) if row['ratio'] is not None else "{:>12}".format("n/a")
+        lines.append("{:<26} {} {}".format(row['case'], ratio, "REGRESSION" if row['regression'] else ""))
+    return "\n".join(lines)
+
+
+def main(output: str, baseline: str = None, **params) -> int:
+    """
+    Run the suite, write the results to `output` and print them.
+
+    Returns:
+        1 if a regression against `baseline` was found, else 0.
+    """
+    results = run(**params)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    comparison = None
+    if baseline:
+        with open(baseline) as f:
+            comparison = compare(json.load(f), results)
+    print(report(results, comparison))
+    print(f"Results written to {output}")
+    return int(any(row['regression'] for row in comparison or []))
@@ -0,0 +1,65 @@
+"""
+Synthetic rules and records for benchmarks
+
+Rules only use the attributes of ATTRIBUTES, with a fixed type each, so that
+any number of generated rules can share the global catalog.
+"""
+
+import random
+
+# attribute -> (type, values used for constants and records)
+ATTRIBUTES = {
+    'age': ('NUMBER', range(18, 70)),
+    'salary': ('NUMBER', range(20000, 200000, 5000)),
+    'experience': ('NUMBER', range(0, 40)),
+    'score': ('NUMBER', range(0, 100)),
+    'department': ('STRING', ('Sales', 'Marketing', 'HR', 'Engineering', 'Finance')),
+    'region': ('STRING', ('North', 'South', 'East', 'West')),
+    'level': ('STRING', ('Junior', 'Mid', 'Senior', 'Lead')),
+}
+
+NUMBER_OPS = ('>', '>=', '<', '<=', '=', '!=')
+STRING_OPS = ('=', '!=')
+
+
+def make_comparision(rng: random.Random) -> str:
+    attr = rng.choice(list(ATTRIBUTES))
+    attr_type, values = ATTRIBUTES[attr]
+    if attr_type == 'NUMBER':
+        return "{} {} {}".format(attr, rng.choice(NUMBER_OPS), rng.choice(values))
+    return "{} {} '{}'".format(attr, rng.choice(STRING_OPS), rng.choice(values))
+
+
+def make_rule(depth: int, width: int, rng: random.Random = None) -> str:
+    """
+    Generate a rule string.
+
+    Args:
+        depth: levels of parenthesised sub-expressions, 0 gives a single comparision.
+        width: number of terms joined by AND/OR at every level.
+        rng: random source, seeded for reproducible rules.
+
+    Returns:
+        The rule, with width ** depth comparisions.
+    """
+    rng = rng or random.Random(0)
+    if depth <= 0:
+        return make_comparision(rng)
+    terms = []
+    for i in range(width):
+        term = make_rule(depth - 1, width, rng)
+        terms.append("(" + term + ")" if depth > 1 else term)
+        if i < width - 1:
+            terms.append(rng.choice(("AND", "OR")))
+    return " ".join(terms)
+
+
+def make_rules(count: int, depth: int, width: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [make_rule(depth, width, rng) for _ in range(count)]
+
+
+def make_records(count: int, seed: int = 0) -> list[dict]:
+    """ Records holding every attribute, with values drawn from ATTRIBUTES """
+    rng = random.Random(seed)
+    return [{attr: rng.choice(values) for attr, (_, values) in ATTRIBUTES.items()} for _ in range(count)]
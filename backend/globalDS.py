@@ -1,3 +1,5 @@
 """ Contain global variables and data containers """
+from rule_engine.catalog import Catalog
+
 global catalog
-catalog = {}
+catalog = Catalog()
@@ -4,6 +4,7 @@ Main script for managing backend, tests, and database.
 
 import argparse
 import subprocess
+import sys
 import uvicorn
 
 def run_pytest():
@@ -29,6 +30,124 @@ def _run_server(host="0.0.0.0", port=5000):
     print(f"Starting FastAPI server at {host}:{port}")
     uvicorn.run('rule_engine.main:app', host=host, port=port, reload=True)
 
+def run_migrations():
+    """
+    Bring the database schema up to date, backfill the binary AST and content
+    hash of stored rules and the catalog of the attributes they use.
+    """
+    from globalDS import catalog
+    from rule_engine import models, database
+
+    with models.engine.begin() as conn:
+        models.migrate_schema(conn)
+
+    db = models.SessionLocal()
+    try:
+        updated = database.backfill_rule_bin(db)
+        hashed = database.backfill_rule_hash(db)
+        attributes = database.backfill_catalog(db, catalog)
+    finally:
+        db.close()
+    print(f"Migration done, {updated} rule(s) updated, {hashed} rule(s) hashed, {attributes} attribute(s) in the catalog.")
+
+def run_bulk_evaluation(args):
+    """
+    Evaluate a stored rule over NDJSON records on a process pool.
+    Writes one NDJSON line per record, in input order: {"result": ...} or {"error": ...}.
+    """
+    from globalDS import catalog
+    from rule_engine import models, database
+    from rule_engine.parallel import ParallelEvaluator
+
+    db = models.SessionLocal()
+    try:
+        database.sync_catalog(db, catalog)
+        rule = database.get_rule(db, rule_name=args.evaluate_bulk)
+        node = database.load_resolved_ast(db, rule) if rule is not None else None
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    if rule is None:
+        print(f"Rule not found: {args.evaluate_bulk}", file=sys.stderr)
+        return 1
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    target = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        with ParallelEvaluator(node, workers=args.workers, chunk_size=args.chunk_size) as evaluator:
+            for lines in evaluator.evaluate_ndjson(source):
+                target.write(lines)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    return 0
+
+def run_import(args):
+    """
+    Create the rules of an NDJSON file, one {"name": ..., "rule": ...} object per line,
+    in one transaction. Prints every rule that wasn't imported.
+    """
+    from globalDS import catalog
+    from rule_engine import models, database, bulk
+
+    source = sys.stdin if args.import_rules == '-' else open(args.import_rules)
+    db = models.SessionLocal()
+    try:
+        database.sync_catalog(db, catalog)
+        results = bulk.parse_rules(source, workers=args.workers)
+        database.sync_catalog(db, catalog)
+        parsed = [res for res in results if isinstance(res, bulk.ParsedRule)]
+        failed = [res for res in results if isinstance(res, bulk.FailedRule)]
+        created, updated, rejected = database.import_rules(db, rules=parsed, upsert=args.upsert)
+    finally:
+        db.close()
+        if source is not sys.stdin:
+            source.close()
+
+    failed.extend(bulk.FailedRule(rule.line, rule.name, reason) for rule, reason in rejected)
+    for res in sorted(failed, key=lambda res: res.line):
+        print(f"Line {res.line} ({res.name}): {res.error}", file=sys.stderr)
+    print(f"Import done, {len(created)} rule(s) created, {len(updated)} updated, {len(failed)} failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+def run_export(args):
+    """
+    Write every stored rule as NDJSON, in the format --import-rules reads.
+    """
+    from rule_engine import models, database, bulk
+
+    target = sys.stdout if args.export_rules == '-' else open(args.export_rules, 'w')
+    db = models.SessionLocal()
+    try:
+        for lines in bulk.export_ndjson(database.iter_rules(db)):
+            target.write(lines)
+    finally:
+        db.close()
+        if target is not sys.stdout:
+            target.close()
+    return 0
+
+def run_benchmarks(args):
+    """
+    Run the benchmark suite and write its results as JSON.
+    Returns 1 if a regression against the --bench-compare baseline was found.
+    """
+    from benchmarks import suite
+
+    print("Running benchmarks...")
+    return suite.main(
+        output=args.bench_output,
+        baseline=args.bench_compare,
+        rules=args.bench_rules,
+        depth=args.bench_depth,
+        width=args.bench_width,
+        records=args.bench_records,
+    )
+
 def parse_arguments():
     """
     Parse command-line arguments for script execution.
@@ -48,6 +167,102 @@ def parse_arguments():
         action='store_true', 
         help='Run the FastAPI development server'
     )
+    parser.add_argument(
+        '--migrate', 
+        action='store_true', 
+        help='Migrate the database schema and backfill stored rules'
+    )
+    parser.add_argument(
+        '--evaluate-bulk', 
+        type=str, 
+        metavar='RULE_NAME', 
+        default=None, 
+        help='Evaluate a stored rule over NDJSON records on a process pool'
+    )
+    parser.add_argument(
+        '--input', 
+        type=str, 
+        default='-', 
+        help='NDJSON records for --evaluate-bulk, one object per line (default: stdin)'
+    )
+    parser.add_argument(
+        '--output', 
+        type=str, 
+        default='-', 
+        help='NDJSON results of --evaluate-bulk (default: stdout)'
+    )
+    parser.add_argument(
+        '--workers', 
+        type=int, 
+        default=None, 
+        help='Worker processes for --evaluate-bulk and --import-rules (default: number of CPUs)'
+    )
+    parser.add_argument(
+        '--chunk-size', 
+        type=int, 
+        default=1000, 
+        help='Records sent to a worker at a time by --evaluate-bulk (default: 1000)'
+    )
+    parser.add_argument(
+        '--import-rules', 
+        type=str, 
+        metavar='PATH', 
+        default=None, 
+        help="Create the rules of an NDJSON file, one {\"name\": ..., \"rule\": ...} object per line ('-' for stdin)"
+    )
+    parser.add_argument(
+        '--upsert', 
+        action='store_true', 
+        help='Replace existing rules on --import-rules, instead of reporting them as errors'
+    )
+    parser.add_argument(
+        '--export-rules', 
+        type=str, 
+        metavar='PATH', 
+        default=None, 
+        help="Write every stored rule as NDJSON ('-' for stdout)"
+    )
+    parser.add_argument(
+        '--bench', 
+        action='store_true', 
+        help='Run the benchmark suite'
+    )
+    parser.add_argument(
+        '--bench-output', 
+        type=str, 
+        default="benchmark_results.json", 
+        help='File to write the benchmark results to (default: benchmark_results.json)'
+    )
+    parser.add_argument(
+        '--bench-compare', 
+        type=str, 
+        default=None, 
+        help='Previous benchmark results to compare against'
+    )
+    parser.add_argument(
+        '--bench-rules', 
+        type=int, 
+        default=200, 
+        help='Number of synthetic rules (default: 200)'
+    )
+    parser.add_argument(
+        '--bench-depth', 
+        type=int, 
+        default=3, 
+        help='Nesting depth of the synthetic rules (default: 3)'
+    )
+    parser.add_argument(
+        '--bench-width', 
+        type=int, 
+        default=3, 
+        help='Terms per nesting level of the synthetic rules (default: 3)'
+    )
+    parser.add_argument(
+        '--bench-records', 
+        type=int, 
+        default=1000, 
+        help='Number of synthetic records (default: 1000)'
+    )
     parser.add_argument(
         '--host', 
         type=str, 
@@ -76,6 +291,19 @@ def main():
             print("Some tests failed.")
     elif args.dev:
         _run_server(host=args.host, port=args.port)
+    elif args.migrate:
+        run_migrations()
+    elif args.evaluate_bulk:
+        sys.exit(run_bulk_evaluation(args))
+    elif args.import_rules:
+        sys.exit(run_import(args))
+    elif args.export_rules:
+        sys.exit(run_export(args))
+    elif args.bench:
+        returncode = run_benchmarks(args)
+        if returncode != 0:
+            print("Performance regressions found.")
+        sys.exit(returncode)
     else:
         print("Invalid command. Use '--help' for usage information.")
 
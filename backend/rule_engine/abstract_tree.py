@@ -1,46 +1,142 @@
 import json
-from rule_engine.parser import Lexer, Parser, Node 
+from rule_engine.parser import Node, STRING, parse
+from rule_engine.compiler import CompiledRule
+from rule_engine.flat import FlatAST
+from rule_engine import optimizer, iterjson
 from globalDS import catalog # True: integer type, False: string type
 
+# encodes like json.dumps(node, default=Node.to_dict)
+_ENCODER = json.JSONEncoder(default=Node.to_dict)
+
 def ast_to_json(ast: Node) -> str:
     """
     Convert AST root to JSON
+
+    Rules nested deeper than `json.dumps` can recurse (long chains are) are
+    encoded again with an explicit stack, one object per node, in linear time.
     """
     if ast is None:
         return ""
-    return json.dumps(ast, default=lambda o: o.__dict__)
+    encode = _ENCODER.encode
+    try:
+        return encode(ast)
+    except RecursionError:
+        pass
+    prefixes = {}   # (op, attrType) -> JSON of an operator node up to its left operand
+    parts = []
+    stack = [ast]   # nodes, and literal JSON to emit
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        elif item is None:
+            parts.append("null")
+        elif item.type == "operator":
+            key = (item.op, item.attrType)
+            prefix = prefixes.get(key)
+            if prefix is None:
+                prefix = prefixes[key] = '{{"type": "operator", "op": {}, "attrType": {}, "left": '.format(
+                    encode(item.op), encode(item.attrType))
+            parts.append(prefix)
+            stack.extend(("}", item.right, ', "right": ', item.left))
+        else:
+            parts.append(encode(item))
+    return "".join(parts)
+
+def _to_node(data: dict) -> Node:
+    """ Node of a decoded JSON object, its operands already converted """
+    return Node(data['type'], data['left'], data['op'], data['right'], data['attrType'])
 
 def json_to_ast(rule_json: str) -> Node:
     """
     Conver JSON to AST (root Node)
+
+    Nodes are built while decoding. JSON nested too deeply for `json.loads`
+    is decoded again without recursion (see `rule_engine.iterjson`).
     """
-    data = json.loads(rule_json)
-    return convert_to_node(data)
+    try:
+        return json.loads(rule_json, object_hook=_to_node)
+    except RecursionError:
+        return iterjson.loads(rule_json, object_hook=_to_node)
 
 def convert_to_node(data: dict) -> Node:
     """
     Convert dictionary to AST Node
     """
+    root = Node(type= data['type'], op= data['op'], attrType=data['attrType'])
+    stack = [(data, root)]
+    while stack:
+        data, node = stack.pop()
+        if(data['type']== 'operator'):
+            left, right = data.get('left'), data.get('right')
+            node.left = Node(type= left['type'], op= left['op'], attrType=left['attrType'])
+            node.right = Node(type= right['type'], op= right['op'], attrType=right['attrType'])
+            stack.append((right, node.right))
+            stack.append((left, node.left))
+        else:
+            node.left = data['left']
+            node.right = data['right']
+
+    return root
 
-    node = Node(type= data['type'], op= data['op'], attrType=data['attrType']) 
-    if(data['type']== 'operator'):
-        node.left = convert_to_node(data.get('left'))
-        node.right = convert_to_node(data.get('right'))
-    else:
-        node.left = data['left']
-        node.right = data['right']
 
-    return node
+def ast_to_rule(ast: Node) -> str:
+    """
+    Convert AST root back to a rule string, which parses to the same AST.
+
+    Raises:
+        ValueError: if the AST holds nodes of an unknown type.
+    """
+    if ast is None:
+        return ""
+    parts = []
+    stack = [ast]   # nodes, and literal text to emit
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        elif item.type == "comparision":
+            value = "'{}'".format(item.right) if item.attrType == STRING else item.right
+            parts.append("{} {} {}".format(item.left, item.op, value))
+        elif item.type == "reference":
+            parts.append("@" + item.left)
+        elif item.type == "operator":
+            # operators group to the left: only a right operand needs parentheses,
+            # a left one gets them for readability when its operator differs
+            if item.right.type == "operator":
+                stack.extend((")", item.right, "("))
+            else:
+                stack.append(item.right)
+            stack.append(" {} ".format(item.op))
+            if item.left.type == "operator" and item.left.op != item.op:
+                stack.extend((")", item.left, "("))
+            else:
+                stack.append(item.left)
+        else:
+            raise ValueError("Cannot convert a node of type {} to a rule".format(item.type))
+    return "".join(parts)
 
 
 class AST(object):
-    def __init__(self, root=None):
+    def __init__(self, root=None, memo=None):
+        """
+        Args:
+            memo: ParseMemo to take parsed rules from (see `rule_engine.memo`), the
+                ASTs it returns are shared and must not be modified.
+        """
         self.root = root
+        self.memo = memo
+
+    def parse(self, rule: str) -> Node:
+        """
+        Root of the AST of a rule string, from the memo when there is one.
+        """
+        if self.memo is not None:
+            return self.memo.parse(rule)
+        return parse(rule)
 
     def create_rule(self, rule: str):
-        lexer = Lexer(rule)
-        parser = Parser(lexer)
-        self.root = parser.expr()
+        self.root = self.parse(rule)
         return self.root
     
     def evaluate_rule(self, data):
@@ -48,33 +144,66 @@ class AST(object):
             return True
         return self.root.evaluate(data)
 
+    def compile(self) -> CompiledRule:
+        """
+        Compile the current AST into a flat callable with the same results as `evaluate_rule`.
+        """
+        return CompiledRule(self.root)
+
+    def optimize(self) -> Node:
+        """
+        Simplify the current AST in place, see `rule_engine.optimizer`.
+        """
+        self.root = optimizer.optimize(self.root)
+        return self.root
+
+    def flatten(self) -> FlatAST:
+        """
+        Array-backed copy of the current AST, evaluated without recursion.
+        """
+        return FlatAST.from_node(self.root)
 
-    def combine_rules(self, rules: list[str], operator: str):
+    def evaluate_many(self, records) -> list:
+        """
+        Compile the rule once and evaluate it against every record.
+
+        Returns:
+            List with one entry per record: the evaluation result, or the
+            exception raised while evaluating that record.
+        """
+        return self.compile().evaluate_many(records)
+
+    def combine_rules(self, rules: list[str], operator: str, optimize: bool = False):
         """
         Combines multiple rules into a single AST with the specified operator ('AND' or 'OR').
         
         Args:
             rules: List of rule strings to be combined.
             operator: The operator to combine the rules ('AND' or 'OR').
+            optimize: Simplify the combined AST (see `rule_engine.optimizer`).
         
         Returns:
             The root of the combined AST.
         """
         if not rules:
             raise ValueError("The rule list cannot be empty")
-        # TODO: add functionality to specify rule name too 
-        # Parse the first rule
-        lexer = Lexer(rules[0])
-        parser = Parser(lexer)
-        combined_ast = parser.expr()
-        
-        # Parse and combine each remaining rule with the operator
-        for rule in rules[1:]:
-            lexer = Lexer(rule)
-            parser = Parser(lexer)
-            next_ast = parser.expr()
-            
+        return self.combine([self.parse(rule) for rule in rules], operator, optimize=optimize)
+
+    def combine(self, nodes: list[Node], operator: str, optimize: bool = False) -> Node:
+        """
+        Combines parsed ASTs, e.g. those of stored rules, with the specified operator ('AND' or 'OR').
+        The ASTs are used as they are, not copied.
+
+        Returns:
+            The root of the combined AST.
+        """
+        if not nodes:
+            raise ValueError("The rule list cannot be empty")
+        combined_ast = nodes[0]
+        for next_ast in nodes[1:]:
             # Combine the two ASTs with the specified operator
             combined_ast = Node(type="operator", left=combined_ast, op=operator, right=next_ast)
+        if optimize:
+            return optimizer.optimize(combined_ast)
         return combined_ast
 
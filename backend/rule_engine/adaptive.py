@@ -0,0 +1,348 @@
+"""
+Selectivity and cost adaptive ordering of AND/OR operands
+
+A compiled rule evaluates operands in the order the author wrote them. An
+AdaptiveRule samples some of the evaluations, timing every comparision and
+recording how often each operand passes. From time to time it reorders the
+operands of each AND/OR so that short-circuiting skips the most work: for
+an AND the operand most likely to fail for the least cost goes first, for
+an OR the one most likely to pass.
+
+Reordering can't change results: the reordered rule only evaluates records
+for which no reordered comparision can raise or yield None, every other
+record goes through the rule in its original order.
+"""
+
+import builtins
+import sys
+import time
+from threading import Lock
+
+from globalDS import catalog
+from rule_engine import metrics
+from rule_engine.parser import NUMBER, STRING, Node
+from rule_engine.compiler import CompiledRule, NUMERIC_OPS, COMMON_OPS, operands, compile_preloaded, _compile_comparision
+from rule_engine.optimizer import balanced
+
+# evaluations between two sampled ones
+DEFAULT_SAMPLE_EVERY = 128
+# samples between two reorderings, also the least an order is learned from
+DEFAULT_REORDER_EVERY = 128
+# fraction of the expected cost a new order has to save to replace the current one
+MIN_GAIN = 0.10
+
+_MISSING = object()
+_FLOAT_MAX = sys.float_info.max
+
+
+class _Element(object):
+    """ An operand of the rule: a comparision, or an AND/OR over its flattened operands
+
+    Attributes:
+        node: source node, the head of the chain for an operator
+        children: element ids of the operands, in evaluation order (None for leaves)
+        func: compiled comparision, for leaves the adaptive rule can sample
+        reorderable: nothing under it can raise or yield None on a valid record
+        samples, passes, total_ns: sampled evaluations, how many were truthy, time spent
+    """
+    __slots__ = ('node', 'children', 'func', 'reorderable', 'samples', 'passes', 'total_ns')
+
+    def __init__(self, node: Node, children: list = None):
+        self.node = node
+        self.children = children
+        self.func = None
+        self.reorderable = False
+        self.samples = 0
+        self.passes = 0
+        self.total_ns = 0
+
+    @property
+    def pass_rate(self) -> float:
+        return self.passes / self.samples if self.samples else None
+
+
+def _safe_leaf(node: Node) -> bool:
+    """ Whether a comparision always yields True or False on a record of the catalog types """
+    if node.type != "comparision":
+        return False
+    if catalog.get(node.left, node.attrType) == NUMBER:
+        if node.op not in NUMERIC_OPS and node.op not in COMMON_OPS:
+            return False
+        try:
+            float(node.right)
+        except (ValueError, builtins.TypeError):
+            return False
+        return True
+    return node.op in COMMON_OPS
+
+
+def describe(node: Node) -> str:
+    """ Rule text of a comparision node """
+    if node.attrType == STRING:
+        return "{} {} '{}'".format(node.left, node.op, node.right)
+    return "{} {} {}".format(node.left, node.op, node.right)
+
+
+def _rank(element: _Element, cost: float, op: str) -> float:
+    """ Expected cost to decide the operator per chance of deciding it, lower goes first """
+    p = element.pass_rate
+    decides = (1 - p) if op == "AND" else p
+    return cost / decides if decides > 0 else float('inf')
+
+
+class AdaptiveRule(CompiledRule):
+    """ A compiled rule that reorders its operands from runtime statistics
+
+    Attributes:
+        sample_every: evaluations between two sampled ones
+        reorder_every: samples between two reorderings
+        evaluations, sampled, reorders: counters
+    """
+    def __init__(self, node: Node, sample_every: int = DEFAULT_SAMPLE_EVERY,
+                 reorder_every: int = DEFAULT_REORDER_EVERY, segments: dict = None):
+        super().__init__(node, segments=segments)
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self.evaluations = 0
+        self.sampled = 0
+        self.reorders = 0
+        self._original = self.evaluate
+        self._current = self._original      # the original rule until the operands get reordered
+        self._since_reorder = 0
+        self._lock = Lock()
+        self._build(node)
+        self.evaluate = self._evaluate
+
+    def patch(self, node: Node) -> "AdaptiveRule":
+        """ See `CompiledRule.patch`, the statistics start over """
+        return AdaptiveRule(node, self.sample_every, self.reorder_every, segments=self.segments)
+
+    def _build(self, root: Node):
+        # elements in pre-order, so children always come after their parent
+        self._elements = []
+        stack = [(root, None)] if root is not None else []
+        while stack:
+            current, parent = stack.pop()
+            element_id = len(self._elements)
+            self._elements.append(_Element(current, [] if current.type == "operator" else None))
+            if parent is not None:
+                self._elements[parent].children.append(element_id)
+            if current.type == "operator":
+                stack.extend((child, element_id) for child in reversed(operands(current)))
+
+        safe = [False] * len(self._elements)
+        for i in reversed(range(len(self._elements))):
+            element = self._elements[i]
+            if element.children is None:
+                safe[i] = _safe_leaf(element.node)
+            else:
+                safe[i] = element.reorderable = all(safe[child] for child in element.children)
+
+        # everything under a reorderable operator gets sampled, children before parents
+        sampled, covered = set(), set()
+        for i, element in enumerate(self._elements):
+            if element.reorderable:
+                sampled.update(element.children)
+                covered.update(element.children)
+                sampled.add(i)
+        self._sampled_ids = sorted(sampled, reverse=True)
+        self._sampled_roots = sorted(sampled - covered)
+        for i in self._sampled_ids:
+            element = self._elements[i]
+            if element.children is None:
+                element.func = _compile_comparision(element.node)
+
+        # attributes a sampled or reordered record must hold
+        self._number_attrs = tuple(sorted({self._elements[i].node.left for i in sampled
+                                           if self._elements[i].children is None
+                                           and catalog.get(self._elements[i].node.left) == NUMBER}))
+        self._other_attrs = tuple(sorted({self._elements[i].node.left for i in sampled
+                                          if self._elements[i].children is None} - set(self._number_attrs)))
+
+    def _valid(self, data) -> bool:
+        """ Whether no reorderable comparision can raise or yield None on `data` """
+        if not isinstance(data, dict):
+            return False
+        for attr in self._number_attrs:
+            val = data.get(attr, _MISSING)
+            if val.__class__ is float:
+                continue
+            # ints beyond the float range raise OverflowError once converted
+            if not isinstance(val, (int, float)) or (isinstance(val, int) and not -_FLOAT_MAX <= val <= _FLOAT_MAX):
+                return False
+        for attr in self._other_attrs:
+            if attr not in data:
+                return False
+        return True
+
+    def _evaluate(self, data):
+        self.evaluations += 1
+        if self.evaluations % self.sample_every == 0 and self._sampled_ids and self._valid(data):
+            self._sample(data)
+        return self._current(data)
+
+    def evaluate_many(self, records, strict: bool = False) -> list:
+        """ See `CompiledRule.evaluate_many`, with the per-record bookkeeping of `evaluate` done once per sample """
+        if strict:
+            return super().evaluate_many(records, strict=True)
+        results = []
+        current = self._current
+        every = self.sample_every if self._sampled_ids else 0
+        count = self.evaluations
+        for count, data in enumerate(records, start=count + 1):
+            if every and not count % every and self._valid(data):
+                self._sample(data)
+                current = self._current
+            try:
+                results.append(current(data))
+            except Exception as e:
+                results.append(e)
+        self.evaluations = count
+        return results
+
+    def _sample(self, data):
+        """ Evaluate every sampled operand without short-circuiting, and record the outcome """
+        elements = self._elements
+        results = [None] * len(elements)
+        with self._lock:
+            # one clock read per comparision, the loop overhead is the same for all of them
+            last = time.perf_counter_ns()
+            for i in self._sampled_ids:
+                element = elements[i]
+                if element.children is None:
+                    res = element.func(data)
+                    now = time.perf_counter_ns()
+                    element.total_ns += now - last
+                    last = now
+                elif element.node.op == "AND":
+                    res = all(map(results.__getitem__, element.children))
+                else:
+                    res = any(map(results.__getitem__, element.children))
+                results[i] = res
+                element.samples += 1
+                element.passes += bool(res)
+            self.sampled += 1
+            self._since_reorder += 1
+            if metrics.enabled:
+                evaluated, skipped = self._short_circuited(results)
+                metrics.PREDICATES.inc("evaluated", amount=evaluated)
+                metrics.PREDICATES.inc("short_circuited", amount=skipped)
+            if self._since_reorder >= self.reorder_every:
+                self._reorder()
+
+    def _short_circuited(self, results: list) -> tuple:
+        """
+        (evaluated, skipped) comparisions of the sampled operands, had they been
+        evaluated in the current order with short-circuiting, from the results of `_sample`.
+        """
+        elements = self._elements
+        evaluated = skipped = 0
+        stack = [(i, True) for i in self._sampled_roots]
+        while stack:
+            i, reached = stack.pop()
+            element = elements[i]
+            if element.children is None:
+                if reached:
+                    evaluated += 1
+                else:
+                    skipped += 1
+                continue
+            # an AND is decided by a falsy operand, an OR by a truthy one
+            decides = element.node.op != "AND"
+            decided = not reached
+            for child in element.children:
+                stack.append((child, not decided))
+                if not decided and bool(results[child]) == decides:
+                    decided = True
+        return evaluated, skipped
+
+    def _reorder(self):
+        """ Sort the operands of every reorderable operator by rank, and recompile if the order changed """
+        elements = self._elements
+        costs = {}
+        changed = False
+        for i in self._sampled_ids:
+            element = elements[i]
+            if element.children is None:
+                costs[i] = element.total_ns / element.samples if element.samples else 0.0
+                continue
+            op = "AND" if element.node.op == "AND" else "OR"
+            costs[i] = self._expected_cost(element.children, costs, op)
+            if element.reorderable:
+                order = sorted(element.children, key=lambda child: _rank(elements[child], costs[child], op))
+                cost = self._expected_cost(order, costs, op)
+                # operands close in rank would otherwise swap back and forth with sampling noise
+                if order != element.children and cost < costs[i] * (1 - MIN_GAIN):
+                    element.children = order
+                    costs[i] = cost
+                    changed = True
+
+        # older samples weigh less and less, so the order follows the traffic
+        for i in self._sampled_ids:
+            element = elements[i]
+            element.samples //= 2
+            element.passes //= 2
+            element.total_ns //= 2
+        self._since_reorder = 0
+
+        if changed:
+            self.reorders += 1
+            # records the reordered rule can't evaluate safely keep going through the original one
+            self._current = compile_preloaded(self.ordered_ast(), self._number_attrs, self._other_attrs, self._original)
+
+    def _expected_cost(self, children: list, costs: dict, op: str) -> float:
+        """ Expected cost of an operator evaluating `children` in order, assuming independent operands """
+        cost, reach = 0.0, 1.0
+        for child in children:
+            cost += reach * costs[child]
+            p = self._elements[child].pass_rate
+            reach *= p if op == "AND" else 1 - p
+        return cost
+
+    def ordered_ast(self) -> Node:
+        """ The rule with its operands in the current evaluation order """
+        if not self._elements:
+            return None
+        built = {}
+        for i in reversed(range(len(self._elements))):
+            element = self._elements[i]
+            if element.children is None:
+                built[i] = element.node
+            else:
+                built[i] = balanced(element.node.op, [built.pop(child) for child in element.children])
+        return built[0]
+
+    def stats(self) -> dict:
+        """
+        Learned statistics of the rule.
+
+        Returns:
+            dict with the counters, and the sampled pass rate and cost of every
+            operator and comparision, operators listing their operands' ids in
+            evaluation order. Ids number the operands in the original order.
+        """
+        with self._lock:
+            operators, comparisions = [], []
+            for i in self._sampled_ids[::-1]:
+                element = self._elements[i]
+                entry = {"id": i, "samples": element.samples, "pass_rate": element.pass_rate}
+                if element.children is None:
+                    entry["predicate"] = describe(element.node)
+                    entry["cost_ns"] = element.total_ns / element.samples if element.samples else None
+                    comparisions.append(entry)
+                else:
+                    entry["op"] = element.node.op
+                    entry["reorderable"] = element.reorderable
+                    entry["order"] = list(element.children)
+                    operators.append(entry)
+            return {
+                "evaluations": self.evaluations,
+                "sampled": self.sampled,
+                "reorders": self.reorders,
+                "reordered": self._current is not self._original,
+                "operators": operators,
+                "comparisions": comparisions,
+            }
+
+    def __repr__(self):
+        return "AdaptiveRule({})".format(self.node)
@@ -0,0 +1,154 @@
+"""
+Bulk import and export of rules
+
+Imports are NDJSON, one {"name": ..., "rule": ...} object per line (an
+optional "optimize": true simplifies the AST first), the format exports are
+written in. Rules are parsed on a process pool when there are enough of them,
+then stored with batched multi-row statements in one transaction (see
+`database.import_rules`), every rule that fails is reported with its line.
+
+Workers parse against a snapshot of the parent's catalog, plus whatever the
+earlier lines of their own chunk registered. The attributes each rule uses
+are then registered in the parent in input order, so the first rule to use
+an attribute fixes its type exactly as when parsing one by one. Lines a
+worker rejected are parsed again in the parent at their place in that order:
+a worker can reject a rule over a type only an earlier line of its chunk
+registered, which the rule may not conflict with in input order.
+"""
+
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from globalDS import catalog
+from rule_engine import codec
+from rule_engine.abstract_tree import AST, ast_to_json, ast_to_rule, json_to_ast
+from rule_engine.memo import content_hash
+from rule_engine.optimizer import optimize
+from rule_engine.references import references
+
+# below this many rules, starting worker processes costs more than parsing
+PARALLEL_MIN_RULES = 256
+DEFAULT_CHUNK_SIZE = 200
+# lines of a streamed import parsed at a time
+DEFAULT_BATCH_SIZE = 4096
+
+
+class ParsedRule(namedtuple('ParsedRule', ['line', 'name', 'rule_str', 'rule_json', 'rule_bin', 'rule_hash', 'attrs'])):
+    """ A rule ready to store, `attrs` holds the type of every attribute it compares """
+    __slots__ = ()
+
+
+class FailedRule(namedtuple('FailedRule', ['line', 'name', 'error'])):
+    """ A rule that couldn't be imported, `line` is its 1-based line in the input """
+    __slots__ = ()
+
+    def to_dict(self) -> dict:
+        return {"line": self.line, "name": self.name, "error": self.error}
+
+
+def _attributes(node) -> dict:
+    attrs = {}
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current is None:
+            continue
+        if current.type == "comparision":
+            attrs.setdefault(current.left, current.attrType)
+        elif current.type == "operator":
+            stack.extend((current.right, current.left))
+    return attrs
+
+
+def parse_line(line_no: int, line: str):
+    """
+    Parse one NDJSON import line, or report the error read in its place (see `streaming.LineSplitter`).
+
+    Returns:
+        ParsedRule, or FailedRule if the line isn't a valid rule.
+    """
+    name = None
+    if isinstance(line, Exception):
+        return FailedRule(line_no, name, str(line))
+    try:
+        item = json.loads(line)
+        if not isinstance(item, dict):
+            raise ValueError("expected a JSON object")
+        name, rule_str = item.get("name"), item.get("rule")
+        if not isinstance(name, str) or not name or not isinstance(rule_str, str):
+            raise ValueError('expected string "name" and "rule" fields')
+        node = AST().create_rule(rule_str)
+        if item.get("optimize"):
+            node = optimize(node)
+        if references(node):
+            raise ValueError("Rules referencing other rules can't be imported in bulk, create them one by one")
+        return ParsedRule(line_no, name, rule_str, ast_to_json(node), codec.encode_or_none(node), content_hash(node),
+                          _attributes(node))
+    except Exception as e:
+        return FailedRule(line_no, name, str(e))
+
+
+def _init_worker(catalog_items: dict):
+    catalog.load(catalog_items)
+
+
+def _parse_chunk(lines: list) -> list:
+    return [parse_line(line_no, line) for line_no, line in lines]
+
+
+def parse_rules(lines, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE, start: int = 1) -> list:
+    """
+    Parse NDJSON import lines, blank lines are skipped.
+
+    Args:
+        workers: worker processes, 1 parses in this process (default: number of CPUs).
+        start: line number of the first line, for inputs parsed a batch at a time.
+
+    Returns:
+        One ParsedRule or FailedRule per non-blank line, in input order.
+    """
+    lines = [(line_no, line) for line_no, line in enumerate(lines, start=start)
+             if isinstance(line, Exception) or line.strip()]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(lines) < PARALLEL_MIN_RULES:
+        return _parse_chunk(lines)
+
+    chunks = [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(catalog.snapshot(),)) as pool:
+        results = [res for chunk in pool.map(_parse_chunk, chunks) for res in chunk]
+
+    # register the attributes in input order, as parsing one rule after the other would
+    checked = []
+    for (line_no, line), res in zip(lines, results):
+        if isinstance(res, FailedRule):
+            # the worker's catalog held its chunk's earlier lines, not the ones before them in the input
+            res = parse_line(line_no, line)
+        elif isinstance(res, ParsedRule):
+            for attr, attr_type in res.attrs.items():
+                if catalog.register(attr, attr_type) != attr_type:
+                    res = FailedRule(res.line, res.name,
+                                     "TypeError: different type of value for same attribute: {}".format(attr))
+                    break
+        checked.append(res)
+    return checked
+
+
+def export_ndjson(rules, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    NDJSON export of stored rules, the format `parse_rules` reads.
+
+    Yields:
+        Chunks of up to `chunk_size` lines, one line per rule.
+    """
+    lines = []
+    for rule in rules:
+        rule_str = rule.rule_str if rule.rule_str is not None else ast_to_rule(json_to_ast(rule.rule_json))
+        lines.append(json.dumps({"name": rule.rule_name, "rule": rule_str}) + "\n")
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
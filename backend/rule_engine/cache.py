@@ -0,0 +1,132 @@
+"""
+In-process cache of ready-to-evaluate rules
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class RuleCache(object):
+    """ Bounded LRU cache of rules keyed by rule name
+
+    Entries are dropped in least-recently-used order once `maxsize` is
+    reached, and optionally expire `ttl` seconds after they were stored.
+    The cache is per process, so with several uvicorn workers the TTL bounds
+    how long a worker can serve a rule modified through another worker.
+
+    Every invalidation bumps the rule's generation. A value built from a read
+    of the database is stored with the generation taken before that read, and
+    dropped if the rule was invalidated meanwhile, so it can't outlive the
+    change that invalidated it.
+
+    Attributes:
+        maxsize: maximum number of cached rules
+        ttl: seconds an entry stays valid, None to never expire
+        hits, misses, evictions, expirations: counters for sizing the cache
+    """
+    def __init__(self, maxsize=1024, ttl=None, timer=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._entries = OrderedDict()   # rule_name -> (stored_at, value)
+        self._generations = {}          # rule_name -> number of invalidations
+        self._epoch = 0                 # number of clears
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, rule_name):
+        """
+        Return the cached value for `rule_name`, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(rule_name)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if self.ttl is not None and self._timer() - stored_at >= self.ttl:
+                del self._entries[rule_name]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(rule_name)
+            self.hits += 1
+            return value
+
+    def generation(self, rule_name):
+        """
+        Token changing whenever `rule_name` is invalidated, to pass to `put`.
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(rule_name, 0)
+
+    def put(self, rule_name, value, generation=None) -> bool:
+        """
+        Store `value` for `rule_name`, evicting the least recently used entry when full.
+
+        Args:
+            generation: `generation(rule_name)` taken before building `value`, the
+                value is not stored if the rule was invalidated since.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(rule_name, 0)):
+                return False
+            self._entries[rule_name] = (self._timer(), value)
+            self._entries.move_to_end(rule_name)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, rule_name):
+        """
+        Drop `rule_name` from the cache, if present.
+        """
+        with self._lock:
+            self._entries.pop(rule_name, None)
+            self._generations[rule_name] = self._generations.get(rule_name, 0) + 1
+
+    def clear(self):
+        """
+        Drop every entry, keeping the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        """
+        Counters and current occupancy of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __contains__(self, rule_name):
+        with self._lock:
+            return rule_name in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
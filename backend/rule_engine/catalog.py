@@ -0,0 +1,126 @@
+"""
+Attribute catalog: the type every attribute used in a rule is compared as
+
+Attributes are registered the first time a rule uses them and keep that type
+from then on. The catalog is shared by the whole process and safe to use
+from several threads: reads are plain dict lookups, registrations take a lock.
+
+It's persisted in the `catalog` table (see `database.sync_catalog`). Every
+stored attribute gets an increasing id, and the highest id a process loaded
+is its catalog version: a process only needs the rows past its version to
+catch up with attributes registered by other workers.
+"""
+
+from collections import namedtuple
+from collections.abc import Mapping
+from threading import Lock
+
+# same value as rule_engine.parser.NUMBER, the parser imports the catalog
+NUMBER = 'NUMBER'
+
+
+def is_number(val) -> bool:
+    return isinstance(val, (int, float))
+
+
+def is_any(val) -> bool:
+    return True
+
+
+# attribute type -> check of a record value, attributes of other types accept any value
+VALIDATORS = {NUMBER: is_number}
+
+
+class Attribute(namedtuple('Attribute', ['type', 'validator'])):
+    """ Type of an attribute, and the check its values pass, `validator(val) -> bool` """
+    __slots__ = ()
+
+
+class Catalog(Mapping):
+    """ Mapping of attribute name -> attribute type
+
+    Attributes:
+        version: id of the last persisted attribute loaded, 0 before the first sync
+    """
+    def __init__(self):
+        self._attributes = {}       # attr -> Attribute
+        self._pending = {}          # attr -> type, registered here but not persisted yet
+        self._lock = Lock()
+        self.version = 0
+
+    def __getitem__(self, attr) -> str:
+        return self._attributes[attr].type
+
+    def __contains__(self, attr) -> bool:
+        return attr in self._attributes
+
+    def __iter__(self):
+        return iter(list(self._attributes))
+
+    def __len__(self) -> int:
+        return len(self._attributes)
+
+    def attribute(self, attr: str, attr_type: str) -> Attribute:
+        """
+        The Attribute of `attr`, registering it as `attr_type` if it is new.
+
+        Returns:
+            Attribute: the stored type, which may differ from `attr_type`, and its validator.
+        """
+        attribute = self._attributes.get(attr)
+        if attribute is not None:
+            return attribute
+        with self._lock:
+            attribute = self._attributes.get(attr)
+            if attribute is None:
+                attribute = Attribute(attr_type, VALIDATORS.get(attr_type, is_any))
+                self._attributes[attr] = attribute
+                self._pending[attr] = attr_type
+            return attribute
+
+    def register(self, attr: str, attr_type: str) -> str:
+        """
+        Register `attr` as `attr_type` if it is new.
+
+        Returns:
+            str: the type stored for `attr`.
+        """
+        return self.attribute(attr, attr_type).type
+
+    def validator(self, attr: str):
+        """ Check of the values of `attr`, None for an unknown attribute """
+        attribute = self._attributes.get(attr)
+        return attribute.validator if attribute is not None else None
+
+    def pending(self) -> dict:
+        """ Attributes registered in this process and not persisted yet, attr -> type """
+        with self._lock:
+            return dict(self._pending)
+
+    def load(self, attributes: dict, version: int = None):
+        """
+        Take the types of `attributes`, attr -> type, over the ones registered here.
+
+        Args:
+            attributes: persisted attributes, or the catalog of another process.
+            version: id of the last persisted attribute among them.
+        """
+        with self._lock:
+            for attr, attr_type in attributes.items():
+                self._attributes[attr] = Attribute(attr_type, VALIDATORS.get(attr_type, is_any))
+                self._pending.pop(attr, None)
+            if version is not None:
+                self.version = max(self.version, version)
+
+    def snapshot(self) -> dict:
+        """ Copy of the catalog as a plain dict, attr -> type """
+        return {attr: attribute.type for attr, attribute in list(self._attributes.items())}
+
+    def clear(self):
+        with self._lock:
+            self._attributes.clear()
+            self._pending.clear()
+            self.version = 0
+
+    def __repr__(self):
+        return "Catalog({})".format(self.snapshot())
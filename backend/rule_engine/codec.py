@@ -0,0 +1,180 @@
+"""
+Compact binary encoding of rule ASTs
+
+Layout (little endian), version 1:
+
+    header        magic b'RB', version (B), #strings (I), #floats (I), #instructions (I)
+    string table  #strings lengths (I) followed by the utf-8 bytes of every string
+    float table   #floats doubles (d)
+    instructions  postfix order, one (opcode B, flags B, attr H, const I) record each
+
+Attribute names and string constants are interned in the string table, so
+an attribute repeated across the rule is stored once. Decoding is a single
+pass over the instructions with an explicit stack, no recursion.
+"""
+
+import struct
+from rule_engine.parser import NUMBER, STRING, Node
+
+MAGIC = b'RB'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<2sBIII')
+INSTRUCTION = struct.Struct('<BBHI')
+
+# opcodes
+COMPARISION, AND, OR = 1, 2, 3
+
+OPS = ('>', '>=', '<', '<=', '=', '!=')
+OP_CODES = {op: code for code, op in enumerate(OPS)}
+ATTR_TYPES = (None, NUMBER, STRING)
+ATTR_TYPE_CODES = {attr_type: code for code, attr_type in enumerate(ATTR_TYPES)}
+
+# flags -> op / attrType, precomputed for decoding
+FLAG_OPS = [OPS[flags & 0x7] if flags & 0x7 < len(OPS) else None for flags in range(256)]
+FLAG_ATTR_TYPES = [ATTR_TYPES[(flags >> 3) & 0x3] if (flags >> 3) & 0x3 < len(ATTR_TYPES) else None for flags in range(256)]
+
+# kind of constant held by a comparision, packed in the flags
+CONST_STR, CONST_FLOAT, CONST_INT, CONST_NONE = 0, 1, 2, 3
+
+
+def version(data: bytes) -> int:
+    """
+    Format version of an encoded AST, None if `data` isn't an encoded AST.
+    """
+    if not data or len(data) < HEADER.size or data[:2] != MAGIC:
+        return None
+    return data[2]
+
+
+def encode(node: Node) -> bytes:
+    """
+    Encode an AST into the compact binary format.
+
+    Raises:
+        ValueError: if the AST holds a node the format can't represent.
+    """
+    strings, string_ids = [], {}
+    floats = []
+    instructions = []
+
+    def intern(value: str) -> int:
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    # post-order walk with an explicit stack
+    stack = [(node, False)] if node is not None else []
+    while stack:
+        current, expanded = stack.pop()
+        if current.type == "operator":
+            if expanded:
+                if current.op not in ("AND", "OR"):
+                    raise ValueError("Cannot encode operator {}".format(current.op))
+                instructions.append((AND if current.op == "AND" else OR, 0, 0, 0))
+            else:
+                stack.append((current, True))
+                stack.append((current.right, False))
+                stack.append((current.left, False))
+        elif current.type == "comparision":
+            if current.op not in OP_CODES or current.attrType not in ATTR_TYPE_CODES or not isinstance(current.left, str):
+                raise ValueError("Cannot encode comparision {}".format(current))
+
+            value = current.right
+            if value is None:
+                kind, const = CONST_NONE, 0
+            elif isinstance(value, str):
+                kind, const = CONST_STR, intern(value)
+            elif isinstance(value, float):
+                kind, const = CONST_FLOAT, len(floats)
+                floats.append(value)
+            elif isinstance(value, int) and not isinstance(value, bool):
+                kind, const = CONST_INT, intern(str(value))
+            else:
+                raise ValueError("Cannot encode constant {!r}".format(value))
+
+            attr = intern(current.left)
+            if attr > 0xFFFF:
+                raise ValueError("Too many distinct strings in rule")
+            flags = OP_CODES[current.op] | ATTR_TYPE_CODES[current.attrType] << 3 | kind << 5
+            instructions.append((COMPARISION, flags, attr, const))
+        else:
+            raise ValueError("Cannot encode node of type {}".format(current.type))
+
+    encoded_strings = [value.encode('utf-8') for value in strings]
+    parts = [
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(strings), len(floats), len(instructions)),
+        struct.pack('<{}I'.format(len(strings)), *map(len, encoded_strings)),
+        b''.join(encoded_strings),
+        struct.pack('<{}d'.format(len(floats)), *floats),
+    ]
+    parts.extend(INSTRUCTION.pack(*instruction) for instruction in instructions)
+    return b''.join(parts)
+
+
+def encode_or_none(node: Node):
+    """
+    `encode`, or None for an AST the format can't represent (e.g. one
+    referencing other rules), which is then only stored as JSON.
+    """
+    try:
+        return encode(node)
+    except ValueError:
+        return None
+
+
+def decode(data: bytes) -> Node:
+    """
+    Decode an AST encoded with `encode`.
+
+    Raises:
+        ValueError: if `data` is not an encoded AST of a supported version.
+    """
+    data = bytes(data)     # drivers may hand back memoryview for binary columns
+    if version(data) != FORMAT_VERSION:
+        raise ValueError("Unsupported binary AST format version: {}".format(version(data)))
+
+    _, _, n_strings, n_floats, n_instructions = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+
+    lengths = struct.unpack_from('<{}I'.format(n_strings), data, offset)
+    offset += 4 * n_strings
+    text = data[offset:offset + sum(lengths)]
+    offset += len(text)
+    strings = []
+    start = 0
+    for length in lengths:
+        strings.append(text[start:start + length].decode('utf-8'))
+        start += length
+
+    floats = struct.unpack_from('<{}d'.format(n_floats), data, offset)
+    offset += 8 * n_floats
+
+    end = offset + INSTRUCTION.size * n_instructions
+    if end != len(data):
+        raise ValueError("Corrupted binary AST")
+
+    stack = []
+    push, pop = stack.append, stack.pop
+    for opcode, flags, attr, const in INSTRUCTION.iter_unpack(data[offset:end]):
+        if opcode == COMPARISION:
+            kind = flags >> 5
+            if kind == CONST_STR:
+                value = strings[const]
+            elif kind == CONST_FLOAT:
+                value = floats[const]
+            elif kind == CONST_INT:
+                value = int(strings[const])
+            else:
+                value = None
+            push(Node("comparision", strings[attr], FLAG_OPS[flags], value, FLAG_ATTR_TYPES[flags]))
+        elif len(stack) >= 2:
+            right = pop()
+            push(Node("operator", pop(), "AND" if opcode == AND else "OR", right))
+        else:
+            raise ValueError("Corrupted binary AST")
+
+    if len(stack) > 1:
+        raise ValueError("Corrupted binary AST")
+    return stack[0] if stack else None
@@ -0,0 +1,444 @@
+""" Compile rule ASTs into flat Python callables """
+
+import builtins
+import math
+import operator
+from globalDS import catalog
+from rule_engine.parser import NUMBER, Node
+from rule_engine.error import TypeError, InsufficientDataError
+from rule_engine.flat import FlatAST
+from rule_engine.schema import RuleSchema
+
+# comparision operators resolved ahead of time, numeric ones only apply to NUMBER attributes
+NUMERIC_OPS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+COMMON_OPS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+}
+
+# deepest nesting evaluated with composed closures, each level costs a few Python frames
+MAX_CLOSURE_DEPTH = 200
+
+# root chains with at least this many operands get compiled one operand at a time, see `compile_segments`
+SEGMENT_MIN_OPERANDS = 32
+
+
+def operands(node: Node) -> list[Node]:
+    """
+    Flatten a chain of operator nodes sharing the same op into its operands, left to right.
+
+    e.g. ((a AND b) AND c) -> [a, b, c]
+    """
+    result = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.type == "operator" and current.op == node.op:
+            stack.append(current.right)
+            stack.append(current.left)
+        else:
+            result.append(current)
+    return result
+
+
+def nesting_depth(node: Node) -> int:
+    """
+    Depth of the tree once same-operator chains are flattened, i.e. how deep
+    composed closures would call into each other.
+    """
+    if node is None:
+        return 0
+    depth = 0
+    stack = [(node, 1)]
+    while stack:
+        current, level = stack.pop()
+        depth = max(depth, level)
+        if current.type == "operator":
+            stack.extend((child, level + 1) for child in operands(current))
+    return depth
+
+
+def _compile_comparision(node: Node):
+    """
+    Build a closure for a comparision node with its constant converted
+    and its operator resolved once, instead of on every evaluation.
+    """
+    attr = node.left
+    ref = node.right
+    if catalog.register(attr, node.attrType) == NUMBER:
+        try:
+            const = float(ref)
+        except (ValueError, builtins.TypeError):
+            # constant doesn't match the catalog type, keep the interpreter's behaviour
+            return node.evaluate
+        cmp = NUMERIC_OPS.get(node.op) or COMMON_OPS.get(node.op)
+        if cmp is None:
+            return lambda data: None
+
+        def comparision(data):
+            try:
+                val = data[attr]
+            except KeyError:
+                raise InsufficientDataError(attr) from None
+            if not isinstance(val, (int, float)):
+                raise TypeError(attr=attr, val=val, ref=ref)
+            return cmp(float(val), const)
+        return comparision
+
+    cmp = COMMON_OPS.get(node.op)
+    if cmp is None:
+        # interpreter yields None for ordering on strings
+        def comparision(data):
+            if attr not in data:
+                raise InsufficientDataError(attr)
+            return None
+        return comparision
+
+    def comparision(data):
+        try:
+            val = data[attr]
+        except KeyError:
+            raise InsufficientDataError(attr) from None
+        return cmp(val, ref)
+    return comparision
+
+
+def _compile_operator(op: str, funcs: list):
+    """
+    Build a short-circuiting closure over already compiled operands.
+    Returns the same value as chained `and`/`or` would.
+    """
+    if len(funcs) == 2:
+        left, right = funcs
+        if op == "AND":
+            return lambda data: left(data) and right(data)
+        return lambda data: left(data) or right(data)
+
+    head, last = tuple(funcs[:-1]), funcs[-1]
+    if op == "AND":
+        def conjunction(data):
+            for func in head:
+                res = func(data)
+                if not res:
+                    return res
+            return last(data)
+        return conjunction
+
+    def disjunction(data):
+        for func in head:
+            res = func(data)
+            if res:
+                return res
+        return last(data)
+    return disjunction
+
+
+def compile_closures(node: Node):
+    """
+    Compile an AST into composed closures, one per node.
+
+    Same-operator chains (as produced by `AST.combine_rules`) are flattened,
+    and the tree is walked with an explicit stack, so deep rules compile fine.
+    """
+    if node is None:
+        return lambda data: True
+
+    compiled = {}   # id(node) -> compiled closure
+    stack = [(node, False)]
+    while stack:
+        current, expanded = stack.pop()
+        if current.type == "comparision":
+            compiled[id(current)] = _compile_comparision(current)
+        elif current.type != "operator":
+            compiled[id(current)] = lambda data: None
+        elif expanded:
+            op = "AND" if current.op == "AND" else "OR"
+            funcs = [compiled[id(child)] for child in operands(current)]
+            compiled[id(current)] = _compile_operator(op, funcs)
+        else:
+            stack.append((current, True))
+            stack.extend((child, False) for child in operands(current))
+
+    return compiled[id(node)]
+
+###############################################################################
+#                                                                             #
+#  CODE GENERATION                                                            #
+#                                                                             #
+###############################################################################
+
+# sentinel for attributes missing from the data
+_MISSING = object()
+
+def _missing(attr):
+    raise InsufficientDataError(attr)
+
+def _check_number(attr, val, ref):
+    """ Slow path of a numeric leaf: missing attribute, wrong type, or int/float subclass """
+    if val is _MISSING:
+        raise InsufficientDataError(attr)
+    if not isinstance(val, (int, float)):
+        raise TypeError(attr=attr, val=val, ref=ref)
+    return float(val)
+
+PY_OPS = {'>': '>', '>=': '>=', '<': '<', '<=': '<=', '=': '==', '!=': '!='}
+
+class _SourceBuilder(object):
+    """ Generates the source of a single function evaluating an AST """
+    def __init__(self):
+        self.namespace = {
+            '_M': _MISSING,
+            '_NUM': (int, float),
+            '_chk': _check_number,
+            '_miss': _missing,
+            'float': float,
+        }
+        self.locals = {}    # attr -> local variable holding its preloaded value, see `preload`
+
+    def literal(self, value) -> str:
+        """ Inline `value` as a literal when it round-trips, else bind it to a name """
+        if type(value) in (str, int) or (type(value) is float and math.isfinite(value)):
+            return repr(value)
+        name = '_c{}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def comparision(self, node: Node) -> str:
+        attr = node.left
+        attr_type = catalog.register(attr, node.attrType)
+
+        key = self.literal(attr)
+        if attr_type == NUMBER and node.op in PY_OPS:
+            try:
+                const = float(node.right)
+            except (ValueError, builtins.TypeError):
+                return self.fallback(node)
+            if attr in self.locals:
+                return "({} {} {})".format(self.locals[attr], PY_OPS[node.op], self.literal(const))
+            # ints and floats take the inline path, anything else goes through _chk
+            fetch = "(float(v) if (v := data.get({key}, _M)).__class__ in _NUM else _chk({key}, v, {ref}))".format(
+                key=key, ref=self.literal(node.right))
+            return "({} {} {})".format(fetch, PY_OPS[node.op], self.literal(const))
+
+        if attr_type != NUMBER and node.op in COMMON_OPS:
+            if attr in self.locals:
+                return "({} {} {})".format(self.locals[attr], PY_OPS[node.op], self.literal(node.right))
+            fetch = "(v if (v := data.get({key}, _M)) is not _M else _miss({key}))".format(key=key)
+            return "({} {} {})".format(fetch, PY_OPS[node.op], self.literal(node.right))
+
+        return self.fallback(node)
+
+    def fallback(self, node: Node) -> str:
+        """ Hand leaves the generator doesn't specialise back to the interpreter """
+        return "{}(data)".format(self.literal(node.evaluate))
+
+    def expression(self, node: Node) -> str:
+        exprs = {}   # id(node) -> expression source
+        stack = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current.type == "comparision":
+                exprs[id(current)] = self.comparision(current)
+            elif current.type != "operator":
+                exprs[id(current)] = "None"
+            elif expanded:
+                joiner = " and " if current.op == "AND" else " or "
+                exprs[id(current)] = "({})".format(joiner.join(exprs[id(child)] for child in operands(current)))
+            else:
+                stack.append((current, True))
+                stack.extend((child, False) for child in operands(current))
+
+        return exprs[id(node)]
+
+    def source(self, node: Node) -> str:
+        return "def rule(data):\n    return {}\n".format(self.expression(node))
+
+    def preload(self, number_attrs, other_attrs) -> str:
+        """
+        Statements loading every attribute into a local once, numbers converted
+        to float, and returning `_fallback(data)` for records they don't fit:
+        not a dict, an attribute missing, or a number that isn't an int or float
+        convertible to float. Comparisions generated afterwards use the locals.
+        """
+        lines = ["if data.__class__ is not dict:", "    return _fallback(data)", "try:"]
+        for attr in tuple(number_attrs) + tuple(other_attrs):
+            self.locals[attr] = '_a{}'.format(len(self.locals))
+            lines.append("    {} = data[{}]".format(self.locals[attr], self.literal(attr)))
+        for attr in number_attrs:
+            lines += [
+                "    if {v}.__class__ is not float:".format(v=self.locals[attr]),
+                "        if {v}.__class__ is not int:".format(v=self.locals[attr]),
+                "            return _fallback(data)",
+                "        {v} = float({v})".format(v=self.locals[attr]),
+            ]
+        # ints too large for a float raise OverflowError
+        lines += ["except (KeyError, OverflowError):", "    return _fallback(data)"]
+        return "".join("    " + line + "\n" for line in lines)
+
+
+def compile_source(node: Node):
+    """
+    Generate and compile Python source for an AST into one flat function,
+    with constants converted and operators resolved ahead of time.
+    """
+    if node is None:
+        return lambda data: True
+
+    builder = _SourceBuilder()
+    code = compile(builder.source(node), "<rule>", "exec")
+    exec(code, builder.namespace)
+    return builder.namespace["rule"]
+
+
+def compile_preloaded(node: Node, number_attrs, other_attrs, fallback):
+    """
+    Compile an AST into a function loading and type checking the given
+    attributes once, ahead of comparisions on them reduced to a bare operator.
+
+    Records that don't hold the attributes with their catalog type go to
+    `fallback(data)` instead, so the AST is only ever evaluated on records
+    where none of those comparisions can raise.
+    """
+    builder = _SourceBuilder()
+    builder.namespace['_fallback'] = fallback
+    prologue = builder.preload(number_attrs, other_attrs)
+    try:
+        source = "def rule(data):\n{}    return {}\n".format(prologue, builder.expression(node))
+        code = compile(source, "<rule>", "exec")
+    except (RecursionError, MemoryError, SyntaxError):
+        evaluate = compile_node(node)
+        code = compile("def rule(data):\n{}    return _evaluate(data)\n".format(prologue), "<rule>", "exec")
+        builder.namespace['_evaluate'] = evaluate
+    exec(code, builder.namespace)
+    return builder.namespace["rule"]
+
+
+def compile_strict(node: Node):
+    """
+    Compile an AST into a callable validating records against the rule's
+    schema before comparing anything.
+
+    Attributes are loaded and converted once per record, comparisions are
+    reduced to a bare operator against a converted constant. A record missing
+    an attribute of the rule, or holding a value of the wrong type, raises the
+    same InsufficientDataError / TypeError as `Node.evaluate` would, but even
+    when short-circuiting would never have reached that attribute.
+    """
+    if node is None:
+        return lambda data: True
+
+    schema = RuleSchema(node)
+    evaluate = compile_node(node)
+
+    def checked(data):
+        # records the fast path doesn't take, e.g. bools or ints too large for a float
+        schema.validate(data)
+        return evaluate(data)
+    return compile_preloaded(node, schema.number_attrs, schema.other_attrs, checked)
+
+
+def compile_node(node: Node):
+    """
+    Compile an AST into a single callable `func(data)`.
+
+    Gives the same results and raises the same errors as `Node.evaluate`.
+    Generated source is preferred, rules nested too deeply for the Python
+    compiler fall back to composed closures, and rules too deep for closures
+    to call into each other to the iterative FlatAST evaluator.
+    """
+    try:
+        return compile_source(node)
+    except (RecursionError, MemoryError, SyntaxError):
+        if nesting_depth(node) > MAX_CLOSURE_DEPTH:
+            return FlatAST.from_node(node).evaluate
+        return compile_closures(node)
+
+
+def compile_segments(node: Node, segments: dict = None):
+    """
+    Compile each operand of the root AND/OR chain into its own function,
+    joined by a generated function calling them in order.
+
+    Args:
+        node: root of an operator chain.
+        segments: segments of a previous compilation. Operands found in it
+            (the same Node objects, as kept by `rule_engine.patch`) reuse
+            their function instead of being compiled again.
+
+    Returns:
+        (function, segments): segments maps id(operand) -> (operand, function).
+    """
+    previous = segments or {}
+    segments = {}
+    namespace = {}
+    calls = []
+    for i, operand in enumerate(operands(node)):
+        entry = previous.get(id(operand))
+        if entry is None or entry[0] is not operand:
+            entry = (operand, compile_node(operand))
+        segments[id(operand)] = entry
+        namespace['_s{}'.format(i)] = entry[1]
+        calls.append('_s{}(data)'.format(i))
+
+    joiner = " and " if node.op == "AND" else " or "
+    exec(compile("def rule(data):\n    return ({})\n".format(joiner.join(calls)), "<rule>", "exec"), namespace)
+    return namespace["rule"], segments
+
+
+class CompiledRule(object):
+    """ A rule AST together with its compiled evaluator
+
+    Attributes:
+        node: root of the source AST
+        evaluate: compiled callable, evaluate(data) -> result
+        segments: per operand functions of a long root chain (see `compile_segments`), else None
+    """
+    def __init__(self, node: Node, segments: dict = None):
+        self.node = node
+        self.segments = None
+        if node is not None and node.type == "operator" and len(operands(node)) >= SEGMENT_MIN_OPERANDS:
+            self.evaluate, self.segments = compile_segments(node, segments)
+        else:
+            self.evaluate = compile_node(node)
+        self._strict = None
+
+    def patch(self, node: Node) -> "CompiledRule":
+        """
+        Compile `node`, a patched version of this rule sharing its untouched
+        subtrees. Only the root operands holding a change are compiled again.
+        """
+        return CompiledRule(node, segments=self.segments)
+
+    def __call__(self, data):
+        return self.evaluate(data)
+
+    @property
+    def strict(self):
+        """ Evaluator failing fast on records that don't fit the rule's schema, see `compile_strict` """
+        if self._strict is None:
+            self._strict = compile_strict(self.node)
+        return self._strict
+
+    def evaluate_many(self, records, strict: bool = False) -> list:
+        """
+        Evaluate the rule against each record, with the `strict` evaluator if set.
+
+        Errors are reported inline: a record that fails to evaluate yields
+        its exception in the result list instead of aborting the batch.
+        """
+        evaluate = self.strict if strict else self.evaluate
+        results = []
+        for data in records:
+            try:
+                results.append(evaluate(data))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def __repr__(self):
+        return "CompiledRule({})".format(self.node)
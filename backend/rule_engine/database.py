@@ -4,10 +4,19 @@ Database operations for the rule engine.
 
 """
 
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from rule_engine.models import Rule
+from rule_engine.models import Rule, RuleReference, CatalogEntry
+from rule_engine import codec, metrics
+from rule_engine.abstract_tree import json_to_ast
+from rule_engine.memo import content_hash
+from rule_engine.references import resolve
+from rule_engine.catalog import Catalog
 
 
+@metrics.timed("db_fetch")
 def get_rule(db: Session, rule_name: str) -> Rule:
     """
     Retrieve a rule from the database by its name.
@@ -16,12 +25,95 @@ def get_rule(db: Session, rule_name: str) -> Rule:
 
 def get_all_rule_names(db: Session) -> list[str]:
     """
-    Retrieve all rule names from the database.
+    Retrieve all rule names from the database, without loading the rules themselves.
     """
-    return [rule.rule_name for rule in db.query(Rule).all()]
+    return [name for (name,) in db.query(Rule.rule_name).order_by(Rule.rule_name)]
 
+# columns `list_rules` can return, by field name
+LIST_FIELDS = {"name": Rule.rule_name, "rule": Rule.rule_str, "json": Rule.rule_json}
 
-def create_rule(db: Session, rule_name: str, rule_str: str, rule_json: str) -> Rule:
+def _prefix_end(prefix: str):
+    """ Smallest string above every string starting with `prefix`, None if there is none """
+    while prefix:
+        if ord(prefix[-1]) < 0x10FFFF:
+            return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        prefix = prefix[:-1]
+    return None
+
+def list_rules(db: Session, fields=("name",), prefix: str = None, after: str = None, limit: int = None,
+               page_size: int = 1000):
+    """
+    Iterate over the rules by name, selecting only the requested columns.
+
+    Rules are fetched in pages of `page_size` by keyset (names above the last one
+    seen), so every page is an index range scan on `rule_name`, however deep it is.
+
+    Args:
+        db (Session): The database session.
+        fields: Columns to return, among LIST_FIELDS, the name always comes first.
+        prefix (str): Only rules whose name starts with it.
+        after (str): Only rules whose name sorts after it, the last name of the previous page.
+        limit (int): Stop after this many rules, all of them by default.
+
+    Yields:
+        Tuple: The name and the requested columns of each rule.
+    """
+    columns = [Rule.rule_name] + [LIST_FIELDS[field] for field in fields if field != "name"]
+    base = db.query(*columns).order_by(Rule.rule_name)
+    if prefix:
+        # a range on the indexed column, the LIKE only rechecks the rows in it
+        base = base.filter(Rule.rule_name >= prefix, Rule.rule_name.startswith(prefix, autoescape=True))
+        end = _prefix_end(prefix)
+        if end is not None:
+            base = base.filter(Rule.rule_name < end)
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = base.filter(Rule.rule_name > after) if after is not None else base
+        rows = page.limit(size).all()
+        yield from rows
+        if len(rows) < size:
+            return
+        after = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+@metrics.timed("db_fetch")
+def get_all_rules(db: Session) -> list[Rule]:
+    """
+    Retrieve all rules from the database.
+    """
+    return db.query(Rule).all()
+
+
+def get_rule_hashes(db: Session) -> dict:
+    """
+    Retrieve the content hash of every rule by name, without loading the rules themselves.
+    """
+    return dict(db.query(Rule.rule_name, Rule.rule_hash))
+
+
+@metrics.timed("db_fetch")
+def get_rules(db: Session, rule_names: list[str], batch_size: int = 500) -> list[Rule]:
+    """
+    Retrieve the rules named in `rule_names`, `batch_size` names per query.
+    """
+    rules = []
+    for start in range(0, len(rule_names), batch_size):
+        rules.extend(db.query(Rule).filter(Rule.rule_name.in_(rule_names[start:start + batch_size])))
+    return rules
+
+
+def iter_rules(db: Session, batch_size: int = 500):
+    """
+    Iterate over all rules by name, fetching `batch_size` rows at a time so
+    the whole table is never loaded in memory.
+    """
+    return db.query(Rule).order_by(Rule.rule_name).yield_per(batch_size)
+
+
+def create_rule(db: Session, rule_name: str, rule_str: str, rule_json: str, rule_bin: bytes = None,
+                rule_hash: str = None, references: list[str] = None) -> Rule:
     """
     Create a new rule in the database.
 
@@ -30,17 +122,74 @@ def create_rule(db: Session, rule_name: str, rule_str: str, rule_json: str) -> R
         rule_name (str): The name of the rule.
         rule_str (str): The original rule string
         rule_json (str): The JSON representation of the AST for the rule.
+        rule_bin (bytes): The compact binary encoding of the AST (see `codec`).
+        rule_hash (str): The content hash of the AST (see `memo.content_hash`).
+        references (list[str]): Names of the rules it references (see `references`).
 
     Returns:
         Rule: The created rule object.
     """
-    db_rule = Rule(rule_name=rule_name, rule_str=rule_str, rule_json=rule_json)
+    db_rule = Rule(rule_name=rule_name, rule_str=rule_str, rule_json=rule_json, rule_bin=rule_bin, rule_hash=rule_hash)
     db.add(db_rule)
+    db.add_all(RuleReference(rule_name=rule_name, ref_name=ref_name) for ref_name in references or ())
     db.commit()
     db.refresh(db_rule)
     return db_rule
 
-def modify_rule(db: Session, rule_name: str, new_rule_str: str, new_rule_json: str) -> Rule:
+def import_rules(db: Session, rules: list, upsert: bool = False, batch_size: int = 500) -> tuple[list, list, list]:
+    """
+    Store many rules in one transaction, with a multi-row INSERT (and UPDATE
+    when upserting) per batch of `batch_size` rules instead of a commit per rule.
+
+    Args:
+        db (Session): The database session.
+        rules (list): Rules to store, with `name`, `rule_str`, `rule_json`, `rule_bin` and `rule_hash` (see `bulk.ParsedRule`).
+        upsert (bool): Replace the rules that already exist, instead of rejecting them.
+            A name repeated in `rules` keeps its last rule when upserting, later repeats are rejected otherwise.
+
+    Returns:
+        tuple: The created rules, the updated rules, and (rule, reason) for each rejected rule.
+    Raises:
+        IntegrityError: If a rule was stored concurrently, nothing is stored then.
+    """
+    created, updated, rejected = [], [], []
+    latest = {}
+    for rule in rules:
+        if rule.name in latest and not upsert:
+            rejected.append((rule, "Rule '{}' appears more than once in the import.".format(rule.name)))
+            continue
+        latest[rule.name] = rule
+    rules = list(latest.values())
+
+    def rows(batch):
+        return [{"rule_name": rule.name, "rule_str": rule.rule_str, "rule_json": rule.rule_json,
+                 "rule_bin": rule.rule_bin, "rule_hash": rule.rule_hash} for rule in batch]
+
+    try:
+        for start in range(0, len(rules), batch_size):
+            batch = rules[start:start + batch_size]
+            existing = {name for (name,) in db.query(Rule.rule_name).filter(Rule.rule_name.in_([rule.name for rule in batch]))}
+            new = [rule for rule in batch if rule.name not in existing]
+            old = [rule for rule in batch if rule.name in existing]
+            if new:
+                db.execute(insert(Rule), rows(new))
+                created.extend(new)
+            if old and upsert:
+                db.execute(update(Rule), rows(old))
+                # imported rules reference none (see `bulk.parse_line`), drop what the replaced ones referenced
+                db.query(RuleReference).filter(RuleReference.rule_name.in_([rule.name for rule in old])) \
+                    .delete(synchronize_session=False)
+                updated.extend(old)
+            elif old:
+                rejected.extend((rule, "Rule with the name '{}' already exists.".format(rule.name)) for rule in old)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return created, updated, rejected
+
+def modify_rule(db: Session, rule_name: str, new_rule_str: str, new_rule_json: str, new_rule_bin: bytes = None,
+                new_rule_hash: str = None, new_references: list[str] = None) -> Rule:
     """
     Update an existing rule in the database.
 
@@ -49,6 +198,9 @@ def modify_rule(db: Session, rule_name: str, new_rule_str: str, new_rule_json: s
         rule_name (str): The name of the rule to update.
         new_rule_str (str): The updated rule string.
         new_rule_json (str): The updated JSON representation of the AST for the rule.
+        new_rule_bin (bytes): The updated binary encoding of the AST.
+        new_rule_hash (str): The updated content hash of the AST.
+        new_references (list[str]): Names of the rules it now references.
 
     Returns:
         Rule: The updated rule object, or None if no rule was found.
@@ -62,6 +214,10 @@ def modify_rule(db: Session, rule_name: str, new_rule_str: str, new_rule_json: s
     # Update the rule fields
     db_rule.rule_str = new_rule_str
     db_rule.rule_json = new_rule_json
+    db_rule.rule_bin = new_rule_bin
+    db_rule.rule_hash = new_rule_hash
+    db.query(RuleReference).filter(RuleReference.rule_name == rule_name).delete()
+    db.add_all(RuleReference(rule_name=rule_name, ref_name=ref_name) for ref_name in new_references or ())
 
     # Commit the changes
     db.commit()
@@ -81,4 +237,206 @@ def delete_rule(db: Session, rule_name: str) -> None:
         None
     """
     db.query(Rule).filter(Rule.rule_name == rule_name).delete()
-    db.commit()
\ No newline at end of file
+    db.query(RuleReference).filter(RuleReference.rule_name == rule_name).delete()
+    db.commit()
+
+@metrics.timed("db_fetch")
+def get_dependents(db: Session, rule_name: str, transitive: bool = True) -> list[str]:
+    """
+    Names of the rules referencing `rule_name`, and the rules referencing those when `transitive`.
+
+    Returns:
+        list[str]: The dependents, nearest first.
+    """
+    dependents = {}
+    pending = [rule_name]
+    while pending:
+        rows = db.query(RuleReference.rule_name).filter(RuleReference.ref_name.in_(pending)).distinct().all()
+        pending = []
+        for (name,) in rows:
+            if name not in dependents and name != rule_name:
+                dependents[name] = None
+                pending.append(name)
+        if not transitive:
+            break
+    return list(dependents)
+
+@metrics.timed("deserialize")
+def load_ast(rule: Rule):
+    """
+    AST of a stored rule, decoded from `rule_bin` when it holds the current
+    format, otherwise parsed from `rule_json`.
+    """
+    if codec.version(rule.rule_bin) == codec.FORMAT_VERSION:
+        return codec.decode(rule.rule_bin)
+    return json_to_ast(rule.rule_json)
+
+def load_resolved_ast(db: Session, rule: Rule, chain: tuple = ()):
+    """
+    AST of a stored rule, with the rules it references resolved (see `references.resolve`).
+
+    Raises:
+        ValueError: If a referenced rule doesn't exist, or references lead back to the rule.
+    """
+    chain = chain + (rule.rule_name,)
+
+    def lookup(ref_name):
+        if ref_name in chain:
+            raise ValueError("Circular reference: @{}".format(" -> @".join(chain + (ref_name,))))
+        ref = get_rule(db, ref_name)
+        if ref is None:
+            raise ValueError("Referenced rule not found: {}".format(ref_name))
+        return load_resolved_ast(db, ref, chain)
+
+    return resolve(load_ast(rule), lookup)
+
+def backfill_rule_bin(db: Session, batch_size: int = 500) -> int:
+    """
+    Store the binary AST of every rule that has none, or one in an older format.
+    Rules are walked in pages of `batch_size` by name, one commit per page.
+
+    Returns:
+        int: Number of rules updated.
+    """
+    updated = 0
+    last_name = None
+    while True:
+        page = db.query(Rule).order_by(Rule.rule_name)
+        if last_name is not None:
+            page = page.filter(Rule.rule_name > last_name)
+        rules = page.limit(batch_size).all()
+        if not rules:
+            return updated
+
+        for rule in rules:
+            if codec.version(rule.rule_bin) == codec.FORMAT_VERSION:
+                continue
+            try:
+                rule.rule_bin = codec.encode(json_to_ast(rule.rule_json))
+            except ValueError:
+                continue
+            updated += 1
+        last_name = rules[-1].rule_name
+        db.commit()
+
+def backfill_rule_hash(db: Session, batch_size: int = 500) -> int:
+    """
+    Store the content hash of every rule that has none.
+    Rules are walked in pages of `batch_size` by name, one commit per page.
+
+    Returns:
+        int: Number of rules updated.
+    """
+    updated = 0
+    last_name = None
+    while True:
+        page = db.query(Rule).filter(Rule.rule_hash.is_(None)).order_by(Rule.rule_name)
+        if last_name is not None:
+            page = page.filter(Rule.rule_name > last_name)
+        rules = page.limit(batch_size).all()
+        if not rules:
+            return updated
+
+        for rule in rules:
+            rule.rule_hash = content_hash(load_ast(rule))
+            updated += 1
+        last_name = rules[-1].rule_name
+        db.commit()
+
+def get_duplicate_rules(db: Session) -> list[list[str]]:
+    """
+    Names of the rules sharing a content hash, one sorted group per hash.
+    """
+    duplicated = db.query(Rule.rule_hash).filter(Rule.rule_hash.isnot(None)) \
+        .group_by(Rule.rule_hash).having(func.count() > 1).subquery()
+    groups = {}
+    for rule_hash, rule_name in db.query(Rule.rule_hash, Rule.rule_name) \
+            .filter(Rule.rule_hash.in_(select(duplicated.c.rule_hash))).order_by(Rule.rule_hash, Rule.rule_name):
+        groups.setdefault(rule_hash, []).append(rule_name)
+    return list(groups.values())
+
+def get_catalog(db: Session, after: int = 0) -> list[CatalogEntry]:
+    """
+    Retrieve the stored attributes with an id above `after`, in id order.
+    """
+    return db.query(CatalogEntry).filter(CatalogEntry.id > after).order_by(CatalogEntry.id).all()
+
+# INSERT skipping rows whose attribute is stored already, by dialect
+_INSERT_IGNORE = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def _store_attributes(db: Session, attributes: dict):
+    """
+    Store attr -> type rows in one statement, leaving the attributes another process stored alone.
+    """
+    rows = [{'attr': attr, 'attr_type': attr_type} for attr, attr_type in attributes.items()]
+    insert_ignore = _INSERT_IGNORE.get(db.get_bind().dialect.name)
+    if insert_ignore is not None:
+        db.execute(insert_ignore(CatalogEntry).values(rows).on_conflict_do_nothing(index_elements=['attr']))
+        db.commit()
+        return
+    for row in rows:
+        db.add(CatalogEntry(**row))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+def sync_catalog(db: Session, catalog: Catalog) -> int:
+    """
+    Store the attributes registered in this process, then load the ones other
+    processes stored since the catalog's version. When two processes register
+    an attribute with different types, the first one stored wins everywhere.
+
+    The rows are only read when the highest stored id is past the catalog's
+    version, or to get the type of an attribute another process stored first.
+
+    Returns:
+        int: Number of attributes loaded.
+    """
+    pending = catalog.pending()
+    if pending:
+        _store_attributes(db, pending)
+
+    loaded = 0
+    latest = db.query(func.max(CatalogEntry.id)).scalar()
+    if latest is not None and latest > catalog.version:
+        entries = get_catalog(db, after=catalog.version)
+        if entries:
+            catalog.load({entry.attr: entry.attr_type for entry in entries}, version=entries[-1].id)
+            loaded += len(entries)
+    remaining = catalog.pending()
+    if remaining:
+        # stored by another process below this catalog's version
+        entries = db.query(CatalogEntry).filter(CatalogEntry.attr.in_(list(remaining))).all()
+        catalog.load({entry.attr: entry.attr_type for entry in entries})
+        loaded += len(entries)
+    return loaded
+
+def backfill_catalog(db: Session, catalog: Catalog, batch_size: int = 500) -> int:
+    """
+    Register the attributes of every stored rule, for databases created before
+    the catalog was persisted, and store them.
+
+    Returns:
+        int: Number of attributes loaded.
+    """
+    last_name = None
+    while True:
+        page = db.query(Rule).order_by(Rule.rule_name)
+        if last_name is not None:
+            page = page.filter(Rule.rule_name > last_name)
+        rules = page.limit(batch_size).all()
+        if not rules:
+            break
+        for rule in rules:
+            stack = [load_ast(rule)]
+            while stack:
+                node = stack.pop()
+                if node is None:
+                    continue
+                if node.type == "comparision":
+                    catalog.register(node.left, node.attrType)
+                elif node.type == "operator":
+                    stack.extend((node.left, node.right))
+        last_name = rules[-1].rule_name
+    return sync_catalog(db, catalog)
@@ -6,23 +6,34 @@ class SyntaxError(Exception):
         expected: expected token
         got: token got at that position
         val: value of that token
+        pos: character offset of that token, if known
 
     """
-    def __init__(self, expected, got, val):
+    def __init__(self, expected, got, val, pos=None):
+        self.expected, self.got, self.val, self.pos = expected, got, val, pos
         self.message = "SyntaxError: expected {} but, got {} with value {}".format(expected, got, val)
+        if pos is not None:
+            self.message += " at position {}".format(pos)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        return (self.__class__, (self.expected, self.got, self.val, self.pos))
+
 class InvalidTokenError(Exception):
     """ Exception raised for Invalid tokens 
 
     Attributes:
         token: token which caused error         
-        pos: position of token
+        pos: character offset of token in the rule
     """
     def __init__(self, token, pos):
+        self.token, self.pos = token, pos
         self.message = "InvalidToken: '{}' at position {}".format(token, pos)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        return (self.__class__, (self.token, self.pos))
+
 class TypeError(Exception):
     """ Type errors during evaluation 
     
@@ -33,9 +44,13 @@ class TypeError(Exception):
 
     """
     def __init__(self, attr, val, ref):
+        self.attr, self.val, self.ref = attr, val, ref
         self.message = "TypeError: cannot compare {} with {}, attribute: {}".format(val, ref, attr)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        return (self.__class__, (self.attr, self.val, self.ref))
+
 class InsufficientDataError(Exception):
     """ attribute not present in provided data
 
@@ -43,5 +58,9 @@ class InsufficientDataError(Exception):
         attr: attribute which is not present
     """
     def __init__(self, attr):
+        self.attr = attr
         self.message = "InsufficientDataError: {} attribute is not present in provided data".format(attr)
         super().__init__(self.message)
+
+    def __reduce__(self):
+        return (self.__class__, (self.attr,))
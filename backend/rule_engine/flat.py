@@ -0,0 +1,195 @@
+"""
+Array-backed representation of rule ASTs
+
+A FlatAST stores a tree as parallel arrays indexed by node id: a kind/op
+code per node, and two int32 slots holding the child ids of an operator,
+or the attribute and constant pool indices of a comparision. Nodes are laid
+out in post-order, so the root is the last node. Evaluation walks the arrays
+with an explicit stack, so there is no recursion limit on rule depth.
+"""
+
+import builtins
+from array import array
+from globalDS import catalog
+from rule_engine.parser import NUMBER, Node
+from rule_engine.error import TypeError, InsufficientDataError
+
+# node kinds
+COMPARISION, AND, OR, UNKNOWN = 0, 1, 2, 3
+
+OPS = ('>', '>=', '<', '<=', '=', '!=')
+OP_CODES = {op: code for code, op in enumerate(OPS)}
+NO_OP = 255
+
+
+class FlatAST(object):
+    """ Rule AST stored as parallel arrays
+
+    Attributes:
+        kinds: node kind per node (COMPARISION, AND, OR, UNKNOWN)
+        ops: comparision operator code per node, NO_OP for operators
+        left, right: child ids of operators; attribute / constant pool indices of comparisions
+        attrs: attribute pool
+        consts: constant pool, the constants as stored in the AST
+        numbers: numeric value of each constant, None if it isn't numeric
+        types: index into `attr_types` per node
+        attr_types: pool of the attrType values
+    """
+    __slots__ = ('kinds', 'ops', 'left', 'right', 'types', 'attrs', 'consts', 'numbers', 'attr_types')
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.ops = array('B')
+        self.left = array('i')
+        self.right = array('i')
+        self.types = array('B')
+        self.attrs = []
+        self.consts = []
+        self.numbers = []
+        self.attr_types = [None]
+
+    @classmethod
+    def from_node(cls, node: Node) -> "FlatAST":
+        """
+        Flatten a Node tree.
+        """
+        flat = cls()
+        if node is None:
+            return flat
+
+        attr_ids, const_ids = {}, {}
+        ids = {}    # id(node) -> node id
+        stack = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current.type == "operator" and not expanded:
+                stack.append((current, True))
+                stack.append((current.right, False))
+                stack.append((current.left, False))
+                continue
+
+            if current.type == "operator":
+                flat.kinds.append(AND if current.op == "AND" else OR)
+                flat.ops.append(NO_OP)
+                flat.left.append(ids[id(current.left)])
+                flat.right.append(ids[id(current.right)])
+                flat.types.append(0)
+            elif current.type == "comparision":
+                if current.left not in attr_ids:
+                    attr_ids[current.left] = len(flat.attrs)
+                    flat.attrs.append(current.left)
+                const_key = (type(current.right), current.right)
+                if const_key not in const_ids:
+                    const_ids[const_key] = len(flat.consts)
+                    flat.consts.append(current.right)
+                    flat.numbers.append(_number(current.right))
+                flat.kinds.append(COMPARISION)
+                flat.ops.append(OP_CODES.get(current.op, NO_OP))
+                flat.left.append(attr_ids[current.left])
+                flat.right.append(const_ids[const_key])
+                if current.attrType not in flat.attr_types:
+                    flat.attr_types.append(current.attrType)
+                flat.types.append(flat.attr_types.index(current.attrType))
+            else:
+                flat.kinds.append(UNKNOWN)
+                flat.ops.append(NO_OP)
+                flat.left.append(-1)
+                flat.right.append(-1)
+                flat.types.append(0)
+            ids[id(current)] = len(flat.kinds) - 1
+        return flat
+
+    def to_node(self) -> Node:
+        """
+        Rebuild the Node tree.
+        """
+        nodes = []
+        for i, kind in enumerate(self.kinds):
+            if kind == COMPARISION:
+                op = OPS[self.ops[i]] if self.ops[i] != NO_OP else None
+                nodes.append(Node("comparision", self.attrs[self.left[i]], op, self.consts[self.right[i]], self.attr_types[self.types[i]]))
+            elif kind == UNKNOWN:
+                nodes.append(Node(None))
+            else:
+                nodes.append(Node("operator", nodes[self.left[i]], "AND" if kind == AND else "OR", nodes[self.right[i]]))
+        return nodes[-1] if nodes else None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def _comparision(self, i, data):
+        """ Same checks and result as Node.comparision """
+        attr = self.attrs[self.left[i]]
+        if attr not in data:
+            raise InsufficientDataError(attr)
+        val = data[attr]
+        attribute = catalog.attribute(attr, self.attr_types[self.types[i]])
+
+        op = self.ops[i]
+        ref = self.consts[self.right[i]]
+        if not attribute.validator(val):
+            raise TypeError(attr=attr, val=val, ref=ref)
+        if attribute.type == NUMBER:
+            number = self.numbers[self.right[i]]
+            if number is None:
+                number = float(ref)     # raises like the interpreter does
+            val = float(val)
+            if op == 0:
+                return val > number
+            if op == 1:
+                return val >= number
+            if op == 2:
+                return val < number
+            if op == 3:
+                return val <= number
+            if op == 4:
+                return val == number
+            if op == 5:
+                return val != number
+            return None
+
+        if op == 4:
+            return val == ref
+        if op == 5:
+            return val != ref
+        return None
+
+    def evaluate(self, data):
+        """
+        Evaluate the rule against data, with the interpreter's results and errors.
+        """
+        if not self.kinds:
+            return True
+        kinds, left, right = self.kinds, self.left, self.right
+
+        # pending node ids and their stage, 0: not started, 1: left done, 2: right done
+        nodes = [len(kinds) - 1]
+        stages = [0]
+        res = None
+        while nodes:
+            i = nodes[-1]
+            kind = kinds[i]
+            if kind == COMPARISION:
+                res = self._comparision(i, data)
+            elif kind == UNKNOWN:
+                res = None
+            elif stages[-1] == 0:
+                stages[-1] = 1
+                nodes.append(left[i])
+                stages.append(0)
+                continue
+            elif stages[-1] == 1 and ((not res) if kind == OR else res):
+                stages[-1] = 2
+                nodes.append(right[i])
+                stages.append(0)
+                continue
+            nodes.pop()
+            stages.pop()
+        return res
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (ValueError, builtins.TypeError):
+        return None
@@ -0,0 +1,392 @@
+"""
+Shared-predicate index over a set of rules (a small discrimination network)
+
+Identical comparision nodes across all indexed rules are stored once. For
+each record every unique predicate is decided once: equality predicates
+through per-attribute hash tables, range predicates through sorted
+thresholds and bisect. Rule outcomes are then derived from the set of true
+predicates. Rules only combine predicates with AND/OR, so each rule has a
+set of trigger predicates (the union over OR operands, the most selective
+operand of an AND) of which one must hold for the rule to hold; `match`
+only evaluates the rules triggered by the record.
+"""
+
+import builtins
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from threading import RLock
+
+from globalDS import catalog
+from rule_engine.parser import NUMBER, Node
+from rule_engine.compiler import CompiledRule, operands
+from rule_engine.error import TypeError, InsufficientDataError
+
+RANGE_OPS = ('>', '>=', '<', '<=')
+# rough odds of a predicate holding, used to pick which predicates trigger a rule
+TRIGGER_WEIGHTS = {'=': 1, '>': 10, '>=': 10, '<': 10, '<=': 10, '!=': 50}
+
+
+class _Predicate(object):
+    """ One unique comparision shared by several rules """
+    __slots__ = ('pid', 'key', 'attr', 'op', 'const', 'ref', 'rules', 'triggers')
+
+    def __init__(self, pid, key, attr, op, const, ref):
+        self.pid = pid
+        self.key = key
+        self.attr = attr
+        self.op = op
+        self.const = const
+        self.ref = ref
+        self.rules = set()      # rules using the predicate
+        self.triggers = set()   # rules to evaluate when the predicate holds
+
+
+class _AttributeIndex(object):
+    """ Predicates on one attribute, organised for lookup by value """
+    def __init__(self, number: bool):
+        self.number = number
+        self.eq = defaultdict(set)      # const -> pids of '='
+        self.ne = defaultdict(set)      # const -> pids of '!='
+        self.ranges = {op: ([], []) for op in RANGE_OPS}   # op -> (sorted consts, pids)
+        self.pids = set()               # every predicate on the attribute
+
+    def add(self, pred: _Predicate):
+        self.pids.add(pred.pid)
+        if pred.op == '=':
+            self.eq[pred.const].add(pred.pid)
+        elif pred.op == '!=':
+            self.ne[pred.const].add(pred.pid)
+        elif pred.op in RANGE_OPS and self.number:
+            consts, pids = self.ranges[pred.op]
+            i = bisect_right(consts, pred.const)
+            consts.insert(i, pred.const)
+            pids.insert(i, pred.pid)
+        # ordering on strings is never true, nothing to index
+
+    def remove(self, pred: _Predicate):
+        self.pids.discard(pred.pid)
+        if pred.op in ('=', '!='):
+            table = self.eq if pred.op == '=' else self.ne
+            table[pred.const].discard(pred.pid)
+            if not table[pred.const]:
+                del table[pred.const]
+        elif pred.op in RANGE_OPS and self.number:
+            consts, pids = self.ranges[pred.op]
+            i = bisect_left(consts, pred.const)
+            while pids[i] != pred.pid:
+                i += 1
+            del consts[i]
+            del pids[i]
+
+    def matches(self, val, true: set):
+        """ Add the pids of all predicates that hold for `val` to `true` """
+        try:
+            equal = self.eq.get(val)
+        except builtins.TypeError:
+            # unhashable values equal none of the constants
+            for pids in self.ne.values():
+                true.update(pids)
+            return
+        if equal:
+            true.update(equal)
+        for const, pids in self.ne.items():
+            if const != val:
+                true.update(pids)
+        if self.number and val == val:     # every ordering with NaN is false
+            consts, pids = self.ranges['>']     # const < val
+            true.update(pids[:bisect_left(consts, val)])
+            consts, pids = self.ranges['>=']    # const <= val
+            true.update(pids[:bisect_right(consts, val)])
+            consts, pids = self.ranges['<']     # const > val
+            true.update(pids[bisect_right(consts, val):])
+            consts, pids = self.ranges['<=']    # const >= val
+            true.update(pids[bisect_left(consts, val):])
+
+
+class _IndexedRule(object):
+    """ A rule expressed over shared predicates, `compiled` is the CompiledRule of a direct one """
+    __slots__ = ('name', 'seq', 'pids', 'triggers', 'evaluate', 'direct', 'compiled')
+
+    def __init__(self, name, seq, pids, triggers, evaluate, direct, compiled=None):
+        self.name = name
+        self.seq = seq
+        self.pids = pids
+        self.triggers = triggers
+        self.evaluate = evaluate
+        self.direct = direct
+        self.compiled = compiled
+
+
+class PredicateIndex(object):
+    """ Rules indexed by their deduplicated comparision predicates
+
+    Rules holding leaves that can't be indexed (e.g. a numeric attribute with a
+    non-numeric constant) are kept as plain compiled rules and always evaluated.
+    """
+    def __init__(self):
+        self.predicates = {}    # (attr, op, const) -> _Predicate
+        self.by_pid = {}        # pid -> _Predicate
+        self.attrs = {}         # attr -> _AttributeIndex
+        self.rules = {}         # rule name -> _IndexedRule
+        self.direct = set()     # names of rules evaluated without the index
+        self._next_pid = 0
+        self._next_seq = 0
+        self._lock = RLock()
+
+    def _key(self, node: Node):
+        """ Dedup key of a comparision node, None if it can't be indexed """
+        attr = node.left
+        const = node.right
+        if catalog.register(attr, node.attrType) == NUMBER:
+            try:
+                const = float(const)
+            except (ValueError, builtins.TypeError):
+                return None
+        try:
+            hash(const)
+        except Exception:
+            return None
+        if node.op not in RANGE_OPS and node.op not in ('=', '!='):
+            return None
+        return (attr, node.op, const)
+
+    def _intern(self, key, ref) -> _Predicate:
+        pred = self.predicates.get(key)
+        if pred is None:
+            attr, op, const = key
+            pred = _Predicate(self._next_pid, key, attr, op, const, ref)
+            self._next_pid += 1
+            self.predicates[key] = pred
+            self.by_pid[pred.pid] = pred
+            if attr not in self.attrs:
+                self.attrs[attr] = _AttributeIndex(number=catalog[attr] == NUMBER)
+            self.attrs[attr].add(pred)
+        return pred
+
+    def _fail(self, data, pid):
+        """ Raise the error the interpreter would raise on predicate `pid` """
+        pred = self.by_pid[pid]
+        if pred.attr not in data:
+            raise InsufficientDataError(pred.attr)
+        val = data[pred.attr]
+        if isinstance(val, (int, float)):
+            float(val)      # raises the OverflowError of numbers beyond the float range
+        raise TypeError(attr=pred.attr, val=val, ref=pred.ref)
+
+    def _compile(self, node: Node, pids: set):
+        """
+        Generate a function rule(T, F, D) over the true pids T, the attributes
+        F holding values of the wrong type, and the record D.
+        Adds the pids of the rule's predicates to `pids`.
+
+        Returns:
+            (function, triggers), or None if a leaf can't be indexed. The rule
+            can only hold if one of its trigger predicates holds.
+        """
+        namespace = {'_fail': self._fail}
+        exprs = {}
+        triggers = {}   # id(node) -> (weight, pids), one of these pids must hold for the node to hold
+        stack = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current.type == "comparision":
+                key = self._key(current)
+                if key is None:
+                    return None
+                pred = self._intern(key, current.right)
+                pids.add(pred.pid)
+                exprs[id(current)] = "({pid} in T or ({attr!r} not in D or {attr!r} in F) and _fail(D, {pid}))".format(
+                    pid=pred.pid, attr=pred.attr)
+                if pred.op in RANGE_OPS and not self.attrs[pred.attr].number:
+                    triggers[id(current)] = (0, frozenset())   # never holds
+                else:
+                    triggers[id(current)] = (TRIGGER_WEIGHTS[pred.op], frozenset((pred.pid,)))
+            elif current.type != "operator":
+                exprs[id(current)] = "None"
+                triggers[id(current)] = (0, frozenset())
+            elif expanded:
+                children = operands(current)
+                joiner = " and " if current.op == "AND" else " or "
+                exprs[id(current)] = "({})".format(joiner.join(exprs[id(child)] for child in children))
+                if current.op == "AND":
+                    # any single conjunct will do, pick the most selective one
+                    triggers[id(current)] = min((triggers[id(child)] for child in children), key=lambda t: t[0])
+                else:
+                    union = frozenset().union(*(triggers[id(child)][1] for child in children))
+                    triggers[id(current)] = (sum(triggers[id(child)][0] for child in children), union)
+            else:
+                stack.append((current, True))
+                stack.extend((child, False) for child in operands(current))
+
+        exec(compile("def rule(T, F, D):\n    return {}\n".format(exprs[id(node)]), "<rule>", "exec"), namespace)
+        return namespace['rule'], triggers[id(node)][1]
+
+    def add(self, rule_name: str, node: Node, patch: bool = False):
+        """
+        Index `node` under `rule_name`, replacing any previous version.
+
+        The new version's predicates are interned before the previous version
+        is dropped, so the predicates both share keep their ids and only the
+        changed ones are added to or removed from the attribute indexes.
+        With `patch`, `node` is a patched version of the previous one, and a
+        rule that can't be indexed is compiled incrementally from the previous
+        version (see `CompiledRule.patch`).
+        """
+        with self._lock:
+            pids = set()
+            compiled = None
+            if node is not None:
+                try:
+                    compiled = self._compile(node, pids)
+                except (RecursionError, MemoryError, SyntaxError):
+                    compiled = None
+            previous = self._unlink(rule_name)
+            seq = self._next_seq
+            self._next_seq += 1
+            if compiled is None:
+                if patch and previous is not None and previous.compiled is not None:
+                    rule = previous.compiled.patch(node)
+                else:
+                    rule = CompiledRule(node)
+                self.rules[rule_name] = _IndexedRule(rule_name, seq, set(), frozenset(),
+                                                     lambda T, F, D: rule.evaluate(D), True, rule)
+                self.direct.add(rule_name)
+                self._collect(pids)
+            else:
+                func, triggers = compiled
+                for pid in pids:
+                    self.by_pid[pid].rules.add(rule_name)
+                for pid in triggers:
+                    self.by_pid[pid].triggers.add(rule_name)
+                self.rules[rule_name] = _IndexedRule(rule_name, seq, pids, triggers, func, False)
+            if previous is not None:
+                self._collect(previous.pids)
+
+    def remove(self, rule_name: str):
+        """
+        Drop `rule_name`, and the predicates no other rule uses.
+        """
+        with self._lock:
+            rule = self._unlink(rule_name)
+            if rule is not None:
+                self._collect(rule.pids)
+
+    def _unlink(self, rule_name: str):
+        """ Take `rule_name` out of the index, leaving its predicates in place """
+        rule = self.rules.pop(rule_name, None)
+        if rule is None:
+            return None
+        self.direct.discard(rule_name)
+        for pid in rule.pids:
+            self.by_pid[pid].rules.discard(rule_name)
+        for pid in rule.triggers:
+            self.by_pid[pid].triggers.discard(rule_name)
+        return rule
+
+    def _collect(self, pids):
+        """ Drop the predicates among `pids` not referenced by any rule """
+        for pid in pids:
+            pred = self.by_pid[pid]
+            if pred.rules:
+                continue
+            del self.predicates[pred.key]
+            del self.by_pid[pid]
+            self.attrs[pred.attr].remove(pred)
+            if not self.attrs[pred.attr].pids:
+                del self.attrs[pred.attr]
+
+    def evaluate_predicates(self, data):
+        """
+        Decide every indexed predicate once for the record.
+
+        Returns:
+            (true, bad): pids of the predicates that hold, and the numeric
+            attributes whose value in `data` is not a number or does not fit
+            in a float. Every predicate on a bad attribute raises, as in the interpreter.
+        """
+        true, bad = set(), set()
+        attrs = self.attrs
+        for attr, val in data.items():
+            index = attrs.get(attr)
+            if index is None:
+                continue
+            if index.number:
+                if not isinstance(val, (int, float)):
+                    bad.add(attr)
+                    continue
+                try:
+                    val = float(val)
+                except (OverflowError, ValueError):
+                    bad.add(attr)
+                    continue
+            index.matches(val, true)
+        return true, bad
+
+    def evaluate(self, data, rule_names=None) -> dict:
+        """
+        Evaluate the named rules (all rules by default) against one record.
+
+        Returns:
+            Dict of rule name -> result, or the exception raised while evaluating that rule.
+        Raises:
+            KeyError: if one of `rule_names` is not indexed.
+        """
+        with self._lock:
+            rules = list(self.rules.values()) if rule_names is None else [self.rules[name] for name in rule_names]
+            true, bad = self.evaluate_predicates(data)
+
+        results = {}
+        for rule in rules:
+            try:
+                results[rule.name] = rule.evaluate(true, bad, data)
+            except Exception as e:
+                results[rule.name] = e
+        return results
+
+    def _failing(self, data, bad) -> set:
+        """ Names of the rules with a predicate that raises on the record: its attribute is missing or bad """
+        names = set()
+        for attr, index in self.attrs.items():
+            if attr in bad or attr not in data:
+                for pid in index.pids:
+                    names.update(self.by_pid[pid].rules)
+        return names
+
+    def match(self, data, rule_names=None, errors: dict = None) -> list[str]:
+        """
+        Names of the rules (among `rule_names`, or all rules) that hold for one record.
+
+        Only rules triggered by a true predicate are evaluated.
+        Rules that fail to evaluate are not matches, when `errors` is given the
+        rules that may fail are evaluated too and their exceptions added to it,
+        giving the errors `evaluate` would return.
+        """
+        with self._lock:
+            if rule_names is not None:
+                selected = [self.rules[name] for name in rule_names]
+            true, bad = self.evaluate_predicates(data)
+            failing = self._failing(data, bad) if errors is not None else set()
+            if rule_names is None:
+                names = set(self.direct) | failing
+                for pid in true:
+                    names.update(self.by_pid[pid].triggers)
+                candidates = sorted((self.rules[name] for name in names), key=lambda rule: rule.seq)
+            else:
+                candidates = [rule for rule in selected
+                              if rule.direct or not rule.triggers.isdisjoint(true) or rule.name in failing]
+
+        matches = []
+        for rule in candidates:
+            try:
+                if rule.evaluate(true, bad, data):
+                    matches.append(rule.name)
+            except Exception as e:
+                if errors is not None:
+                    errors[rule.name] = e
+        return matches
+
+    def __contains__(self, rule_name):
+        return rule_name in self.rules
+
+    def __len__(self):
+        return len(self.rules)
@@ -0,0 +1,110 @@
+"""
+JSON decoding without recursion
+
+`json.loads` recurses once per nesting level and raises RecursionError on
+documents nested deeper than the recursion limit, such as the JSON of a rule
+chaining thousands of comparisions (a left-deep tree of operators). `loads`
+here decodes the same documents with an explicit stack of open containers,
+strings are still scanned by the json module's C scanner.
+"""
+
+import re
+from json import JSONDecodeError
+from json.decoder import scanstring
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# keys and strings without escapes, the usual case, are matched whole
+_SIMPLE_KEY = re.compile(r'"([^"\\\x00-\x1f]*)"[ \t\n\r]*:[ \t\n\r]*')
+_SIMPLE_STRING = re.compile(r'"([^"\\\x00-\x1f]*)"')
+_NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+_CONSTANTS = (('true', True), ('false', False), ('null', None),
+              ('NaN', float('nan')), ('Infinity', float('inf')), ('-Infinity', float('-inf')))
+
+
+def _key(text: str, pos: int) -> tuple:
+    """ (key, position of its value) for the object member starting at `pos` """
+    match = _SIMPLE_KEY.match(text, pos)
+    if match is not None:
+        return match.group(1), match.end()
+    if not text.startswith('"', pos):
+        raise JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+    key, pos = scanstring(text, pos + 1)
+    pos = _WHITESPACE.match(text, pos).end()
+    if not text.startswith(':', pos):
+        raise JSONDecodeError("Expecting ':' delimiter", text, pos)
+    return key, _WHITESPACE.match(text, pos + 1).end()
+
+
+def loads(text: str, object_hook=None):
+    """
+    Decode a JSON document like `json.loads(text, object_hook=object_hook)`.
+
+    Raises:
+        json.JSONDecodeError: for invalid JSON.
+    """
+    skip = _WHITESPACE.match
+    stack = []      # open containers, as (container, key of the value being read, None in arrays)
+    end = len(text)
+    pos = skip(text, 0).end()
+    while True:
+        # a value starts at pos
+        char = text[pos:pos + 1]
+        if char == '{':
+            pos = skip(text, pos + 1).end()
+            if not text.startswith('}', pos):
+                key, pos = _key(text, pos)
+                stack.append(({}, key))
+                continue
+            value = object_hook({}) if object_hook is not None else {}
+            pos += 1
+        elif char == '[':
+            pos = skip(text, pos + 1).end()
+            if not text.startswith(']', pos):
+                stack.append(([], None))
+                continue
+            value = []
+            pos += 1
+        elif char == '"':
+            match = _SIMPLE_STRING.match(text, pos)
+            if match is not None:
+                value, pos = match.group(1), match.end()
+            else:
+                value, pos = scanstring(text, pos + 1)
+        else:
+            match = _NUMBER.match(text, pos)
+            if match is not None:
+                integer, fraction, exponent = match.groups()
+                value = float(match.group()) if fraction or exponent else int(integer)
+                pos = match.end()
+            else:
+                for literal, value in _CONSTANTS:
+                    if text.startswith(literal, pos):
+                        pos += len(literal)
+                        break
+                else:
+                    raise JSONDecodeError("Expecting value", text, pos)
+
+        # add the value to its container, closing every container that ends after it
+        while True:
+            pos = skip(text, pos).end()
+            if not stack:
+                if pos != end:
+                    raise JSONDecodeError("Extra data", text, pos)
+                return value
+            container, key = stack[-1]
+            if key is None:
+                container.append(value)
+            else:
+                container[key] = value
+            char = text[pos:pos + 1]
+            if char == ',':
+                pos = skip(text, pos + 1).end()
+                if key is not None:
+                    key, pos = _key(text, pos)
+                    stack[-1] = (container, key)
+                break
+            if char != (']' if key is None else '}'):
+                raise JSONDecodeError("Expecting ',' delimiter", text, pos)
+            stack.pop()
+            pos += 1
+            value = object_hook(container) if key is not None and object_hook is not None else container
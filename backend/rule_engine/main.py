@@ -4,22 +4,47 @@ FASTAPI
 API endpoints
 
 """
+import os
 import json
+import time
+from contextlib import asynccontextmanager
+from itertools import islice
 from globalDS import catalog
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation
 
-from rule_engine import models, database
-from rule_engine.abstract_tree import AST, ast_to_json, json_to_ast
+from rule_engine import models, database, codec, streaming, bulk, metrics
+from rule_engine.abstract_tree import AST, ast_to_json, ast_to_rule
+from rule_engine.adaptive import AdaptiveRule
+from rule_engine.cache import RuleCache
+from rule_engine.memo import ParseMemo, attribute_types, content_hash
+from rule_engine.optimizer import optimize
+from rule_engine.parser import Node
+from rule_engine.patch import Patch, apply_patches
+from rule_engine.profile import RuleProfile
+from rule_engine.references import REFERENCE, references, resolve
+from rule_engine.ruleset import RuleSet
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the tables when running on the async engine, and load the attribute catalog.
+    """
+    await models.init_models()
+    async for db in init_db():
+        await sync_catalog(db, force=True)
+    yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # List of allowed origins (adjust as needed)
 origins = [
@@ -39,16 +64,57 @@ class CreateParam(BaseModel):
     """Pydantic model for an create request."""
     name: str
     rule: str
+    optimize: bool = False
 
 class CombineParam(BaseModel):
     """Pydantic model for an combine request."""
-    rules: list[str]
+    rules: list[str] = []
+    rule_names: list[str] = []
     operator: str = "AND"
+    optimize: bool = True
+
+class PatchOp(BaseModel):
+    """Pydantic model for one edit of a rule AST, see `rule_engine.patch`."""
+    path: str = ""
+    action: str
+    value: str | int | float
+
+class PatchParam(BaseModel):
+    """Pydantic model for a patch request."""
+    name: str
+    patches: list[PatchOp]
 
 class EvaluateParam(BaseModel):
     """Pydantic model for an evaluation request."""
     rule_name: str
     data: dict
+    strict: bool = False
+    profile: bool = False
+
+class EvaluateBatchParam(BaseModel):
+    """Pydantic model for a batch evaluation request."""
+    rule_name: str
+    data: list[dict]
+    strict: bool = False
+    profile: bool = False
+
+class EvaluateRulesParam(BaseModel):
+    """Pydantic model for a multi-rule evaluation request."""
+    data: dict
+    rule_names: list[str] = None
+
+class UploadStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body is produced while reading the request body.
+
+    The default response listens for client disconnects by reading from the
+    request too, racing the body iterator for the uploaded chunks. Reading the
+    request stream already raises on disconnect, so only the body is streamed.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
 
 class ASTNode(BaseModel):
     """Pydantic model for an AST node."""
@@ -58,30 +124,264 @@ class ASTNode(BaseModel):
     right: dict
     attrType: str = None
 
-def init_db():
+async def init_db():
     """
     Dependency to provide the database session.
 
     Yields:
-        Session: SQLAlchemy session object. The session is closed once the request lifecycle is complete.
+        Session: SQLAlchemy session object, an AsyncSession when DB_ASYNC is set.
+        The session is closed once the request lifecycle is complete.
     """
-    db = models.SessionLocal()
+    if models.AsyncSessionLocal is not None:
+        async with models.AsyncSessionLocal() as db:
+            yield db
+        return
 
+    db = models.SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
+
+async def run_db(db, func, **kwargs):
+    """
+    Run a `database` function without blocking the event loop.
+
+    On an AsyncSession the function runs through `run_sync` on the async driver,
+    on a plain Session it runs in the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(lambda session: func(session, **kwargs))
+    return await run_in_threadpool(func, db, **kwargs)
+
+async def stream_db(func, batch_size: int = 1000, **kwargs):
+    """
+    Iterate over the rows a `database` generator yields, in lists of up to `batch_size`.
+
+    The generator runs on a session of its own, an AsyncSession when DB_ASYNC is set,
+    which stays open for as long as the iteration lasts. Each batch is fetched
+    through `run_db`, so reading the rows never blocks the event loop.
+    """
+    db = models.AsyncSessionLocal() if models.AsyncSessionLocal is not None else models.SessionLocal()
+    rows = None
+
+    def fetch(session):
+        nonlocal rows
+        if rows is None:
+            rows = iter(func(session, **kwargs))
+        return list(islice(rows, batch_size))
+    try:
+        while True:
+            batch = await run_db(db, fetch)
+            if not batch:
+                break
+            yield batch
+    finally:
+        if isinstance(db, AsyncSession):
+            await db.close()
+        else:
+            await run_in_threadpool(db.close)
+
+def is_unique_violation(e: IntegrityError) -> bool:
+    """
+    Whether an IntegrityError comes from a unique constraint, for any of the supported drivers.
+    """
+    if isinstance(e.orig, UniqueViolation):
+        return True
+    if getattr(e.orig, 'sqlstate', None) == '23505' or getattr(e.orig, 'pgcode', None) == '23505':
+        return True
+    return 'UNIQUE constraint failed' in str(e.orig)
+
+# Seconds the catalog loaded in this worker is used without checking for attributes added by other workers
+CATALOG_SYNC_INTERVAL = float(os.getenv('CATALOG_SYNC_INTERVAL', 1))
+catalog_checked_at = None
+
+async def sync_catalog(db, force: bool = False):
+    """
+    Persist the attributes registered by this worker and load the ones added by other workers.
+
+    Unless `force` is set, nothing is queried while no attribute is pending and
+    the stored catalog was checked less than CATALOG_SYNC_INTERVAL seconds ago.
+    """
+    global catalog_checked_at
+    now = time.monotonic()
+    if not force and catalog_checked_at is not None and now - catalog_checked_at < CATALOG_SYNC_INTERVAL \
+            and not catalog.pending():
+        return
+    await run_db(db, database.sync_catalog, catalog=catalog)
+    catalog_checked_at = now
+
+def conflicting_attribute(attrs) -> str:
+    """ First of the (attr, type) pairs whose type differs from the catalog's, None if there is none """
+    for attr, attr_type in attrs:
+        if catalog.get(attr) != attr_type:
+            return attr
+    return None
+
+async def store_catalog(db, node):
+    """
+    Persist the attributes of a rule about to be stored, before the rule itself.
+    Another worker may have stored one of them first with a different type, which then wins.
+
+    Raises:
+        Exception: If an attribute of the rule has another type in the stored catalog, like the parser raises.
+    """
+    await sync_catalog(db, force=True)
+    attr = conflicting_attribute(attribute_types(node))
+    if attr is not None:
+        raise Exception("TypeError: different type of value for same attribute: {}".format(attr))
+
+# Parsed rules keyed by normalized rule text, shared by every endpoint parsing rule strings
+parse_memo = ParseMemo(maxsize=int(os.getenv('PARSE_MEMO_SIZE', 4096)))
 
 # AST object for executing methods
-ast = AST()
+ast = AST(memo=parse_memo)
+
+def build_rule(rule: str, simplify: bool = False) -> tuple:
+    """
+    Parse a rule string, simplifying the AST when asked, and serialize it for storage.
+    CPU bound, the endpoints run it in the threadpool.
+
+    Returns:
+        Tuple: The AST, its content hash, its JSON and its binary encoding (None if it can't be encoded).
+    """
+    entry = parse_memo.lookup(rule)
+    rule_ast, rule_hash = entry.node, entry.rule_hash
+    if simplify:
+        rule_ast = optimize(rule_ast)
+        rule_hash = content_hash(rule_ast)
+    return rule_ast, rule_hash, ast_to_json(rule_ast), codec.encode_or_none(rule_ast)
+
+# Seconds a worker trusts its in-memory rules before checking the database again
+RULE_CACHE_TTL = float(os.getenv('RULE_CACHE_TTL')) if os.getenv('RULE_CACHE_TTL') else None
+
+# Ready-to-evaluate rules, keyed by rule name
+rule_cache = RuleCache(maxsize=int(os.getenv('RULE_CACHE_SIZE', 1024)), ttl=RULE_CACHE_TTL)
+
+async def load_rule(db: Session, rule_name: str, chain: tuple = ()) -> AdaptiveRule:
+    """
+    Fetch a compiled rule from the cache, falling back to the database.
+    Rules are compiled as AdaptiveRule, learning the order to evaluate their operands in.
+
+    Returns:
+        AdaptiveRule: The compiled rule, or None if the rule does not exist.
+    Raises:
+        ValueError: If a rule it references can't be resolved (see `resolve_rule`).
+    """
+    # taken before reading the row, an invalidation while the rule loads keeps it out of the cache
+    generation = rule_cache.generation(rule_name)
+    compiled_rule = rule_cache.get(rule_name)
+    if compiled_rule is None:
+        rule = await run_db(db, database.get_rule, rule_name=rule_name)
+        if rule is None:
+            return None
+        await sync_catalog(db)
+        node = await resolve_rule(db, database.load_ast(rule), chain + (rule_name,))
+        compiled_rule = AdaptiveRule(node)
+        rule_cache.put(rule_name, compiled_rule, generation=generation)
+    return compiled_rule
+
+async def resolve_rule(db: Session, node, chain: tuple = ()):
+    """
+    Replace the references of an AST by the ASTs of the rules they name (see `rule_engine.references`).
+    Referenced rules come from `load_rule`, so their ASTs are shared with the compiled-rule cache.
+
+    Args:
+        chain (tuple): Names of the rules being resolved, which the AST must not reference.
+
+    Raises:
+        ValueError: If a referenced rule doesn't exist, or references lead back to a rule of `chain`.
+    """
+    resolved = {}
+    for ref_name in references(node):
+        if ref_name in chain:
+            raise ValueError("Circular reference: @{}".format(" -> @".join(chain + (ref_name,))))
+        compiled_rule = await load_rule(db, ref_name, chain)
+        if compiled_rule is None:
+            raise ValueError(f"Referenced rule not found: {ref_name}")
+        resolved[ref_name] = compiled_rule.node
+    return resolve(node, resolved.__getitem__) if resolved else node
+
+async def check_references(db: Session, rule_name: str, node) -> list[str]:
+    """
+    Names of the rules an AST about to be stored as `rule_name` references.
+
+    Raises:
+        ValueError: If one of them references `rule_name`, directly or not.
+    """
+    ref_names = references(node)
+    if ref_names:
+        dependents = set(await run_db(db, database.get_dependents, rule_name=rule_name))
+        for ref_name in ref_names:
+            if ref_name == rule_name or ref_name in dependents:
+                raise ValueError(f"Circular reference: @{ref_name} references @{rule_name}")
+    return ref_names
+
+async def refresh_dependents(db: Session, rule_name: str):
+    """
+    Recompile the rules referencing `rule_name`, directly or not, after it changed.
+    Cached ones are dropped and compiled again on their next use, the rule set is updated right away.
+    """
+    dependents = await run_db(db, database.get_dependents, rule_name=rule_name)
+    for name in dependents:
+        rule_cache.invalidate(name)
+    if rule_set.loaded:
+        for name in dependents:
+            compiled_rule = await load_rule(db, name)
+            if compiled_rule is not None:
+                rule_set.add(name, compiled_rule.node)
+
+# Every stored rule compiled in memory, for multi-rule evaluation
+rule_set = RuleSet(ttl=RULE_CACHE_TTL)
+
+async def load_rule_set(db: Session) -> RuleSet:
+    """
+    Fill the in-memory rule set from the database on first use.
+    Afterwards it is kept in sync by this worker's create, modify and delete endpoints,
+    and refreshed once expired (see `RULE_CACHE_TTL`) with the changes of other workers.
+    """
+    if not rule_set.loaded:
+        await sync_catalog(db)
+        for rule in await run_db(db, database.get_all_rules):
+            node = database.load_ast(rule)
+            if references(node):
+                node = (await load_rule(db, rule.rule_name)).node
+            rule_set.add(rule.rule_name, node, rule.rule_hash)
+        rule_set.loaded = True
+    elif rule_set.expired():
+        await refresh_rule_set(db)
+    return rule_set
+
+async def refresh_rule_set(db: Session):
+    """
+    Bring the rule set up to date with the database, reloading only the rules
+    whose stored content hash differs from the one they were added with.
+    Rules without a stored hash are always reloaded.
+    """
+    await sync_catalog(db)
+    hashes = await run_db(db, database.get_rule_hashes)
+    for name in [name for name in rule_set.rules if name not in hashes]:
+        rule_cache.invalidate(name)
+        rule_set.remove(name)
+    changed = [name for name, rule_hash in hashes.items()
+               if rule_hash is None or rule_set.hashes.get(name, '') != rule_hash]
+    for rule in await run_db(db, database.get_rules, rule_names=changed):
+        rule_cache.invalidate(rule.rule_name)
+        node = database.load_ast(rule)
+        if references(node):
+            node = (await load_rule(db, rule.rule_name)).node
+        rule_set.add(rule.rule_name, node, rule.rule_hash)
+    for name in changed:
+        await refresh_dependents(db, name)
+    rule_set.loaded = True
 
 @app.post("/create_rule", response_model=ASTNode)
-def create_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
+async def create_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
     """
     Create a new rule and store it in the database.
 
     Args:
-        rule_string: The rule string and its associated name.
+        rule_string: The rule string and its associated name, `optimize` simplifies the AST before storing it.
         db (Session): Database session for storing the rule.
 
     Returns:
@@ -90,16 +390,24 @@ def create_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
         HTTPException: If rule parsing fails or any error occurs, returns a 400 error with the failure details.
     """
     try:
-        rule_ast = ast.create_rule(rule_string.rule)
-        rule_json = ast_to_json(rule_ast)
-
-        database.create_rule(db,rule_name=rule_string.name, rule_str=rule_string.rule, rule_json=rule_json) 
+        await sync_catalog(db)
+        rule_ast, rule_hash, rule_json, rule_bin = await run_in_threadpool(build_rule, rule_string.rule,
+                                                                            rule_string.optimize)
+        ref_names = await check_references(db, rule_string.name, rule_ast)
+        resolved_ast = await resolve_rule(db, rule_ast, (rule_string.name,))
+        await store_catalog(db, rule_ast)
+
+        await run_db(db, database.create_rule, rule_name=rule_string.name, rule_str=rule_string.rule,
+                     rule_json=rule_json, rule_bin=rule_bin, rule_hash=rule_hash, references=ref_names)
+        if rule_set.loaded:
+            await run_in_threadpool(rule_set.add, rule_string.name, resolved_ast, rule_hash)
 
         rule_data = json.loads(rule_json)
         return JSONResponse(rule_data)
     # Handle specific IntegrityError caused by UniqueViolation
     except IntegrityError as e:
-        if isinstance(e.orig, UniqueViolation):
+        metrics.count_error(e)
+        if is_unique_violation(e):
             # If the error is a UniqueViolation, return a proper HTTP response
             raise HTTPException(
                 status_code=400,
@@ -108,39 +416,165 @@ def create_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
         else:
             raise HTTPException(status_code=400, detail="Database error occurred.")
     except Exception as e:
+        metrics.count_error(e)
         raise HTTPException(status_code=400, detail=str(e))
 
+async def profile_rule(db: Session, rule_name: str, compiled_rule: AdaptiveRule, strict: bool) -> RuleProfile:
+    """
+    RuleProfile of a rule shaped like its stored AST: each reference it holds is
+    profiled as one node, evaluating the referenced rule from `load_rule`.
+    """
+    node = compiled_rule.node
+    ref_names = []
+    stored = await run_db(db, database.get_rule, rule_name=rule_name)
+    if stored is not None and stored.rule_bin is None:
+        # only rules stored as JSON can hold references (see `codec`)
+        stored_ast = database.load_ast(stored)
+        ref_names = references(stored_ast)
+        if ref_names:
+            node = stored_ast
+    resolved = {}
+    for ref_name in ref_names:
+        ref_rule = await load_rule(db, ref_name)
+        if ref_rule is None:
+            raise HTTPException(status_code=400, detail=f"Referenced rule not found: {ref_name}")
+        resolved[ref_name] = ref_rule.node
+    return RuleProfile(node, strict=strict, references=resolved)
+
 @app.post("/evaluate_rule")
-def evaluate_rule(request: EvaluateParam, db: Session = Depends(init_db)):
+async def evaluate_rule(request: EvaluateParam, db: Session = Depends(init_db)):
     """
     Evaluate a stored rule using provided data.
 
     Args:
-        request (EvaluateParam): Contains the rule ID and the data to be evaluated.
+        request (EvaluateParam): Contains the rule ID and the data to be evaluated,
+            `strict` rejects data missing any attribute of the rule, or holding one of the wrong type,
+            `profile` traces the evaluation (see `rule_engine.profile`), much slower.
         db (Session): Database session to retrieve the stored rule.
 
     Returns:
-        Dict: Evaluation result (True/False based on rule evaluation).
+        Dict: Evaluation result (True/False based on rule evaluation), with `profile` the
+        AST in JSON format, every node holding its visits, short-circuit skips, time and result.
     Raises:
         HTTPException: 404 error if the rule is not found in the database.
     """
-    rule = database.get_rule(db, rule_name= request.rule_name)
-    if rule is None:
+    compiled_rule = await load_rule(db, rule_name= request.rule_name)
+    if compiled_rule is None:
         raise HTTPException(status_code=404, detail="Rule not found")
+    if request.profile:
+        profile = await profile_rule(db, request.rule_name, compiled_rule, request.strict)
+        try:
+            res = profile.evaluate(request.data)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail={"error": str(e), "profile": profile.to_dict()})
+        return {"result": res, "profile": profile.to_dict()}
     try:
-        rule_ast = json_to_ast(rule.rule_json)
-        res = rule_ast.evaluate(request.data) 
+        evaluate = compiled_rule.strict if request.strict else compiled_rule.evaluate
+        res = metrics.instrument(request.rule_name, evaluate)(request.data)
         return {"result": res}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/evaluate_rule_batch")
+async def evaluate_rule_batch(request: EvaluateBatchParam, db: Session = Depends(init_db)):
+    """
+    Evaluate a stored rule against a list of records.
+
+    Args:
+        request (EvaluateBatchParam): Contains the rule name and the records to be evaluated, and `strict` and `profile` as for /evaluate_rule.
+        db (Session): Database session to retrieve the stored rule.
+
+    Returns:
+        Dict: One entry per record, {"result": True/False} or {"error": message}, with `profile`
+        the AST in JSON format, every node holding its counters summed over the batch.
+    Raises:
+        HTTPException: 404 error if the rule is not found in the database.
+    """
+    compiled_rule = await load_rule(db, rule_name= request.rule_name)
+    if compiled_rule is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+    profile = None
+    if request.profile:
+        profile = await profile_rule(db, request.rule_name, compiled_rule, request.strict)
+        outcomes = await run_in_threadpool(profile.evaluate_many, request.data)
+    else:
+        start = time.perf_counter()
+        outcomes = await run_in_threadpool(compiled_rule.evaluate_many, request.data, strict=request.strict)
+        metrics.record_batch(request.rule_name, time.perf_counter() - start, outcomes)
+
+    results = []
+    for res in outcomes:
+        if isinstance(res, Exception):
+            results.append({"error": str(res)})
+        else:
+            results.append({"result": res})
+    if profile is not None:
+        return {"results": results, "profile": profile.to_dict()}
+    return {"results": results}
+
+@app.post("/evaluate_rule_stream")
+async def evaluate_rule_stream(rule_name: str, request: Request, format: str = None, db: Session = Depends(init_db)):
+    """
+    Evaluate a stored rule against a streamed upload of records.
+
+    Args:
+        rule_name (str): The name of the rule to evaluate.
+        request (Request): Chunked body of NDJSON records, or CSV with a header line.
+        format (str): "ndjson" or "csv", by default taken from the Content-Type (text/csv for CSV).
+        db (Session): Database session to retrieve the stored rule.
+
+    Returns:
+        StreamingResponse: NDJSON, one {"result": True/False} or {"error": message} line per record, in input order.
+    Raises:
+        HTTPException: 404 error if the rule is not found, 400 error for an unsupported format.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = streaming.CSV if content_type.startswith("text/csv") else streaming.NDJSON
+    if format not in streaming.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+
+    compiled_rule = await load_rule(db, rule_name= rule_name)
+    if compiled_rule is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+    results = streaming.evaluate_stream(request.stream(), metrics.instrument(rule_name, compiled_rule.evaluate), format)
+    return UploadStreamingResponse(results, media_type="application/x-ndjson")
+
+@app.post("/evaluate_rules")
+async def evaluate_rules(request: EvaluateRulesParam, db: Session = Depends(init_db)):
+    """
+    Evaluate all stored rules, or the named ones, against one record.
+
+    Args:
+        request (EvaluateRulesParam): Contains the data and optionally the rule names to evaluate.
+        db (Session): Database session to load the rules on first use.
+
+    Returns:
+        Dict: Names of the matching rules, and the error of each rule that failed to evaluate.
+    Raises:
+        HTTPException: 404 error if one of the named rules is not found.
+    """
+    rules = await load_rule_set(db)
+    missing = [name for name in request.rule_names or [] if name not in rules]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Rule not found: {', '.join(missing)}")
+
+    # only the rules the record triggers, or that may raise on it, are evaluated
+    start = time.perf_counter()
+    errors = {}
+    matches = await run_in_threadpool(rules.match, request.data, request.rule_names, errors)
+    metrics.record_rule_set(time.perf_counter() - start, request.rule_names or rules.rules, errors)
+    return {"matches": matches, "errors": {name: str(e) for name, e in errors.items()}}
+
 @app.post("/modify_rule", response_model=ASTNode)
-def modify_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
+async def modify_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
     """
     Modify an existing rule in the database.
 
     Args:
-        rule_string: The rule string and its associated name.
+        rule_string: The rule string and its associated name, `optimize` simplifies the AST before storing it.
         db (Session): Database session for modifying the rule.
 
     Returns:
@@ -149,45 +583,136 @@ def modify_rule(rule_string: CreateParam, db: Session = Depends(init_db)):
         HTTPException: If rule parsing fails or any error occurs, returns a 400 error with the failure details.
     """
     try:
-        rule_ast = ast.create_rule(rule_string.rule)
-        rule_json = ast_to_json(rule_ast)
-        database.modify_rule(db,rule_name=rule_string.name, new_rule_str=rule_string.rule, new_rule_json=rule_json)
+        await sync_catalog(db)
+        rule_ast, rule_hash, rule_json, rule_bin = await run_in_threadpool(build_rule, rule_string.rule,
+                                                                            rule_string.optimize)
+        ref_names = await check_references(db, rule_string.name, rule_ast)
+        resolved_ast = await resolve_rule(db, rule_ast, (rule_string.name,))
+        await store_catalog(db, rule_ast)
+        db_rule = await run_db(db, database.modify_rule, rule_name=rule_string.name, new_rule_str=rule_string.rule,
+                               new_rule_json=rule_json, new_rule_bin=rule_bin,
+                               new_rule_hash=rule_hash, new_references=ref_names)
+        rule_cache.invalidate(rule_string.name)
+        if db_rule is not None:
+            if rule_set.loaded:
+                await run_in_threadpool(rule_set.add, rule_string.name, resolved_ast, rule_hash)
+            await refresh_dependents(db, rule_string.name)
         rule_data = json.loads(rule_json)
         return JSONResponse(rule_data)
     except Exception as e:
+        metrics.count_error(e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+def patched_rule(source, patches: list) -> tuple:
+    """
+    Apply patches to an AST and serialize the result for storage, CPU bound like `build_rule`.
+
+    Returns:
+        Tuple: The patched AST, its rule string, JSON, binary encoding and content hash.
+    """
+    rule_ast = apply_patches(source, patches)
+    return rule_ast, ast_to_rule(rule_ast), ast_to_json(rule_ast), codec.encode_or_none(rule_ast), content_hash(rule_ast)
+
+@app.post("/patch_rule", response_model=ASTNode)
+async def patch_rule(patch: PatchParam, db: Session = Depends(init_db)):
+    """
+    Edit parts of an existing rule in place of sending the whole rule again.
+
+    Each patch addresses a node by its path from the root ("/left/right"), and
+    sets its operator (`set_op`), sets the constant of a comparision (`set_value`)
+    or replaces the subtree with a rule string (`replace`). Only the changed
+    parts of the rule are recompiled, and the shared-predicate index keeps the
+    predicates the rule still uses.
+
+    Args:
+        patch (PatchParam): Name of the rule and the patches to apply, in order.
+        db (Session): Database session for modifying the rule.
+
+    Returns:
+        ASTNode: Root node of the patched AST in JSON format.
+    Raises:
+        HTTPException: 404 if the rule does not exist, 400 if a patch doesn't apply.
+    """
+    await sync_catalog(db)
+    # taken before reading the row, like `load_rule` does
+    generation = rule_cache.generation(patch.name)
+    stored = await run_db(db, database.get_rule, rule_name=patch.name)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    try:
+        # the stored rule is patched, the cache may predate a change made through another worker.
+        # When the cached rule is the stored one (same content hash, so it holds no resolved
+        # reference either), its AST is patched instead, so its untouched operands stay compiled.
+        compiled_rule = rule_cache.get(patch.name)
+        if compiled_rule is not None and stored.rule_hash is not None \
+                and stored.rule_hash == await run_in_threadpool(content_hash, compiled_rule.node):
+            source = compiled_rule.node
+        else:
+            compiled_rule = None
+            source = database.load_ast(stored)
+        rule_ast, rule_str, rule_json, rule_bin, rule_hash = await run_in_threadpool(
+            patched_rule, source, [Patch(op.path, op.action, op.value) for op in patch.patches])
+        ref_names = await check_references(db, patch.name, rule_ast)
+        resolved_ast = await resolve_rule(db, rule_ast, (patch.name,))
+        await store_catalog(db, rule_ast)
+        db_rule = await run_db(db, database.modify_rule, rule_name=patch.name, new_rule_str=rule_str,
+                               new_rule_json=rule_json, new_rule_bin=rule_bin,
+                               new_rule_hash=rule_hash, new_references=ref_names)
+    except Exception as e:
+        metrics.count_error(e)
         raise HTTPException(status_code=400, detail=str(e))
+    if db_rule is None:
+        rule_cache.invalidate(patch.name)
+        raise HTTPException(status_code=404, detail="Rule not found")
+    compile_rule = compiled_rule.patch if compiled_rule is not None else AdaptiveRule
+    rule_cache.put(patch.name, await run_in_threadpool(compile_rule, resolved_ast), generation=generation)
+    if rule_set.loaded:
+        await run_in_threadpool(rule_set.patch, patch.name, resolved_ast, rule_hash)
+    await refresh_dependents(db, patch.name)
+    return JSONResponse(json.loads(rule_json))
 
 @app.post("/combine_rules", response_model= ASTNode)
-def combine_rules(rule_list: CombineParam, db: Session = Depends(init_db)):
+async def combine_rules(rule_list: CombineParam, db: Session = Depends(init_db)):
     """
-    Combine multiple rule strings into a single AST.
+    Combine rule strings and stored rules into a single AST.
+
+    Stored rules, named in `rule_names` or referenced as `@rule_name` in a rule
+    string, are taken from the compiled-rule store without parsing them again.
 
     Args:
-        rule_list (CombineParam): List containing multiple rule strings.
+        rule_list (CombineParam): Rule strings, names of stored rules, the operator and whether to simplify the result.
 
     Returns:
-        ASTNode: Root node of the combined AST, joined by AND operators.
+        ASTNode: Root node of the combined AST, with the stored rules expanded, simplified unless `optimize` is false.
+    Raises:
+        HTTPException: 400 error if a rule fails to parse or a stored rule is not found.
     """
     try:
-        combined_ast = ast.combine_rules(rule_list.rules, rule_list.operator) 
-        rule_json = ast_to_json(combined_ast)
+        await sync_catalog(db)
+        nodes = await run_in_threadpool(lambda: [ast.parse(rule) for rule in rule_list.rules])
+        nodes.extend(Node(type=REFERENCE, left=name) for name in rule_list.rule_names)
+        nodes = [await resolve_rule(db, node) for node in nodes]
+        combined_ast = await run_in_threadpool(ast.combine, nodes, rule_list.operator, optimize=rule_list.optimize)
+        rule_json = await run_in_threadpool(ast_to_json, combined_ast)
         rule_data = json.loads(rule_json)
         return JSONResponse(rule_data)
     except Exception as e:
+        metrics.count_error(e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/get_catalog", response_model= dict)
-def get_catalog():
+async def get_catalog(db: Session = Depends(init_db)):
     """
     Send catalog containing attribute with their data type
 
     Returns:
         Catalog: Dictonary of {attr: data_type}
     """
-    return JSONResponse(catalog)
+    await sync_catalog(db)
+    return JSONResponse(catalog.snapshot())
 
 @app.get("/get_rule", response_model=ASTNode)
-def get_rule(rule_name: str, db: Session = Depends(init_db)):
+async def get_rule(rule_name: str, db: Session = Depends(init_db)):
     """
     Get a stored rule from the database.
 
@@ -200,24 +725,142 @@ def get_rule(rule_name: str, db: Session = Depends(init_db)):
     Raises:
         HTTPException: 404 error if the rule is not found in the database.
     """
-    rule = database.get_rule(db, rule_name=rule_name)
+    rule = await run_db(db, database.get_rule, rule_name=rule_name)
     if rule is None:
         raise HTTPException(status_code=404, detail="Rule not found")
     rule_data = json.loads(rule.rule_json)
     return JSONResponse(rule_data)
 
 @app.get("/get_all_rule_names", response_model= list[str])
-def get_all_rule_names(db: Session = Depends(init_db)):
+async def get_all_rule_names(db: Session = Depends(init_db)):
     """
     Retrieve all rule names from the database.
 
     Returns:
         List[str]: List of rule names.
     """
-    return JSONResponse(database.get_all_rule_names(db))
+    return JSONResponse(await run_db(db, database.get_all_rule_names))
+
+@app.get("/list_rules")
+async def list_rules(prefix: str = None, after: str = None, limit: int = None, fields: str = "name"):
+    """
+    Stream the stored rules by name, with only the requested fields.
+
+    Args:
+        prefix (str): Only rules whose name starts with it.
+        after (str): Only rules whose name sorts after it, pass the last name received to get the next page.
+        limit (int): Maximum number of rules, all matching rules by default.
+        fields (str): Comma separated fields among "name", "rule" (the rule string) and "json" (the AST).
+
+    Returns:
+        StreamingResponse: NDJSON, one object with the requested fields per rule, in name order.
+    Raises:
+        HTTPException: 400 error for an unknown field or a limit below 1.
+    """
+    fields = [field.strip() for field in fields.split(",") if field.strip()] or ["name"]
+    unknown = [field for field in fields if field not in database.LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    extra = [field for field in fields if field != "name"]
+
+    def line(row) -> str:
+        parts = ['"name": ' + json.dumps(row[0])]
+        for field, value in zip(extra, row[1:]):
+            # the stored AST is JSON already, it's written as is
+            parts.append(f'"{field}": ' + (value if field == "json" else json.dumps(value)))
+        return "{" + ", ".join(parts) + "}\n"
+
+    async def lines():
+        async for rows in stream_db(database.list_rules, fields=extra, prefix=prefix, after=after, limit=limit):
+            yield "".join(line(row) for row in rows)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/import_rules")
+async def import_rules(request: Request, upsert: bool = False, db: Session = Depends(init_db)):
+    """
+    Create many rules at once from an NDJSON upload, the format of `/export_rules`.
+
+    The body is read as it arrives and parsed `bulk.DEFAULT_BATCH_SIZE` lines at a time,
+    the rules are then stored in one transaction.
+
+    Args:
+        request (Request): Body of NDJSON lines, {"name": ..., "rule": ...} with an optional "optimize": true.
+        upsert (bool): Replace the rules that already exist, instead of reporting them as errors.
+        db (Session): Database session for storing the rules.
+
+    Returns:
+        Dict: Number of rules created and updated, and the line, name and error of each rule not imported.
+    Raises:
+        HTTPException: 400 error if storing the rules fails, nothing is imported then.
+    """
+    await sync_catalog(db)
+    splitter = streaming.LineSplitter()
+    results, batch, line_no = [], [], 1
+
+    async def parse(lines: list):
+        nonlocal line_no
+        results.extend(await run_in_threadpool(bulk.parse_rules, lines, start=line_no))
+        line_no += len(lines)
+
+    async for chunk in request.stream():
+        batch.extend(splitter.feed(chunk))
+        if len(batch) >= bulk.DEFAULT_BATCH_SIZE:
+            await parse(batch)
+            batch = []
+    batch.extend(splitter.flush())
+    if batch:
+        await parse(batch)
+    # the attributes are stored before the rules, which are checked against the types other workers stored first
+    await sync_catalog(db, force=True)
+    parsed, failed = [], []
+    for res in results:
+        attr = conflicting_attribute(res.attrs.items()) if isinstance(res, bulk.ParsedRule) else None
+        if attr is not None:
+            res = bulk.FailedRule(res.line, res.name, "TypeError: different type of value for same attribute: {}".format(attr))
+        if isinstance(res, bulk.ParsedRule):
+            parsed.append(res)
+        else:
+            failed.append(res)
+    try:
+        created, updated, rejected = await run_db(db, database.import_rules, rules=parsed, upsert=upsert)
+    except Exception as e:
+        metrics.count_error(e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    failed.extend(bulk.FailedRule(rule.line, rule.name, reason) for rule, reason in rejected)
+    for rule in created + updated:
+        rule_cache.invalidate(rule.name)
+        if rule_set.loaded:
+            rule_set.add(rule.name, database.load_ast(rule), rule.rule_hash)
+    for rule in updated:
+        await refresh_dependents(db, rule.name)
+    return {
+        "created": len(created),
+        "updated": len(updated),
+        "errors": [res.to_dict() for res in sorted(failed, key=lambda res: res.line)],
+    }
+
+@app.get("/export_rules")
+async def export_rules():
+    """
+    Stream every stored rule as NDJSON, one {"name": ..., "rule": ...} line per rule.
+
+    Rows are read in batches on a session of their own (see `stream_db`), which
+    stays open for as long as the response streams.
+
+    Returns:
+        StreamingResponse: NDJSON lines, in rule name order.
+    """
+    async def lines():
+        async for rules in stream_db(database.iter_rules):
+            for chunk in bulk.export_ndjson(rules):
+                yield chunk
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.delete("/delete_rule")
-def delete_rule(rule_name: str, db: Session = Depends(init_db)):
+async def delete_rule(rule_name: str, db: Session = Depends(init_db)):
     """
     Delete a stored rule from the database.
 
@@ -228,14 +871,81 @@ def delete_rule(rule_name: str, db: Session = Depends(init_db)):
     Returns:
         None
     Raises:
-        HTTPException: 404 error if the rule is not found in the database.
+        HTTPException: 404 error if the rule is not found in the database, 400 error if other rules reference it.
     """
-    rule = database.get_rule(db, rule_name=rule_name)
+    rule = await run_db(db, database.get_rule, rule_name=rule_name)
     if rule is None:
         raise HTTPException(status_code=404, detail="Rule not found")
-    database.delete_rule(db, rule_name=rule_name)
+    dependents = await run_db(db, database.get_dependents, rule_name=rule_name, transitive=False)
+    if dependents:
+        raise HTTPException(status_code=400, detail=f"Rule is referenced by: {', '.join(dependents)}")
+    await run_db(db, database.delete_rule, rule_name=rule_name)
+    rule_cache.invalidate(rule_name)
+    rule_set.remove(rule_name)
     return
 
+@app.get("/cache_stats", response_model= dict)
+async def cache_stats():
+    """
+    Hit/miss/eviction counters of the compiled-rule cache.
+
+    Returns:
+        Dict: Cache occupancy and counters.
+    """
+    return JSONResponse(rule_cache.stats())
+
+@app.get("/parse_stats", response_model= dict)
+async def parse_stats():
+    """
+    Hit/miss/eviction counters of the parsed-rule memo.
+
+    Returns:
+        Dict: Memo occupancy and counters.
+    """
+    return JSONResponse(parse_memo.stats())
+
+@app.get("/duplicate_rules", response_model= list[list[str]])
+async def duplicate_rules(db: Session = Depends(init_db)):
+    """
+    Find stored rules that are the same rule, by content hash.
+
+    Returns:
+        List[List[str]]: Names of the rules sharing a content hash, one group per hash.
+    """
+    return JSONResponse(await run_db(db, database.get_duplicate_rules))
+
+@app.get("/rule_stats", response_model= dict)
+async def rule_stats(rule_name: str, db: Session = Depends(init_db)):
+    """
+    Statistics the adaptive evaluator learned for a rule.
+
+    Args:
+        rule_name (str): The name of the rule.
+        db (Session): Database session to load the rule if it isn't cached.
+
+    Returns:
+        Dict: Evaluation counters, the sampled pass rate and cost of every comparision,
+        and the order the operands of every AND/OR are evaluated in.
+    Raises:
+        HTTPException: 404 error if the rule is not found in the database.
+    """
+    compiled_rule = await load_rule(db, rule_name= rule_name)
+    if compiled_rule is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return JSONResponse(compiled_rule.stats())
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Latency histograms of every stage (lex, parse, db_fetch, deserialize, evaluate), evaluations
+    per rule, sampled predicates evaluated or short-circuited, and errors by type.
+    Only recorded when METRICS_ENABLED is set.
+
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,111 @@
+"""
+Memo of parsed rules, keyed by normalized rule text
+
+The same rule strings are parsed over and over (the UI combines mostly the
+same rules on every change), so parsed ASTs are kept in a bounded LRU and
+repeated strings skip the lexer and parser. Rule text is normalized by
+collapsing whitespace: tokens never contain whitespace, so texts with the
+same key always lex to the same tokens.
+
+Memoized ASTs are shared by every caller and must not be modified; the
+optimizer and `rule_engine.patch` already build new nodes instead.
+
+Every entry carries the content hash of its AST, a digest of its canonical
+rule string (`ast_to_rule`), so rules differing only in spacing or redundant
+parentheses get the same hash. It's stored with each rule as a dedup key.
+"""
+
+import hashlib
+import re
+from collections import namedtuple
+
+from globalDS import catalog
+from rule_engine.abstract_tree import ast_to_rule
+from rule_engine.cache import RuleCache
+from rule_engine.parser import Node, parse
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(rule: str) -> str:
+    """ Memo key of a rule string """
+    return _WHITESPACE.sub(' ', rule).strip()
+
+
+def content_hash(node: Node) -> str:
+    """ Hex digest of the canonical rule string of an AST """
+    return hashlib.sha256(ast_to_rule(node).encode()).hexdigest()
+
+
+def attribute_types(node: Node) -> tuple:
+    """ (attr, type) of every attribute an AST compares, in the order they first appear """
+    attrs = {}
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.type == "comparision":
+            attrs.setdefault(current.left, current.attrType)
+        elif current.type == "operator":
+            stack.extend((current.right, current.left))
+    return tuple(attrs.items())
+
+
+class MemoEntry(namedtuple('MemoEntry', ['node', 'rule_hash', 'attrs'])):
+    """ A parsed rule, `attrs` holds (attr, type) for every attribute it compares """
+    __slots__ = ()
+
+
+class ParseMemo(object):
+    """ Bounded LRU of normalized rule text -> MemoEntry
+
+    Parsing registers the attributes of a rule in the catalog, and fails when
+    one conflicts with its catalog type. A hit does the same registration
+    from the entry, and parses again when the catalog type changed since
+    (loaded from another worker), so it fails exactly like parsing would.
+
+    Attributes:
+        maxsize: maximum number of memoized rules
+    """
+    def __init__(self, maxsize: int = 4096):
+        self._entries = RuleCache(maxsize=maxsize)
+        self.maxsize = maxsize
+        self.stale = 0
+
+    def lookup(self, rule: str) -> MemoEntry:
+        """
+        Parsed entry of a rule string, parsing it on a miss.
+
+        Raises:
+            The parser's errors, for an invalid rule.
+        """
+        key = normalize(rule)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if all(catalog.register(attr, attr_type) == attr_type for attr, attr_type in entry.attrs):
+                return entry
+            self._entries.invalidate(key)
+            self.stale += 1
+
+        node = parse(rule)
+        entry = MemoEntry(node, content_hash(node), attribute_types(node))
+        self._entries.put(key, entry)
+        return entry
+
+    def parse(self, rule: str) -> Node:
+        """ Root of the (shared) AST of a rule string, see `lookup` """
+        return self.lookup(rule).node
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Counters and occupancy of the memo, `stale` counts hits parsed again after a catalog change.
+        """
+        stats = self._entries.stats()
+        del stats["ttl"], stats["expirations"]
+        stats["stale"] = self.stale
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,231 @@
+"""
+Prometheus-style metrics of the rule engine
+
+Counters and latency histograms kept in process, rendered in the Prometheus
+text exposition format by `render` (served on /metrics). Nothing is recorded
+unless METRICS_ENABLED is set: every instrumented call site checks `enabled`
+first, so a disabled engine pays one attribute lookup per call.
+
+Stages timed by `STAGE_SECONDS`:
+    lex, parse: tokenizing and parsing a rule string (`parser.parse`)
+    db_fetch: queries loading rules from the database
+    deserialize: decoding a stored AST (`database.load_ast`)
+    evaluate: evaluating a compiled rule against a record, a batch records
+        its mean latency once for each of its records
+    evaluate_rules: evaluating the rule set against a record
+"""
+
+import bisect
+import functools
+import os
+import time
+from threading import Lock
+
+enabled = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# upper bounds in seconds, from a microsecond compiled evaluation to a slow query
+DEFAULT_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = None) -> str:
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """ A monotonically increasing count per combination of label values
+
+    Attributes:
+        name, documentation: metric name and its HELP text
+        labelnames: names of the labels, `inc` takes one value for each
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *labels, amount: int = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return ['{}{} {}'.format(self.name, _labels(self.labelnames, labels), _number(value))
+                    for labels, value in sorted(self._values.items())]
+
+
+class Histogram(object):
+    """ Counts of observed values per bucket, with their sum, per combination of label values
+
+    Attributes:
+        name, documentation: metric name and its HELP text
+        labelnames: names of the labels, `observe` takes one value for each
+        buckets: upper bounds of the buckets, +Inf is implied
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}   # labels -> [per bucket counts (last one is +Inf), sum]
+        self._lock = Lock()
+
+    def observe(self, value: float, *labels, count: int = 1):
+        """ Record `value`, `count` times """
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += count
+            entry[1] += value * count
+
+    def count(self, *labels) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="{}"'.format(_number(bound))
+                    lines.append('{}_bucket{} {}'.format(self.name, _labels(self.labelnames, labels, le), cumulative))
+                lines.append('{}_sum{} {}'.format(self.name, _labels(self.labelnames, labels), _number(total)))
+                lines.append('{}_count{} {}'.format(self.name, _labels(self.labelnames, labels), cumulative))
+        return lines
+
+
+STAGE_SECONDS = Histogram('rule_engine_stage_seconds', 'Latency of each stage of loading and evaluating rules.',
+                          ('stage',))
+EVALUATIONS = Counter('rule_engine_evaluations_total', 'Records evaluated, per rule.', ('rule',))
+PREDICATES = Counter('rule_engine_sampled_predicates_total',
+                     'Comparisions of the sampled evaluations (see AdaptiveRule), evaluated or skipped by short-circuiting.',
+                     ('outcome',))
+ERRORS = Counter('rule_engine_errors_total', 'Errors raised while parsing, loading or evaluating rules, per exception type.',
+                 ('type',))
+
+REGISTRY = (STAGE_SECONDS, EVALUATIONS, PREDICATES, ERRORS)
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+
+
+def count_error(error: BaseException):
+    if enabled:
+        ERRORS.inc(type(error).__name__)
+
+
+def timed(stage: str):
+    """
+    Decorator recording the duration of every call as `stage` while metrics are enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorator
+
+
+def instrument(rule_name: str, evaluate):
+    """
+    `evaluate` timed, counted as an evaluation of `rule_name`, and counting
+    its errors, while metrics are enabled. Returned as is otherwise.
+    """
+    if not enabled:
+        return evaluate
+
+    def instrumented(data):
+        start = time.perf_counter()
+        try:
+            return evaluate(data)
+        except Exception as e:
+            ERRORS.inc(type(e).__name__)
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, "evaluate")
+            EVALUATIONS.inc(rule_name)
+    return instrumented
+
+
+def record_batch(rule_name: str, seconds: float, results: list):
+    """
+    Record a batch evaluation of `rule_name` taking `seconds`, `results` holding
+    the result or exception of each record.
+    """
+    if not enabled or not results:
+        return
+    STAGE_SECONDS.observe(seconds / len(results), "evaluate", count=len(results))
+    EVALUATIONS.inc(rule_name, amount=len(results))
+    for res in results:
+        if isinstance(res, Exception):
+            ERRORS.inc(type(res).__name__)
+
+
+def record_rule_set(seconds: float, rule_names, errors: dict):
+    """
+    Record an evaluation of the rules `rule_names` taking `seconds`, `errors`
+    mapping each rule that failed to its exception.
+    """
+    if not enabled:
+        return
+    STAGE_SECONDS.observe(seconds, "evaluate_rules")
+    for rule_name in rule_names:
+        EVALUATIONS.inc(rule_name)
+    for res in errors.values():
+        ERRORS.inc(type(res).__name__)
+
+
+def render() -> str:
+    """ Every metric in the Prometheus text exposition format """
+    lines = []
+    for metric in REGISTRY:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for metric in REGISTRY:
+        metric.clear()
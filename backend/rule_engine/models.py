@@ -3,18 +3,21 @@ Database setup
 """
 import os
 from dotenv import load_dotenv
-from sqlalchemy import Column, Integer, String, Text, create_engine
+from sqlalchemy import Column, Integer, String, Text, LargeBinary, create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 load_dotenv()
 
-# Database URL from environment variables
-DATABASE_URL = (
+# Database URL from environment variables, DATABASE_URL (e.g. sqlite:///rules.db) takes precedence
+DATABASE_URL = os.getenv('DATABASE_URL') or (
     f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
     f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
 )
 
+# Use SQLAlchemy asyncio (asyncpg / aiosqlite) instead of blocking sessions
+DB_ASYNC = os.getenv('DB_ASYNC', '').lower() in ('1', 'true', 'yes')
+
 Base = declarative_base()
 
 class Rule(Base):
@@ -26,10 +29,102 @@ class Rule(Base):
     rule_name = Column(String, index=True, primary_key=True)
     rule_str = Column(String)
     rule_json = Column(Text, nullable=False)
+    # compact binary AST (rule_engine.codec), NULL for rows stored before it existed
+    rule_bin = Column(LargeBinary, nullable=True)
+    # content hash of the AST (rule_engine.memo), equal for equivalent rule strings
+    rule_hash = Column(String(64), index=True, nullable=True)
+
+class RuleReference(Base):
+    """
+    To store the rules each rule references by name (see rule_engine.references)
+    """
+    __tablename__ = "rule_references"
+
+    rule_name = Column(String, primary_key=True)
+    ref_name = Column(String, primary_key=True, index=True)
+
+class CatalogEntry(Base):
+    """
+    To store the type of every attribute used in a rule (see rule_engine.catalog)
+    """
+    __tablename__ = "catalog"
+
+    # increasing, the highest id a process loaded is its catalog version
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    attr = Column(String, unique=True, nullable=False)
+    attr_type = Column(String, nullable=False)
+
+def migrate_schema(conn):
+    """
+    Add columns and indexes introduced after a table was first created, `create_all` only creates missing tables.
+    Existing rows are backfilled separately (`python main.py --migrate`).
+    """
+    columns = {column['name'] for column in inspect(conn).get_columns(Rule.__tablename__)}
+    for column in Rule.__table__.columns:
+        if column.name not in columns:
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {Rule.__tablename__} ADD COLUMN {column.name} {column_type}'))
+    for index in Rule.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+def engine_options(url: str) -> dict:
+    """
+    Connection pool settings from environment variables.
+    SQLite doesn't pool connections across threads, so it only gets thread sharing enabled.
+    """
+    if url.startswith('sqlite'):
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': True,
+    }
 
-engine = create_engine(DATABASE_URL)
+def async_url(url: str) -> str:
+    """
+    Driver URL for SQLAlchemy asyncio: asyncpg for Postgres, aiosqlite for SQLite.
+    """
+    if url.startswith('postgresql://'):
+        return 'postgresql+asyncpg://' + url[len('postgresql://'):]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base.metadata.create_all(bind=engine)
+def async_sessions(url: str):
+    """
+    Engine and session factory on the asyncio driver for `url`.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    engine = create_async_engine(async_url(url), **engine_options(url))
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    async_engine, AsyncSessionLocal = async_sessions(DATABASE_URL)
+else:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        migrate_schema(conn)
+
+async def init_models():
+    """
+    Create the tables through the async engine, the sync engine does it at import.
+    """
+    if async_engine is not None:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(migrate_schema)
 
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        migrate_schema(conn)
@@ -0,0 +1,324 @@
+"""
+Boolean simplification of rule ASTs
+
+Chains of the same operator are treated as one n-ary AND/OR. Within each one
+the optimizer drops duplicate and absorbed operands, merges the comparisions
+on a same attribute (`age > 30 AND age > 40` -> `age > 40`), and folds
+contradictions and tautologies (`age > 30 AND age < 10`) to constants, which
+then propagate to the enclosing operators. The result is rebuilt as balanced
+binary operators, keeping the operands in their original order.
+
+Results are unchanged for records holding every attribute of the rule with
+its catalog type. Records that would raise may raise a different error, or
+none when the part of the rule raising it was dropped.
+"""
+
+from globalDS import catalog
+from rule_engine.parser import NUMBER, STRING, Node
+from rule_engine.compiler import operands
+
+LOWER_OPS = ('>', '>=')
+UPPER_OPS = ('<', '<=')
+
+
+class _Const(object):
+    """ A subtree that always evaluates to `value`
+
+    `witness` is a small subtree with the same value (e.g. the two contradicting
+    comparisions), what is left of the rule if the constant reaches the root.
+    """
+    __slots__ = ('value', 'witness')
+
+    def __init__(self, value: bool, witness: Node):
+        self.value = value
+        self.witness = witness
+
+
+class _Bound(object):
+    """ A range comparision on a numeric attribute """
+    __slots__ = ('value', 'strict', 'node')
+
+    def __init__(self, value: float, strict: bool, node: Node):
+        self.value = value
+        self.strict = strict
+        self.node = node
+
+
+def _predicate(node: Node):
+    """ (attr, op, normalised constant) of a comparision the optimizer reasons about, else None """
+    if node.type != "comparision":
+        return None
+    attr_type = catalog.get(node.left, node.attrType)
+    if attr_type == NUMBER and node.op in LOWER_OPS + UPPER_OPS + ('=', '!='):
+        try:
+            value = float(node.right)
+        except (ValueError, TypeError):
+            return None
+        if value != value:      # NaN
+            return None
+        return (node.left, node.op, value)
+    if attr_type == STRING and node.op in ('=', '!=') and isinstance(node.right, str):
+        return (node.left, node.op, node.right)
+    return None
+
+
+def _pair(left: Node, op: str, right: Node) -> Node:
+    return Node(type="operator", left=left, op=op, right=right)
+
+
+def balanced(op: str, children: list[Node]) -> Node:
+    """ Join `children` with `op` as a balanced binary tree, keeping their order """
+    while len(children) > 1:
+        paired = [_pair(children[i], op, children[i + 1]) for i in range(0, len(children) - 1, 2)]
+        if len(children) % 2:
+            paired.append(children[-1])
+        children = paired
+    return children[0]
+
+
+def _covers_lower(bound: _Bound, value: float) -> bool:
+    """ Whether `value` satisfies the lower bound """
+    return value > bound.value or (value == bound.value and not bound.strict)
+
+
+def _covers_upper(bound: _Bound, value: float) -> bool:
+    return value < bound.value or (value == bound.value and not bound.strict)
+
+
+def _merge_and(preds: list):
+    """
+    Conjunction of comparisions on one attribute.
+
+    Returns:
+        The comparision nodes to keep, or a _Const(False) for a contradiction.
+    """
+    lower = upper = None
+    equal, not_equal = {}, {}
+    for node, op, value in preds:
+        if op in LOWER_OPS:
+            bound = _Bound(value, op == '>', node)
+            if lower is None or value > lower.value or (value == lower.value and bound.strict and not lower.strict):
+                lower = bound
+        elif op in UPPER_OPS:
+            bound = _Bound(value, op == '<', node)
+            if upper is None or value < upper.value or (value == upper.value and bound.strict and not upper.strict):
+                upper = bound
+        elif op == '=':
+            equal.setdefault(value, node)
+        else:
+            not_equal.setdefault(value, node)
+
+    if len(equal) > 1:
+        first, second = list(equal.values())[:2]
+        return _Const(False, _pair(first, "AND", second))
+    if equal:
+        value, node = next(iter(equal.items()))
+        if lower is not None and not _covers_lower(lower, value):
+            return _Const(False, _pair(lower.node, "AND", node))
+        if upper is not None and not _covers_upper(upper, value):
+            return _Const(False, _pair(node, "AND", upper.node))
+        if value in not_equal:
+            return _Const(False, _pair(node, "AND", not_equal[value]))
+        return [node]
+
+    if lower is not None and upper is not None:
+        if lower.value > upper.value or (lower.value == upper.value and (lower.strict or upper.strict)):
+            return _Const(False, _pair(lower.node, "AND", upper.node))
+        if lower.value == upper.value:
+            # age >= 5 AND age <= 5
+            if lower.value in not_equal:
+                return _Const(False, _pair(lower.node, "AND", not_equal[lower.value]))
+            return [Node(type="comparision", left=lower.node.left, op='=', right=lower.node.right, attrType=lower.node.attrType)]
+
+    keep = [bound.node for bound in (lower, upper) if bound is not None]
+    for value, node in not_equal.items():
+        # an excluded value outside the range excludes nothing more
+        if (lower is None or _covers_lower(lower, value)) and (upper is None or _covers_upper(upper, value)):
+            keep.append(node)
+    return keep
+
+
+def _merge_or(preds: list):
+    """
+    Disjunction of comparisions on one attribute.
+
+    Returns:
+        The comparision nodes to keep, or a _Const(True) for a tautology.
+    """
+    lower = upper = None
+    equal, not_equal = {}, {}
+    for node, op, value in preds:
+        if op in LOWER_OPS:
+            bound = _Bound(value, op == '>', node)
+            if lower is None or value < lower.value or (value == lower.value and lower.strict and not bound.strict):
+                lower = bound
+        elif op in UPPER_OPS:
+            bound = _Bound(value, op == '<', node)
+            if upper is None or value > upper.value or (value == upper.value and upper.strict and not bound.strict):
+                upper = bound
+        elif op == '=':
+            equal.setdefault(value, node)
+        else:
+            not_equal.setdefault(value, node)
+
+    if len(not_equal) > 1:
+        first, second = list(not_equal.values())[:2]
+        return _Const(True, _pair(first, "OR", second))
+    if not_equal:
+        value, node = next(iter(not_equal.items()))
+        if value in equal:
+            return _Const(True, _pair(node, "OR", equal[value]))
+        if lower is not None and _covers_lower(lower, value):
+            return _Const(True, _pair(node, "OR", lower.node))
+        if upper is not None and _covers_upper(upper, value):
+            return _Const(True, _pair(node, "OR", upper.node))
+        # every other operand only holds for values != value
+        return [node]
+
+    if lower is not None and upper is not None:
+        if lower.value < upper.value or (lower.value == upper.value and not (lower.strict and upper.strict)):
+            return _Const(True, _pair(lower.node, "OR", upper.node))
+        if lower.value == upper.value and lower.value in equal:
+            # age > 5 OR age < 5 OR age = 5
+            return _Const(True, _pair(_pair(lower.node, "OR", upper.node), "OR", equal[lower.value]))
+
+    keep = [bound.node for bound in (lower, upper) if bound is not None]
+    for value, node in equal.items():
+        if not (lower is not None and _covers_lower(lower, value)) and not (upper is not None and _covers_upper(upper, value)):
+            keep.append(node)
+    return keep
+
+
+class _Optimizer(object):
+    def __init__(self):
+        self.keys = {}      # structural key -> interned id
+        self.ids = {}       # id(optimized node) -> interned id
+        self.parts = {}     # id(optimized operator node) -> (op, frozenset of operand ids)
+
+    def intern(self, node: Node, key) -> Node:
+        self.ids[id(node)] = self.keys.setdefault(key, len(self.keys))
+        return node
+
+    def leaf(self, node: Node):
+        pred = _predicate(node)
+        if pred is not None:
+            return self.intern(node, ('c',) + pred)
+        return self.intern(node, ('n', node.type, node.left, node.op, repr(node.right), node.attrType))
+
+    def operator(self, op: str, results: list):
+        """ Simplify the n-ary `op` over already optimized operands """
+        absorbing = op == "OR"      # value of a constant operand deciding the whole operator
+
+        # flatten and fold constants
+        children = []
+        neutral = None
+        for res in results:
+            if isinstance(res, _Const):
+                if res.value == absorbing:
+                    return res
+                neutral = neutral or res
+            elif res.type == "operator" and res.op == op:
+                children.extend(operands(res))
+            else:
+                children.append(res)
+
+        # duplicates
+        seen, unique = set(), []
+        for child in children:
+            key = self.ids[id(child)]
+            if key not in seen:
+                seen.add(key)
+                unique.append(child)
+        children = unique
+
+        # absorption: a OR (a AND b) -> a, a AND (a OR b) -> a
+        other_op = "AND" if op == "OR" else "OR"
+        children = [child for child in children
+                    if not (id(child) in self.parts and self.parts[id(child)][0] == other_op
+                            and not self.parts[id(child)][1].isdisjoint(seen - {self.ids[id(child)]}))]
+
+        # merge comparisions on the same attribute
+        groups = {}     # attr -> [(node, op, constant)]
+        for child in children:
+            pred = _predicate(child)
+            if pred is not None:
+                attr, pred_op, value = pred
+                groups.setdefault(attr, []).append((child, pred_op, value))
+        merged = {}     # id(first node of a group) -> nodes replacing the group
+        dropped = set()
+        for preds in groups.values():
+            if len(preds) < 2:
+                continue
+            res = (_merge_and if op == "AND" else _merge_or)(preds)
+            if isinstance(res, _Const):
+                return res
+            position = {id(node): i for i, (node, _, _) in enumerate(preds)}
+            res.sort(key=lambda node: position.get(id(node), -1))
+            merged[id(preds[0][0])] = [self.leaf(node) for node in res]
+            dropped.update(id(node) for node, _, _ in preds)
+        if merged:
+            rebuilt = []
+            for child in children:
+                if id(child) in merged:
+                    rebuilt.extend(merged[id(child)])
+                elif id(child) not in dropped:
+                    rebuilt.append(child)
+            children = rebuilt
+
+        if not children:
+            return neutral
+        if len(children) == 1:
+            return children[0]
+        node = balanced(op, children)
+        child_ids = tuple(self.ids[id(child)] for child in children)
+        self.parts[id(node)] = (op, frozenset(child_ids))
+        return self.intern(node, (op,) + child_ids)
+
+    def run(self, root: Node) -> Node:
+        results = {}    # id(source node) -> optimized node or _Const
+        stack = [(root, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current.type != "operator":
+                results[id(current)] = self.leaf(current)
+            elif current.op not in ("AND", "OR"):
+                results[id(current)] = self.opaque(current)
+            elif expanded:
+                results[id(current)] = self.operator(current.op, [results[id(child)] for child in operands(current)])
+            else:
+                stack.append((current, True))
+                stack.extend((child, False) for child in operands(current))
+
+        res = results[id(root)]
+        return res.witness if isinstance(res, _Const) else res
+
+    def opaque(self, node: Node) -> Node:
+        """ Operators other than AND/OR are kept as they are """
+        return self.intern(node, ('o', id(node)))
+
+
+def optimize(node: Node) -> Node:
+    """
+    Simplify an AST, see the module docstring for what is simplified.
+
+    Args:
+        node: root of the AST, left untouched.
+
+    Returns:
+        Root of the simplified AST. Comparision nodes may be shared with `node`.
+    """
+    if node is None:
+        return None
+    return _Optimizer().run(node)
+
+
+def count_nodes(node: Node) -> int:
+    """ Number of nodes in an AST """
+    count = 0
+    stack = [node] if node is not None else []
+    while stack:
+        current = stack.pop()
+        count += 1
+        if current.type == "operator":
+            stack.extend((current.left, current.right))
+    return count
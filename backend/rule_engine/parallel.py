@@ -0,0 +1,167 @@
+"""
+Parallel bulk evaluation of a rule over a process pool
+
+Evaluation is CPU bound and holds the GIL, so large scoring jobs are spread
+over worker processes. The rule is shipped to every worker once, when the
+worker starts, as its binary encoding; records then travel in chunks and the
+results come back in input order as they complete.
+"""
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from globalDS import catalog
+from rule_engine import codec
+from rule_engine.abstract_tree import ast_to_json, json_to_ast
+from rule_engine.compiler import CompiledRule
+from rule_engine.parser import Node
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# the rule compiled in a worker process
+_worker_rule = None
+
+
+def _encode(node: Node):
+    """ Compact binary encoding when the format supports the rule, else JSON """
+    try:
+        return codec.encode(node)
+    except ValueError:
+        return ast_to_json(node)
+
+
+def _decode(encoded) -> Node:
+    if isinstance(encoded, bytes):
+        return codec.decode(encoded)
+    return json_to_ast(encoded) if encoded else None
+
+
+def _init_worker(encoded, catalog_items: dict):
+    """ Worker initializer: take the parent's catalog and compile the rule once """
+    global _worker_rule
+    catalog.load(catalog_items)
+    _worker_rule = CompiledRule(_decode(encoded))
+
+
+def _evaluate_chunk(records: list) -> list:
+    return _worker_rule.evaluate_many(records)
+
+
+# the common results, preformatted
+_RESULT_LINES = {True: '{"result": true}\n', False: '{"result": false}\n', None: '{"result": null}\n'}
+
+
+def result_line(res) -> str:
+    """ NDJSON line of one result, {"result": ...} or {"error": ...} """
+    if isinstance(res, Exception):
+        return json.dumps({"error": str(res)}) + "\n"
+    if res is True or res is False or res is None:
+        return _RESULT_LINES[res]
+    return json.dumps({"result": res}) + "\n"
+
+
+def _evaluate_ndjson_chunk(lines: list) -> str:
+    """ Parse, evaluate and format a chunk of NDJSON lines, all in the worker """
+    evaluate = _worker_rule.evaluate
+    out = []
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            out.append(result_line(ValueError("Invalid JSON: {}".format(e))))
+            continue
+        try:
+            res = evaluate(data)
+        except Exception as e:
+            res = e
+        out.append(result_line(res))
+    return "".join(out)
+
+
+def _chunks(records, size: int):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ParallelEvaluator(object):
+    """ Evaluate one rule over many records on a pool of worker processes
+
+    Attributes:
+        workers: number of worker processes
+        chunk_size: records sent to a worker at a time
+    """
+    def __init__(self, node: Node, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(_encode(node), catalog.snapshot()),
+        )
+
+    def evaluate(self, records):
+        """
+        Evaluate the rule against each record, `records` can be any iterable.
+
+        Yields:
+            The result for every record, in input order: the evaluation result,
+            or the exception raised while evaluating that record.
+        """
+        for results in self._map(_evaluate_chunk, records):
+            yield from results
+
+    def evaluate_ndjson(self, lines):
+        """
+        Evaluate the rule against NDJSON records, one JSON object per line.
+        Parsing and formatting happen in the workers, so only text crosses processes.
+
+        Yields:
+            Chunks of NDJSON output, one line per non-blank input line, in
+            input order: {"result": ...} or {"error": ...}.
+        """
+        yield from self._map(_evaluate_ndjson_chunk, (line for line in lines if line.strip()))
+
+    def _map(self, func, items):
+        """ Apply `func` to chunks of `items` on the pool, yielding its results in order """
+        # a couple of chunks in flight per worker keeps them busy without buffering the whole input
+        max_pending = 2 * self.workers
+        pending = deque()
+        try:
+            for chunk in _chunks(items, self.chunk_size):
+                pending.append(self._pool.submit(func, chunk))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def evaluate_parallel(node: Node, records, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Evaluate a rule over `records` on a process pool, see `ParallelEvaluator`.
+
+    Yields:
+        One result per record, in input order, exceptions reported inline.
+    """
+    with ParallelEvaluator(node, workers=workers, chunk_size=chunk_size) as evaluator:
+        yield from evaluator.evaluate(records)
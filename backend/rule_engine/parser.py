@@ -1,7 +1,10 @@
 """ Lexer and Parser for rules """
 
 import re
+import time
+from collections import namedtuple
 from globalDS import catalog  
+from rule_engine import metrics
 from rule_engine.error import SyntaxError, InvalidTokenError, TypeError, InsufficientDataError
 
 ###############################################################################
@@ -10,16 +13,51 @@ from rule_engine.error import SyntaxError, InvalidTokenError, TypeError, Insuffi
 ###############################################################################
 
 NUMBER, STRING, LPAREN, RPAREN, AND, OR, COMPARISION, EOF = 'NUMBER', 'STRING', 'LPAREN', 'RPAREN', 'AND', 'OR', 'COMPARISION', 'EOF'
+REF = 'REF'     # @rule_name, a reference to a stored rule
+INVALID = 'INVALID'
+
+# one alternative per kind of token, so a single scan splits and classifies the rule
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<AND>AND(?!\w)|&&)
+      | (?P<OR>OR(?!\w)|\|\|)
+      | (?P<NUMBER>-?\d+(?:\.\d+)?)(?!\w)
+      | (?P<STRING>\w+)
+      | (?P<COMPARISION>[<>]=?|!=|=(?!=))
+      | (?P<LPAREN>\()
+      | (?P<RPAREN>\))
+      | '\s*(?P<QUOTED>[^'\s]+)\s*'
+      | @(?P<REF>[\w.\-]+)
+      | (?P<INVALID>\S)
+    )""", re.VERBOSE)
+
+# group number -> token type, and the value of tokens with a fixed spelling
+_GROUPS = TOKEN_PATTERN.groupindex
+TOKEN_TYPES = [None] + [STRING if name == 'QUOTED' else name for name in sorted(_GROUPS, key=_GROUPS.get)]
+TOKEN_VALUES = [None] * len(TOKEN_TYPES)
+for name, value in ((AND, 'AND'), (OR, 'OR'), (LPAREN, '('), (RPAREN, ')')):
+    TOKEN_VALUES[_GROUPS[name]] = value
 
 def tokenize(rule: str) -> list[str]:
-    token_pattern = re.compile(r'\s*(-?\d+.\d+?|<=|>=|!=|==|&&|\|\||[()><=]|[\w]+|[^ \t\n\r\f\v\w])\s*')
-    return [token for token in token_pattern.findall(rule) if token.strip()]
+    """ Lexemes of a rule, with the quotes around string literals and the @ of references as separate lexemes """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(rule):
+        if match.lastgroup == 'QUOTED':
+            tokens.extend(("'", match.group('QUOTED'), "'"))
+        elif match.lastgroup == REF:
+            tokens.extend(("@", match.group(REF)))
+        else:
+            tokens.append(match.group(match.lastgroup))
+    return tokens
 
 
-class Token(object):
-    def __init__(self, type, value):
-        self.type = type
-        self.value = value
+class Token(namedtuple('Token', ('type', 'value', 'pos'))):
+    """ A token, pos is its character offset in the rule """
+    __slots__ = ()
+
+    def __new__(cls, type, value, pos=None):
+        return tuple.__new__(cls, (type, value, pos))
+
     def __str__(self):
         """String representation of the class instance.
 
@@ -36,50 +74,40 @@ class Token(object):
     def __repr__(self):
         return self.__str__()
 
+
+def lex(rule: str) -> list[Token]:
+    """
+    Tokens of a rule, in a single scan.
+
+    A character that starts no token becomes an INVALID token, the Lexer
+    raises on it once reached.
+    """
+    new, types, values = tuple.__new__, TOKEN_TYPES, TOKEN_VALUES
+    return [
+        new(Token, (types[group], values[group] or match[group], match.start(group)))
+        for match in TOKEN_PATTERN.finditer(rule)
+        for group in (match.lastindex,)
+    ]
+
+
 class Lexer(object):
     def __init__(self, text):
-        self.tokens = tokenize(text)
-        self.pos = -1
-        self.current_val = "" 
+        self.tokens = lex(text)
+        self.index = -1
+        self.pos = -1           # character offset of the current token
+        self.eof = Token(EOF, None, len(text))
 
     def get_next_token(self):
         """ Lexical analyzer """
-
-        self.pos+=1
-        if self.pos < len(self.tokens):
-            self.current_val = self.tokens[self.pos]
-            if self.current_val in ('AND', '&&'):
-                return Token(AND, 'AND')
-            
-            if self.current_val in ('OR', '||'):
-                return Token(OR, 'OR')
-            
-            if self.current_val in ('>', '<', '>=', '<=', '=', '!='):
-                return Token(COMPARISION, self.current_val)
-            
-            if self.current_val == '(':
-                return Token(LPAREN, '(')
-            
-            if self.current_val == ')':
-                return Token(RPAREN, ')')
-            
-            if re.match(r'^-?\d+(\.\d+)?$', self.current_val): 
-                return Token(NUMBER, self.current_val)
-            
-            # for 'Sales' case
-            if self.current_val == "'":
-                if self.pos+2 < len(self.tokens) and self.tokens[self.pos+2] == "'":
-                    if re.match(r'^[\w]+$', self.tokens[self.pos+1]) == False:
-                        raise InvalidTokenError(token=self.current_val, pos = self.pos)
-                    tmpToken = Token(STRING, self.tokens[self.pos+1])
-                    self.pos +=2
-                    return tmpToken
-                    
-            if re.match(r'^[\w]+$', self.current_val):
-                return Token(STRING, self.current_val)
-
-            raise InvalidTokenError(token=self.current_val, pos = self.pos)
-        return Token(EOF, None)
+        self.index += 1
+        if self.index < len(self.tokens):
+            token = self.tokens[self.index]
+            self.pos = token.pos
+            if token.type == INVALID:
+                raise InvalidTokenError(token=token.value, pos=token.pos)
+            return token
+        self.pos = self.eof.pos
+        return self.eof
 
 ###############################################################################
 #                                                                             #
@@ -88,6 +116,9 @@ class Lexer(object):
 ###############################################################################
 
 class Node(object):
+    # no per-instance __dict__, large combined rules hold thousands of nodes
+    __slots__ = ('type', 'op', 'attrType', 'left', 'right')
+
     def __init__(self, type, left=None, op=None, right=None, attrType=None):
         self.type = type
         self.op = op
@@ -102,25 +133,38 @@ class Node(object):
 
     def __repr__(self):
         return self.__str__()
+
+    def to_dict(self) -> dict:
+        """ Fields of the node, children are left as Node objects """
+        return {
+            'type': self.type,
+            'op': self.op,
+            'attrType': self.attrType,
+            'left': self.left,
+            'right': self.right,
+        }
     
     def comparision(self, val):
         # checking for same type
-        if self.left not in catalog:
-            catalog[self.left] = self.attrType
-
-        if catalog[self.left] == NUMBER and not isinstance(val, (int, float)):
+        attribute = catalog.attribute(self.left, self.attrType)
+        if not attribute.validator(val):
             raise TypeError(attr=self.left, val=val, ref=self.right)
-        if catalog[self.left] == NUMBER:
-            self.right = float(self.right)
+        if attribute.type == NUMBER:
+            ref = float(self.right)
             val = float(val)
             if self.op == ">":
-                return val > self.right
+                return val > ref
             elif self.op == ">=":
-                return val >= self.right
+                return val >= ref
             elif self.op == "<":
-                return val < self.right
+                return val < ref
             elif self.op == "<=":
-                return val <= self.right
+                return val <= ref
+            elif self.op == "=":
+                return val == ref
+            elif self.op == "!=":
+                return val != ref
+            return None
 
         # common comparisions
         if self.op == "=":
@@ -129,17 +173,39 @@ class Node(object):
             return val != self.right
 
     def evaluate(self, data):
-        if(self.type=="comparision"):
-            if self.left not in data:
-                raise InsufficientDataError(self.left)
-
-            return self.comparision(data[self.left])
-        elif(self.type=="operator"):
-            if self.op == "AND":
-                # short circuiting, if left term is False then right term would not be evaluated.
-                return self.left.evaluate(data) and self.right.evaluate(data)
+        """
+        Evaluate the tree rooted at this node against data.
+
+        Walks the tree with an explicit stack instead of recursing, so deeply
+        chained combined rules don't hit the interpreter's recursion limit.
+        """
+        # frames of [node, stage], stage 0: not started, 1: left done, 2: right done
+        stack = [[self, 0]]
+        res = None
+        while stack:
+            frame = stack[-1]
+            node = frame[0]
+            if node.type == "comparision":
+                if node.left not in data:
+                    raise InsufficientDataError(node.left)
+                res = node.comparision(data[node.left])
+                stack.pop()
+            elif node.type != "operator":
+                res = None
+                stack.pop()
+            elif frame[1] == 0:
+                frame[1] = 1
+                stack.append([node.left, 0])
+            elif frame[1] == 1:
+                # short circuiting, if left term is False (True for OR) then right term would not be evaluated.
+                if (not res) if node.op == "AND" else res:
+                    stack.pop()
+                else:
+                    frame[1] = 2
+                    stack.append([node.right, 0])
             else:
-                return self.left.evaluate(data) or self.right.evaluate(data)
+                stack.pop()
+        return res
 
 class Parser(object):
     def __init__(self, lexer):
@@ -150,7 +216,7 @@ class Parser(object):
         if self.current_token.type == token_type:
             self.current_token = self.lexer.get_next_token()
         else:
-            raise SyntaxError(expected= token_type, got= self.current_token.type, val=self.current_token.value)
+            raise SyntaxError(expected= token_type, got= self.current_token.type, val=self.current_token.value, pos=self.current_token.pos)
     
     def comparision(self):
         """comparision: variable operator value"""
@@ -169,44 +235,82 @@ class Parser(object):
         
         # Here I have added attribute validation, keep adding in hashmap and during
         # evaluation check for same datatype in this attribute COMPARISION
-        if left in catalog:
-            if catalog[left] != attrType: 
-                raise Exception("TypeError: different type of value for same attribute: {}".format(left))
-        else:
-            catalog[left] = attrType
+        if catalog.register(left, attrType) != attrType:
+            raise Exception("TypeError: different type of value for same attribute: {}".format(left))
 
         # Create AST NODE: comparision type 
         node = Node(type="comparision", left=left,op=op, right=right, attrType=attrType)
         return node
 
     def term(self):
-        """term: comparision | LPAREN expression RPAREN"""
+        """term: comparision | reference | LPAREN expression RPAREN"""
         if self.current_token.type == LPAREN:
             self.eat(LPAREN)
             node = self.expr()
             self.eat(RPAREN)
             return node
-        elif self.current_token.type == STRING:
+        return self.operand()
+
+    def operand(self):
+        """operand: comparision | reference"""
+        if self.current_token.type == STRING:
             node = self.comparision()
             return node
-        raise SyntaxError(expected=STRING, got=self.current_token.type, val=self.current_token.value)
+        elif self.current_token.type == REF:
+            # resolved to the stored rule's AST before evaluation, see rule_engine.references
+            node = Node(type="reference", left=self.current_token.value)
+            self.eat(REF)
+            return node
+        raise SyntaxError(expected=STRING, got=self.current_token.type, val=self.current_token.value, pos=self.current_token.pos)
 
     def expr(self):
         """
         expr: term ((AND|OR) term)*
-        term: comparision | LPAREN expr RPAREN
+        term: comparision | reference | LPAREN expr RPAREN
         comparision: variable operator value
+        reference: @rule_name
+
+        AND and OR share one precedence level and group to the left, so this
+        is a shunting-yard parse with nothing to reorder: an operator is
+        applied as soon as its right term is complete. Every open parenthesis
+        saves the expression built so far, and its pending operator, on an
+        explicit stack, so nesting depth isn't bounded by the recursion limit
+        and the parse is linear in the number of tokens.
         """
-        
-        node = self.term()
+        levels = []             # (node, op) of the expressions enclosing each open parenthesis
+        node, op = None, None   # expression of the current level, and the operator awaiting its right term
 
-        while self.current_token.type in ('AND', 'OR'):
-            op = self.current_token
-            if op.type == AND:
-                self.eat(AND)
-            else:
-                self.eat(OR)
+        while True:
+            while self.current_token.type == LPAREN:
+                self.eat(LPAREN)
+                levels.append((node, op))
+                node, op = None, None
+            term = self.operand()
 
-            node = Node(type="operator", left=node, op=op.value, right=self.term())
+            while True:
+                node = term if node is None else Node(type="operator", left=node, op=op.value, right=term)
+                if self.current_token.type in (AND, OR):
+                    op = self.current_token
+                    self.eat(op.type)
+                    break
+                if not levels:
+                    return node
+                # a term in parentheses is complete
+                self.eat(RPAREN)
+                term = node
+                node, op = levels.pop()
 
-        return node
+
+def parse(rule: str) -> Node:
+    """
+    Root of the AST of a rule string, timing the lexer and the parser apart while metrics are enabled.
+    """
+    if not metrics.enabled:
+        return Parser(Lexer(rule)).expr()
+    start = time.perf_counter()
+    lexer = Lexer(rule)
+    lexed = time.perf_counter()
+    node = Parser(lexer).expr()
+    metrics.observe("lex", lexed - start)
+    metrics.observe("parse", time.perf_counter() - lexed)
+    return node
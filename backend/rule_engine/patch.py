@@ -0,0 +1,128 @@
+"""
+Path based edits of a rule AST
+
+A patch targets one node by its path from the root, a sequence of "left" /
+"right" steps written like a JSON pointer into the rule JSON ("/left/right",
+"" for the root), and either changes its operator, changes the constant of a
+comparision, or replaces the whole subtree with a parsed rule.
+
+Patches are copy-on-write: the nodes along the path are copied, every other
+subtree is shared with the original AST, which is left untouched. Whatever
+was derived from an untouched subtree (e.g. its compiled function, see
+`CompiledRule.patch`) stays valid for the patched AST.
+"""
+
+import re
+from collections import namedtuple
+
+from rule_engine.parser import Node, NUMBER, parse
+
+SET_OP, SET_VALUE, REPLACE = 'set_op', 'set_value', 'replace'
+ACTIONS = (SET_OP, SET_VALUE, REPLACE)
+
+LOGICAL_OPS = {'AND': 'AND', '&&': 'AND', 'OR': 'OR', '||': 'OR'}
+COMPARISION_OPS = ('>', '>=', '<', '<=', '=', '!=')
+
+# constants as the lexer reads them, so the patched rule still round-trips through its rule string
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+STRING_PATTERN = re.compile(r"[^'\s]+")
+
+
+class Patch(namedtuple('Patch', ['path', 'action', 'value'])):
+    """ One edit: `action` applied with `value` to the node at `path` """
+    __slots__ = ()
+
+
+def parse_path(path) -> list[str]:
+    """
+    Steps of a path, "/left/right" or ["left", "right"].
+
+    Raises:
+        ValueError: for a step other than "left" or "right".
+    """
+    if isinstance(path, str):
+        path = [step for step in path.split('/') if step]
+    steps = list(path)
+    for step in steps:
+        if step not in ('left', 'right'):
+            raise ValueError("Invalid path step '{}', expected 'left' or 'right'".format(step))
+    return steps
+
+
+def _copy(node: Node) -> Node:
+    return Node(type=node.type, left=node.left, op=node.op, right=node.right, attrType=node.attrType)
+
+
+def _patched(node: Node, action: str, value) -> Node:
+    """ New node for `node` with the edit applied """
+    if action == REPLACE:
+        if not isinstance(value, str):
+            raise ValueError("replace expects a rule string")
+        return parse(value)
+
+    if action == SET_OP:
+        if node.type == "operator":
+            if value not in LOGICAL_OPS:
+                raise ValueError("Invalid operator '{}' for an operator node".format(value))
+            value = LOGICAL_OPS[value]
+        elif node.type == "comparision":
+            if value not in COMPARISION_OPS:
+                raise ValueError("Invalid operator '{}' for a comparision".format(value))
+        else:
+            raise ValueError("Cannot set the operator of a node of type {}".format(node.type))
+        node = _copy(node)
+        node.op = value
+        return node
+
+    if action == SET_VALUE:
+        if node.type != "comparision":
+            raise ValueError("Only comparisions hold a value, got a node of type {}".format(node.type))
+        value = str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+        pattern = NUMBER_PATTERN if node.attrType == NUMBER else STRING_PATTERN
+        if not isinstance(value, str) or not pattern.fullmatch(value):
+            raise ValueError("Invalid {} value {!r} for attribute {}".format(node.attrType, value, node.left))
+        node = _copy(node)
+        node.right = value
+        return node
+
+    raise ValueError("Unknown patch action '{}', expected one of {}".format(action, ", ".join(ACTIONS)))
+
+
+def apply_patch(root: Node, patch: Patch) -> Node:
+    """
+    Apply one patch, see the module docstring.
+
+    Returns:
+        Root of the patched AST.
+    Raises:
+        ValueError: if the path doesn't lead to a node, or the edit doesn't fit the node.
+    """
+    steps = parse_path(patch.path)
+    nodes = [root]
+    for depth, step in enumerate(steps):
+        parent = nodes[-1]
+        if parent is None or parent.type != "operator":
+            raise ValueError("No node at path /{}".format("/".join(steps[:depth + 1])))
+        nodes.append(getattr(parent, step))
+    if nodes[-1] is None:
+        raise ValueError("No node at path /{}".format("/".join(steps)))
+
+    node = _patched(nodes[-1], patch.action, patch.value)
+    # copy the path back up to the root, sharing every other subtree
+    for parent, step in zip(reversed(nodes[:-1]), reversed(steps)):
+        parent = _copy(parent)
+        setattr(parent, step, node)
+        node = parent
+    return node
+
+
+def apply_patches(root: Node, patches) -> Node:
+    """
+    Apply patches in order, each one on the result of the previous ones.
+
+    Returns:
+        Root of the patched AST, `root` itself is left untouched.
+    """
+    for patch in patches:
+        root = apply_patch(root, patch)
+    return root
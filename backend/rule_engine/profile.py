@@ -0,0 +1,186 @@
+"""
+Traced evaluation of a rule
+
+A RuleProfile evaluates an AST the way `Node.evaluate` does (same results,
+same errors, same short-circuiting, operands in the order they were written)
+while recording, for every node: how often it was visited, how often it was
+skipped by short-circuiting, how often it yielded a truthy result or raised,
+and the time spent in it, its children included.
+
+Profiling is much slower than compiled evaluation and is only done on request,
+compiled rules never go through it. `to_dict` returns the profile shaped like
+the rule's `ast_to_json`, with a "profile" entry on every node. The stored,
+unresolved AST is profiled: a reference to another rule is a single node,
+which evaluates the referenced rule.
+"""
+
+import time
+
+from rule_engine.parser import Node
+from rule_engine.error import InsufficientDataError
+from rule_engine.references import REFERENCE, references as referenced, resolve
+from rule_engine.schema import RuleSchema
+
+
+class RuleProfile(object):
+    """ Per node counters of traced evaluations of an AST
+
+    Nodes are counted by position, so a subtree shared by several parents
+    is profiled once at each place it appears.
+
+    Attributes:
+        node: root of the profiled AST
+        strict: records are validated against the rule's schema first, like `CompiledRule.strict`
+        references: rule name -> resolved AST, of every rule `node` references
+        records: number of records evaluated
+    """
+    def __init__(self, node: Node, strict: bool = False, references: dict = None):
+        self.node = node
+        self.strict = strict
+        self.references = references or {}
+        self.records = 0
+        missing = [name for name in referenced(node) if name not in self.references]
+        if missing:
+            raise ValueError("Referenced rule not found: {}".format(missing[0]))
+        if strict:
+            self._schema = RuleSchema(resolve(node, self.references.__getitem__) if self.references else node)
+        else:
+            self._schema = None
+
+        # positions in pre-order, a subtree spans the positions [pos, pos + size)
+        self._nodes, self._left, self._right = [], [], []
+        stack = [(node, None, None)] if node is not None else []
+        while stack:
+            current, parent, side = stack.pop()
+            pos = len(self._nodes)
+            self._nodes.append(current)
+            self._left.append(None)
+            self._right.append(None)
+            if parent is not None:
+                side[parent] = pos
+            if current.type == "operator":
+                stack.append((current.right, pos, self._right))
+                stack.append((current.left, pos, self._left))
+        self._size = [1] * len(self._nodes)
+        for pos in reversed(range(len(self._nodes))):
+            if self._left[pos] is not None:
+                self._size[pos] += self._size[self._left[pos]] + self._size[self._right[pos]]
+
+        count = len(self._nodes)
+        self.visits = [0] * count
+        self.skipped = [0] * count
+        self.passes = [0] * count
+        self.errors = [0] * count
+        self.time_ns = [0] * count
+        self._last = [None] * count     # result of each node in the last evaluation
+
+    def evaluate(self, data):
+        """
+        Evaluate the rule against `data`, recording the profile.
+
+        Raises:
+            The errors `Node.evaluate` raises, and those of the schema when `strict`.
+        """
+        self.records += 1
+        self._last = [None] * len(self._nodes)
+        if not self._nodes:
+            return True
+        if self._schema is not None:
+            self._schema.validate(data)
+
+        nodes, left, right, visits = self._nodes, self._left, self._right, self.visits
+        clock = time.perf_counter_ns
+        # frames of [pos, stage, start], stage 0: not started, 1: left done, 2: right done
+        visits[0] += 1
+        stack = [[0, 0, clock()]]
+        res = None
+        try:
+            while stack:
+                frame = stack[-1]
+                pos = frame[0]
+                node = nodes[pos]
+                if node.type == "comparision":
+                    if node.left not in data:
+                        raise InsufficientDataError(node.left)
+                    res = node.comparision(data[node.left])
+                elif node.type == REFERENCE:
+                    res = self.references[node.left].evaluate(data)
+                elif node.type != "operator":
+                    res = None
+                elif frame[1] == 0:
+                    frame[1] = 1
+                    visits[left[pos]] += 1
+                    stack.append([left[pos], 0, clock()])
+                    continue
+                elif frame[1] == 1:
+                    if (not res) if node.op == "AND" else res:
+                        self._skip(right[pos])
+                    else:
+                        frame[1] = 2
+                        visits[right[pos]] += 1
+                        stack.append([right[pos], 0, clock()])
+                        continue
+                self.time_ns[pos] += clock() - frame[2]
+                self.passes[pos] += bool(res)
+                self._last[pos] = res
+                stack.pop()
+        except Exception:
+            # the node that raised and every operator waiting on it
+            now = clock()
+            for pos, _, start in stack:
+                self.errors[pos] += 1
+                self.time_ns[pos] += now - start
+            raise
+        return res
+
+    def _skip(self, pos: int):
+        for i in range(pos, pos + self._size[pos]):
+            self.skipped[i] += 1
+
+    def evaluate_many(self, records) -> list:
+        """
+        Evaluate the rule against each record, recording one profile over all of them.
+
+        Returns:
+            List with one entry per record: the evaluation result, or the
+            exception raised while evaluating that record.
+        """
+        results = []
+        for data in records:
+            try:
+                results.append(self.evaluate(data))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _stats(self, pos: int) -> dict:
+        stats = {
+            "visits": self.visits[pos],
+            "skipped": self.skipped[pos],
+            "passes": self.passes[pos],
+            "errors": self.errors[pos],
+            "time_ns": self.time_ns[pos],
+        }
+        # a single record also gets the result of every node that completed
+        if self.records == 1 and self.visits[pos] and not self.errors[pos]:
+            stats["result"] = self._last[pos]
+        return stats
+
+    def to_dict(self) -> dict:
+        """
+        The AST as `ast_to_json` lays it out, every node with a "profile" entry:
+        visits, skipped (by short-circuiting), passes (truthy results), errors,
+        time_ns (children included) and, when one record was evaluated, its result.
+        None for an empty rule.
+        """
+        if not self._nodes:
+            return None
+        built = {}
+        for pos in reversed(range(len(self._nodes))):
+            entry = self._nodes[pos].to_dict()
+            if self._left[pos] is not None:
+                entry["left"] = built.pop(self._left[pos])
+                entry["right"] = built.pop(self._right[pos])
+            entry["profile"] = self._stats(pos)
+            built[pos] = entry
+        return built[0]
@@ -0,0 +1,66 @@
+"""
+References to stored rules inside a rule
+
+`@rule_name` in a rule string parses to a "reference" node. Rules are stored
+with their references unresolved, so a composite always uses the current
+version of the rules it references, and are resolved before being compiled:
+every reference node is replaced by the AST of the referenced rule, taken
+from the compiled-rule store as is. Referenced ASTs are shared, not copied,
+like the memoized and patched ASTs they may already share subtrees with.
+"""
+
+from rule_engine.parser import Node
+
+REFERENCE = "reference"
+
+
+def references(node: Node) -> list[str]:
+    """
+    Names of the rules referenced by an AST, in the order they first appear.
+    """
+    names = {}
+    stack = [node] if node is not None else []
+    while stack:
+        current = stack.pop()
+        if current.type == REFERENCE:
+            names.setdefault(current.left, None)
+        elif current.type == "operator":
+            stack.append(current.right)
+            stack.append(current.left)
+    return list(names)
+
+
+def resolve(node: Node, lookup) -> Node:
+    """
+    Replace every reference of an AST by the AST of the referenced rule.
+
+    Args:
+        lookup: `lookup(name) -> Node`, the resolved AST of a stored rule.
+
+    Returns:
+        The resolved AST. Operators are copied along the paths leading to a
+        reference, every other subtree is shared, and an AST without
+        references is returned as is.
+    Raises:
+        Whatever `lookup` raises for a rule that can't be resolved.
+    """
+    if node is None:
+        return None
+    resolved = {}   # id(node) -> resolved node, for the nodes holding a reference
+    stack = [(node, False)]
+    while stack:
+        current, expanded = stack.pop()
+        if current.type == REFERENCE:
+            resolved[id(current)] = lookup(current.left)
+        elif current.type == "operator":
+            if not expanded:
+                stack.append((current, True))
+                stack.append((current.right, False))
+                stack.append((current.left, False))
+                continue
+            left, right = resolved.get(id(current.left)), resolved.get(id(current.right))
+            if left is not None or right is not None:
+                resolved[id(current)] = Node(type=current.type, op=current.op, attrType=current.attrType,
+                                             left=left if left is not None else current.left,
+                                             right=right if right is not None else current.right)
+    return resolved.get(id(node), node)
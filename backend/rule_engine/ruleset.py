@@ -0,0 +1,111 @@
+"""
+In-memory set of compiled rules, for evaluating many rules against one record
+"""
+
+import time
+from threading import Lock
+from rule_engine.parser import Node
+from rule_engine.index import PredicateIndex
+
+
+class RuleSet(object):
+    """ Rules keyed by rule name, compiled into a shared-predicate index
+
+    Multi-rule evaluation goes through the index, so each distinct comparision
+    is decided once per record across all rules. The index holds the only
+    compiled form of each rule.
+
+    Like the rule cache, the set is per process: once filled it expires `ttl`
+    seconds later, the caller then refreshes the rules whose stored content
+    hash changed.
+
+    Attributes:
+        rules: rule name -> AST
+        hashes: rule name -> content hash of the stored rule, None if unknown
+        index: PredicateIndex over the same rules
+        ttl: seconds the set stays valid once loaded, None to never expire
+        loaded: True once the set was filled from the database
+    """
+    def __init__(self, ttl=None, timer=time.monotonic):
+        self.rules = {}
+        self.hashes = {}
+        self.index = PredicateIndex()
+        self.ttl = ttl
+        self._timer = timer
+        self._loaded_at = None
+        self._lock = Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @loaded.setter
+    def loaded(self, value: bool):
+        # setting it again after a refresh restarts the TTL
+        self._loaded_at = self._timer() if value else None
+
+    def expired(self) -> bool:
+        """ Whether the set was loaded more than `ttl` seconds ago """
+        return self._loaded_at is not None and self.ttl is not None and self._timer() - self._loaded_at >= self.ttl
+
+    def add(self, rule_name: str, node: Node, rule_hash: str = None):
+        """
+        Compile `node` and store it under `rule_name`, replacing any previous version.
+        `rule_hash` is the content hash of the stored rule, the previous one is kept when None.
+        """
+        with self._lock:
+            self.rules[rule_name] = node
+            if rule_hash is not None or rule_name not in self.hashes:
+                self.hashes[rule_name] = rule_hash
+            self.index.add(rule_name, node)
+
+    def patch(self, rule_name: str, node: Node, rule_hash: str = None):
+        """
+        Store the patched AST `node` under `rule_name`, recompiling only the
+        parts that differ from the stored version (see `PredicateIndex.add`).
+        """
+        with self._lock:
+            self.rules[rule_name] = node
+            if rule_hash is not None or rule_name not in self.hashes:
+                self.hashes[rule_name] = rule_hash
+            self.index.add(rule_name, node, patch=True)
+
+    def remove(self, rule_name: str):
+        """
+        Drop `rule_name` from the set, if present.
+        """
+        with self._lock:
+            self.rules.pop(rule_name, None)
+            self.hashes.pop(rule_name, None)
+            self.index.remove(rule_name)
+
+    def clear(self):
+        with self._lock:
+            self.rules.clear()
+            self.hashes.clear()
+            self.index = PredicateIndex()
+            self._loaded_at = None
+
+    def evaluate(self, data, rule_names=None) -> dict:
+        """
+        Evaluate the named rules (all rules by default) against one record.
+
+        Returns:
+            Dict of rule name -> result, or the exception raised while evaluating that rule.
+        Raises:
+            KeyError: if one of `rule_names` is not in the set.
+        """
+        return self.index.evaluate(data, rule_names)
+
+    def match(self, data, rule_names=None, errors: dict = None) -> list[str]:
+        """
+        Names of the rules (among `rule_names`, or all rules) that hold for one record.
+        Rules that fail to evaluate are not matches, their exceptions are added to `errors` when given.
+        """
+        return self.index.match(data, rule_names, errors)
+
+    def __contains__(self, rule_name):
+        return rule_name in self.rules
+
+    def __len__(self):
+        return len(self.rules)
@@ -0,0 +1,70 @@
+"""
+Record schema of a rule
+
+The attributes a rule compares, with their catalog type, collected once when
+the rule is compiled. Records can then be checked in one pass over just those
+attributes, before any comparision runs, instead of leaf by leaf.
+"""
+
+from collections import namedtuple
+
+from globalDS import catalog
+from rule_engine.parser import NUMBER, Node
+from rule_engine.error import TypeError, InsufficientDataError
+
+
+class Field(namedtuple('Field', ['attr', 'type', 'ref'])):
+    """ An attribute of the schema, `ref` is the first constant it's compared to (for error messages) """
+    __slots__ = ()
+
+
+class RuleSchema(object):
+    """ The attributes a rule reads, in the order the rule first mentions them
+
+    Attributes:
+        fields: list of Field
+    """
+    def __init__(self, node: Node):
+        fields = {}
+        stack = [node] if node is not None else []
+        while stack:
+            current = stack.pop()
+            if current.type == "comparision":
+                if current.left not in fields:
+                    fields[current.left] = Field(current.left, catalog.register(current.left, current.attrType), current.right)
+            elif current.type == "operator":
+                stack.append(current.right)
+                stack.append(current.left)
+        self.fields = list(fields.values())
+        self._checks = [(field.attr, catalog.validator(field.attr), field.ref) for field in self.fields]
+
+    @property
+    def number_attrs(self) -> list[str]:
+        return [field.attr for field in self.fields if field.type == NUMBER]
+
+    @property
+    def other_attrs(self) -> list[str]:
+        return [field.attr for field in self.fields if field.type != NUMBER]
+
+    def validate(self, data):
+        """
+        Check that `data` holds every attribute of the schema with its type.
+
+        Raises:
+            InsufficientDataError: for the first attribute missing from `data`.
+            TypeError: for the first attribute whose value doesn't fit its type.
+        """
+        for attr, is_valid, ref in self._checks:
+            if attr not in data:
+                raise InsufficientDataError(attr)
+            if not is_valid(data[attr]):
+                raise TypeError(attr=attr, val=data[attr], ref=ref)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return "RuleSchema({})".format(", ".join("{}: {}".format(field.attr, field.type) for field in self.fields))
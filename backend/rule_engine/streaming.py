@@ -0,0 +1,237 @@
+"""
+Incremental evaluation of streamed NDJSON / CSV records
+
+The body is consumed chunk by chunk: complete lines are split off, parsed
+into records, evaluated and turned into NDJSON result lines right away, so
+memory stays bounded by the chunk size and the longest record (at most
+`DEFAULT_MAX_RECORD` characters) whatever the size of the upload.
+"""
+
+import codecs
+import csv
+import json
+
+from fastapi.concurrency import run_in_threadpool
+
+from globalDS import catalog
+from rule_engine.parser import NUMBER
+from rule_engine.parallel import result_line
+
+NDJSON, CSV = 'ndjson', 'csv'
+FORMATS = (NDJSON, CSV)
+
+# characters of the longest record kept, longer ones are reported as errors
+DEFAULT_MAX_RECORD = 1 << 20
+
+# where a CSV record being read stands, as in `csv.reader` with the default dialect
+_FIELD_START, _FIELD, _QUOTED, _QUOTE_IN_QUOTED = range(4)
+
+
+def _csv_state(text: str, state: int) -> int:
+    """ State after reading `text` of a CSV record from `state` """
+    if state != _QUOTED and '"' not in text:
+        return state if not text else _FIELD_START if text.endswith(',') else _FIELD
+    pos, end = 0, len(text)
+    while pos < end:
+        if state == _QUOTED:
+            pos = text.find('"', pos)
+            if pos < 0:
+                return _QUOTED
+            state, pos = _QUOTE_IN_QUOTED, pos + 1
+        elif state == _FIELD:
+            # quotes inside an unquoted field are literal
+            pos = text.find(',', pos)
+            if pos < 0:
+                return _FIELD
+            state, pos = _FIELD_START, pos + 1
+        elif text[pos] == '"':
+            # opens a quoted field, or is an escaped quote ("") within one
+            state, pos = _QUOTED, pos + 1
+        elif state == _FIELD_START or text[pos] != ',':
+            # after a closing quote, the rest of the field is taken literally
+            state = _FIELD
+        else:
+            state, pos = _FIELD_START, pos + 1
+    return state
+
+
+class LineSplitter(object):
+    """ Splits a stream of byte chunks into complete text lines
+
+    The quoting state of CSV records is tracked as the text arrives, so a
+    record is scanned once however many chunks it spans. A record longer than
+    `max_record` characters is dropped as it is read and a ValueError takes
+    its place in the lines returned.
+
+    Attributes:
+        quoted: keep newlines inside double quoted CSV fields within the line
+        max_record: characters of the longest record kept
+    """
+    def __init__(self, quoted: bool = False, max_record: int = DEFAULT_MAX_RECORD):
+        self.quoted = quoted
+        self.max_record = max_record
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._parts = []        # text of the record being read
+        self._size = 0
+        self._state = _FIELD_START
+        self._dropped = False   # the record being read is over max_record
+
+    def feed(self, chunk: bytes) -> list:
+        """ Lines completed by `chunk`, a ValueError in place of each record too long """
+        return self._split(self._decoder.decode(chunk))
+
+    def flush(self) -> list:
+        """ Whatever is left once the stream ended """
+        lines = self._split(self._decoder.decode(b'', final=True))
+        if self._parts or self._dropped:
+            lines.append(self._end())
+        return lines
+
+    def _split(self, text: str) -> list:
+        lines = []
+        pieces = text.split('\n')
+        last = pieces.pop()
+        for piece in pieces:
+            self._add(piece)
+            if self._state == _QUOTED:
+                # a newline within a quoted field
+                self._add('\n')
+            else:
+                lines.append(self._end())
+        if last:
+            self._add(last)
+        return lines
+
+    def _add(self, text: str):
+        if self.quoted:
+            self._state = _csv_state(text, self._state)
+        if self._dropped:
+            return
+        self._size += len(text)
+        if self._size > self.max_record:
+            self._dropped = True
+            self._parts = []
+        else:
+            self._parts.append(text)
+
+    def _end(self):
+        """ The record read so far, or its error """
+        line = ''.join(self._parts) if not self._dropped else \
+            ValueError("Record longer than {} characters".format(self.max_record))
+        self._parts = []
+        self._size = 0
+        self._state = _FIELD_START
+        self._dropped = False
+        return line
+
+
+def parse_ndjson(lines: list) -> list:
+    """
+    One record per non-blank line, a ValueError in its place if it isn't valid JSON.
+    Errors of the `LineSplitter` are passed through.
+    """
+    records = []
+    for line in lines:
+        if isinstance(line, Exception):
+            records.append(line)
+            continue
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            records.append(ValueError("Invalid JSON: {}".format(e)))
+    return records
+
+
+def _number(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value    # left as is, evaluation reports the TypeError
+
+
+class CSVParser(object):
+    """ Parses CSV lines into records, the first line being the header
+
+    Cells of NUMBER attributes in the catalog are converted to numbers, other
+    cells stay strings. Empty cells are left out of the record.
+    """
+    def __init__(self):
+        self.header = None
+        self.converters = None      # per column, looked up in the catalog once
+
+    def parse(self, lines: list) -> list:
+        """ Records of `lines`, errors of the `LineSplitter` are passed through """
+        records, run = [], []
+        for line in lines:
+            if isinstance(line, Exception):
+                self._parse_rows(run, records)
+                run = []
+                records.append(line)
+            elif line.strip():
+                run.append(line.rstrip('\r'))
+        self._parse_rows(run, records)
+        return records
+
+    def _parse_rows(self, lines: list[str], records: list):
+        for row in csv.reader(lines):
+            if self.header is None:
+                self.header = [name.strip() for name in row]
+                self.converters = [_number if catalog.get(name) == NUMBER else None for name in self.header]
+                continue
+            record = {}
+            for attr, convert, value in zip(self.header, self.converters, row):
+                if value == '':
+                    continue
+                record[attr] = convert(value) if convert is not None else value
+            records.append(record)
+
+
+def evaluate_lines(records: list, evaluate) -> str:
+    """ NDJSON result lines of parsed `records`, parse errors reported in place """
+    out = []
+    for record in records:
+        if isinstance(record, Exception):
+            out.append(result_line(record))
+            continue
+        try:
+            res = evaluate(record)
+        except Exception as e:
+            res = e
+        out.append(result_line(res))
+    return "".join(out)
+
+
+async def evaluate_stream(chunks, evaluate, fmt: str = NDJSON, max_record: int = DEFAULT_MAX_RECORD):
+    """
+    Evaluate streamed records as they arrive.
+
+    Args:
+        chunks: async iterable of bytes, e.g. `Request.stream()`.
+        evaluate: compiled rule, evaluate(data) -> result.
+        fmt: NDJSON or CSV.
+        max_record: characters of the longest record, longer ones get an error line.
+
+    Yields:
+        NDJSON text, one {"result": ...} or {"error": ...} line per record, in input order.
+        Chunks are parsed and evaluated in the threadpool, off the event loop.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unsupported format: {}".format(fmt))
+    splitter = LineSplitter(quoted=fmt == CSV, max_record=max_record)
+    parse = CSVParser().parse if fmt == CSV else parse_ndjson
+
+    def process(lines: list) -> str:
+        return evaluate_lines(parse(lines), evaluate) if lines else ""
+
+    async for chunk in chunks:
+        output = await run_in_threadpool(lambda: process(splitter.feed(chunk)))
+        if output:
+            yield output
+    output = await run_in_threadpool(lambda: process(splitter.flush()))
+    if output:
+        yield output
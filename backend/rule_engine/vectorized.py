@@ -0,0 +1,189 @@
+"""
+Columnar evaluation of rules over record batches with NumPy
+
+A batch is column oriented: a dict of attribute name to array (or sequence),
+a pandas DataFrame, or a pyarrow Table/RecordBatch. Every comparision node
+becomes a boolean mask over the rows, and AND/OR nodes combine masks with
+`&`/`|`. String columns are dictionary encoded once per batch, so equality
+compares small integer codes instead of strings.
+"""
+
+import builtins
+import numpy as np
+from globalDS import catalog
+from rule_engine.parser import NUMBER, Node
+from rule_engine.compiler import operands
+from rule_engine.error import TypeError, InsufficientDataError
+
+NUMERIC_UFUNCS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '=': np.equal,
+    '!=': np.not_equal,
+}
+
+
+class ColumnBatch(object):
+    """ Column-oriented batch of records with per-column conversions cached
+
+    Attributes:
+        columns: attribute name -> column (numpy array, pandas Series or pyarrow array)
+        length: number of rows
+    """
+    def __init__(self, batch):
+        if hasattr(batch, "column_names") and hasattr(batch, "column"):   # pyarrow Table / RecordBatch
+            self.columns = {name: batch.column(name) for name in batch.column_names}
+        elif hasattr(batch, "columns") and hasattr(batch, "__getitem__") and not isinstance(batch, dict):   # pandas DataFrame
+            self.columns = {name: batch[name] for name in batch.columns}
+        else:
+            self.columns = dict(batch)
+
+        lengths = {len(column) for column in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns of a batch must have the same length")
+        self.length = lengths.pop() if lengths else 0
+        self._numeric = {}
+        self._encoded = {}
+
+    def column(self, attr, active):
+        """ Raw column of `attr`, raising InsufficientDataError only if an active row needs it """
+        if attr not in self.columns:
+            if active.any():
+                raise InsufficientDataError(attr)
+            return None
+        return self.columns[attr]
+
+    def numeric(self, attr, ref, active) -> np.ndarray:
+        """ Column of `attr` as float64, TypeError for the first active non-numeric value """
+        if attr in self._numeric:
+            return self._numeric[attr]
+        column = self.column(attr, active)
+        if column is None:
+            return None
+
+        values = _to_numpy(column)
+        if values.dtype.kind not in "biuf":
+            numeric = np.fromiter((isinstance(val, (int, float)) for val in values), dtype=bool, count=len(values))
+            bad = ~numeric & active
+            if bad.any():
+                raise TypeError(attr=attr, val=values[np.argmax(bad)], ref=ref)
+            if not numeric.all():
+                # rows that are not numeric are inactive here, their value never matters
+                return np.where(numeric, values, 0).astype(np.float64)
+        values = values.astype(np.float64)
+        self._numeric[attr] = values
+        return values
+
+    def encoded(self, attr, active):
+        """ Column of `attr` dictionary encoded as (codes, {value: code}) """
+        if attr in self._encoded:
+            return self._encoded[attr]
+        column = self.column(attr, active)
+        if column is None:
+            return None
+
+        if hasattr(column, "dictionary_encode"):   # pyarrow array
+            if hasattr(column, "combine_chunks"):
+                column = column.combine_chunks()
+            if not hasattr(column, "indices"):
+                column = column.dictionary_encode()
+            codes = column.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+            categories = column.dictionary.to_pylist()
+        elif hasattr(column, "cat"):   # pandas categorical Series
+            codes = column.cat.codes.to_numpy()
+            categories = list(column.cat.categories)
+        elif hasattr(column, "codes") and hasattr(column, "categories"):   # pandas Categorical
+            codes = np.asarray(column.codes)
+            categories = list(column.categories)
+        else:
+            values = _to_numpy(column)
+            try:
+                categories, codes = np.unique(values, return_inverse=True)
+                categories = categories.tolist()
+            except builtins.TypeError:
+                # mixed, unorderable values
+                lookup = {}
+                codes = np.fromiter((lookup.setdefault(val, len(lookup)) for val in values), dtype=np.int64, count=len(values))
+                categories = list(lookup)
+
+        encoded = (codes, {value: code for code, value in enumerate(categories)})
+        self._encoded[attr] = encoded
+        return encoded
+
+
+def _to_numpy(column) -> np.ndarray:
+    if isinstance(column, np.ndarray):
+        return column
+    if hasattr(column, "to_numpy"):
+        try:
+            return column.to_numpy(zero_copy_only=False)   # pyarrow
+        except builtins.TypeError:
+            return column.to_numpy()   # pandas
+    return np.asarray(column)
+
+
+def _comparision_mask(node: Node, batch: ColumnBatch, active: np.ndarray) -> np.ndarray:
+    attr = node.left
+    if catalog.register(attr, node.attrType) == NUMBER:
+        values = batch.numeric(attr, node.right, active)
+        if values is None:
+            return np.zeros(batch.length, dtype=bool)
+        return NUMERIC_UFUNCS[node.op](values, float(node.right))
+
+    encoded = batch.encoded(attr, active)
+    if encoded is None or node.op not in ('=', '!='):
+        # interpreter yields None (falsy) for ordering on strings
+        return np.zeros(batch.length, dtype=bool)
+    codes, lookup = encoded
+    code = lookup.get(node.right)
+    mask = np.zeros(batch.length, dtype=bool) if code is None else codes == code
+    return mask if node.op == '=' else ~mask
+
+
+def _evaluate_mask(node: Node, batch: ColumnBatch, active: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of `node` over the batch.
+
+    `active` marks rows for which the interpreter would actually reach this node,
+    so missing columns and bad values only raise where short-circuiting wouldn't skip them.
+    """
+    if node.type == "comparision":
+        return _comparision_mask(node, batch, active)
+    if node.type != "operator":
+        return np.zeros(batch.length, dtype=bool)
+
+    is_and = node.op == "AND"
+    result = None
+    for child in operands(node):
+        mask = _evaluate_mask(child, batch, active)
+        if result is None:
+            result = mask
+        elif is_and:
+            result = result & mask
+        else:
+            result = result | mask
+        # rows already decided by short-circuiting don't evaluate the remaining operands
+        active = active & result if is_and else active & ~result
+    return result
+
+
+def evaluate_columns(node: Node, batch) -> np.ndarray:
+    """
+    Evaluate a rule over a column-oriented batch of records.
+
+    Args:
+        node: root of the rule's AST.
+        batch: dict of attribute -> array, pandas DataFrame or pyarrow Table.
+
+    Returns:
+        numpy boolean array with one entry per row.
+    Raises:
+        InsufficientDataError, TypeError: if any row would raise it when evaluated on its own.
+    """
+    if not isinstance(batch, ColumnBatch):
+        batch = ColumnBatch(batch)
+    if node is None:
+        return np.ones(batch.length, dtype=bool)
+    return _evaluate_mask(node, batch, np.ones(batch.length, dtype=bool))
@@ -161,3 +161,37 @@ def test_json_to_ast_and_vice_versa(ast):
 
     data2 = {"age": 45, "department": "Sales"}
     assert ast.evaluate_rule(data2) == newAst.evaluate_rule(data2)
+
+def test_evaluate_many(ast):
+    """
+    Test evaluating one rule against many records with inline errors.
+    """
+    rule = "age > 30 AND department = 'Sales'"
+    ast.create_rule(rule)
+
+    records = [
+        {"age": 35, "department": "Sales"},
+        {"age": 25, "department": "Sales"},
+        {"age": 40},
+        {"age": "forty", "department": "Sales"},
+    ]
+    results = ast.evaluate_many(records)
+
+    assert results[:2] == [True, False]
+    assert "InsufficientDataError" in str(results[2])
+    assert "TypeError" in str(results[3])
+
+def test_json_roundtrip_beyond_recursion_limit(ast):
+    """
+    A chain of comparisions is a left-deep tree, far deeper than json.dumps / json.loads can recurse.
+    """
+    rule = " AND ".join("attr_{} > {}".format(i % 10, i) for i in range(5000)) + " OR name = 'a\"b'"
+    root = ast.create_rule(rule)
+    rule_json = ast_to_json(root)
+    back = json_to_ast(rule_json)
+
+    assert rule_json.startswith('{"type": "operator", "op": "OR", "attrType": null, "left": {"type": "operator"')
+    assert ast_to_json(back) == rule_json
+    assert back.right.right == 'a"b'
+    data = {"attr_{}".format(i): 10000 for i in range(10)}
+    assert AST(back).evaluate_rule(data) is ast.evaluate_rule(data) is True
@@ -0,0 +1,101 @@
+import random
+import pytest
+from benchmarks.synthetic import make_rules, make_records
+from rule_engine.abstract_tree import AST
+from rule_engine.adaptive import AdaptiveRule
+from rule_engine.compiler import CompiledRule, compile_preloaded
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def outcome(func, data):
+    try:
+        return normalize(func(data))
+    except Exception as e:
+        return normalize(e)
+
+def normalize(res):
+    """ Exceptions don't compare equal, compare their type and message """
+    if isinstance(res, Exception):
+        return ('error', type(res), str(res))
+    return ('result', res)
+
+def test_selective_operand_moves_first(ast):
+    """
+    An AND whose last operand rarely passes gets it evaluated first.
+    """
+    ast.create_rule("age > 10 AND salary > 1000 AND score > 97")
+    rule = AdaptiveRule(ast.root, sample_every=1, reorder_every=100)
+    rule.evaluate_many(make_records(500))
+
+    stats = rule.stats()
+    assert stats['reorders'] >= 1 and stats['reordered']
+    order = stats['operators'][0]['order']
+    predicates = {entry['id']: entry['predicate'] for entry in stats['comparisions']}
+    assert predicates[order[0]] == "score > 97"
+    assert {entry['predicate'] for entry in stats['comparisions']} == {"age > 10", "salary > 1000", "score > 97"}
+
+def test_reordering_keeps_results(ast):
+    """
+    Results and errors match the compiled rule, also for records missing
+    attributes or holding values of the wrong type.
+    """
+    rng = random.Random(3)
+    records = make_records(600, seed=4)
+    records += [{attr: val for attr, val in data.items() if rng.random() < 0.7} for data in records[:200]]
+    records += [dict(data, age="old") for data in records[:50]] + [dict(data, salary=10 ** 400) for data in records[:50]]
+    records += [dict(data, age=True) for data in records[:50]] + [None, []]
+
+    reorders = 0
+    for rule_string in make_rules(30, depth=3, width=3, seed=5):
+        node = ast.create_rule(rule_string)
+        compiled = CompiledRule(node)
+        adaptive = AdaptiveRule(node, sample_every=1, reorder_every=20)
+        for data in records:
+            assert outcome(adaptive.evaluate, data) == outcome(compiled.evaluate, data)
+        expected = [normalize(res) for res in compiled.evaluate_many(records)]
+        assert [normalize(res) for res in adaptive.evaluate_many(records)] == expected
+        reorders += adaptive.reorders
+    assert reorders > 0
+
+def test_unsafe_operands_keep_their_place(ast):
+    """
+    Operators over a comparision that can yield None or raise aren't reordered.
+    """
+    ast.create_rule("department > 'A' AND age > 10 AND score > 97")
+    rule = AdaptiveRule(ast.root, sample_every=1, reorder_every=10)
+    rule.evaluate_many(make_records(200))
+
+    stats = rule.stats()
+    assert stats['reorders'] == 0 and not stats['reordered']
+    assert stats['operators'] == [] and stats['comparisions'] == []
+    assert rule.evaluate({"department": "Sales", "age": 30, "score": 99}) is None
+
+def test_compile_preloaded_falls_back(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    rule = compile_preloaded(ast.root, ['age'], ['department'], lambda data: "fallback")
+
+    assert rule({"age": 35, "department": "Sales"}) is True
+    assert rule({"age": 35.5, "department": "HR"}) is False
+    assert rule({"age": "35", "department": "Sales"}) == "fallback"
+    assert rule({"age": 10 ** 400, "department": "Sales"}) == "fallback"
+    assert rule({"department": "Sales"}) == "fallback"
+
+def test_long_chain(ast):
+    """
+    A combined rule of a few hundred operands is sampled and reordered as one AND.
+    """
+    rules = ["age > {}".format(i) for i in range(300)]
+    node = ast.combine_rules(rules, "AND")
+    rule = AdaptiveRule(node, sample_every=1, reorder_every=100)
+
+    ages = list(range(400))
+    random.Random(6).shuffle(ages)
+    assert rule.evaluate_many([{"age": age} for age in ages]) == [age > 299 for age in ages]
+    stats = rule.stats()
+    predicates = {entry['id']: entry['predicate'] for entry in stats['comparisions']}
+    assert stats['reorders'] >= 1
+    # the most selective operands come first, timing noise may swap close ones
+    assert int(predicates[stats['operators'][0]['order'][0]].split()[-1]) >= 250
@@ -0,0 +1,377 @@
+import json
+import os
+import sys
+import tempfile
+import pytest
+
+# the database URL is read when rule_engine.models is first imported, as in benchmarks.suite.run_api
+if 'rule_engine.models' not in sys.modules:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test_api.db')
+    os.environ.pop('DB_ASYNC', None)
+
+from fastapi.testclient import TestClient
+from rule_engine import models
+from rule_engine.main import app
+
+pytestmark = pytest.mark.skipif(not str(models.DATABASE_URL).startswith('sqlite'),
+                                reason="API tests run on a throwaway SQLite database")
+
+def reset():
+    """Empty the rule tables and the in-process rule caches, the catalog is kept."""
+    from rule_engine import main
+    models.Base.metadata.create_all(bind=models.engine)
+    db = models.SessionLocal()
+    try:
+        db.query(models.RuleReference).delete()
+        db.query(models.Rule).delete()
+        db.commit()
+    finally:
+        db.close()
+    main.rule_cache.clear()
+    main.rule_set.clear()
+
+@pytest.fixture(scope="module", params=["sync", "async"])
+def client(request):
+    """Fixture starting the app once per engine: blocking sessions, then SQLAlchemy asyncio (DB_ASYNC)."""
+    with pytest.MonkeyPatch.context() as patch:
+        if request.param == "async":
+            pytest.importorskip("aiosqlite")
+            async_engine, async_session = models.async_sessions(str(models.DATABASE_URL))
+            patch.setattr(models, "async_engine", async_engine)
+            patch.setattr(models, "AsyncSessionLocal", async_session)
+        else:
+            patch.setattr(models, "async_engine", None)
+            patch.setattr(models, "AsyncSessionLocal", None)
+        reset()
+        with TestClient(app) as client:
+            yield client
+
+def create(client, name, rule):
+    response = client.post("/create_rule", json={"name": name, "rule": rule})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def evaluate(client, name, data):
+    response = client.post("/evaluate_rule", json={"rule_name": name, "data": data})
+    assert response.status_code == 200, response.text
+    return response.json()["result"]
+
+def import_rules(client, rules, upsert=False):
+    body = "".join(json.dumps({"name": name, "rule": rule}) + "\n" for name, rule in rules)
+    response = client.post("/import_rules", params={"upsert": upsert}, content=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_sessions_follow_engine(client, request, monkeypatch):
+    from rule_engine import main
+    run_db, sessions = main.run_db, set()
+
+    async def recording(db, func, **kwargs):
+        sessions.add(type(db).__name__)
+        return await run_db(db, func, **kwargs)
+    monkeypatch.setattr(main, "run_db", recording)
+
+    assert client.get("/get_all_rule_names").status_code == 200
+    assert client.get("/list_rules").status_code == 200    # on a session of its own, see stream_db
+    assert sessions == {"AsyncSession" if request.node.callspec.params["client"] == "async" else "Session"}
+
+def test_references_follow_upserted_rule(client):
+    create(client, "api_adult", "api_age > 30")
+    create(client, "api_composite", "@api_adult AND api_dept = 'Sales'")
+    data = {"api_age": 40, "api_dept": "Sales"}
+    assert evaluate(client, "api_composite", data) is True
+    client.post("/evaluate_rules", json={"data": data})    # loads the rule set
+
+    assert import_rules(client, [("api_adult", "api_age > 50")], upsert=True)["updated"] == 1
+    assert evaluate(client, "api_composite", data) is False
+    assert "api_composite" not in client.post("/evaluate_rules", json={"data": data}).json()["matches"]
+
+def test_delete_after_reference_removed(client):
+    create(client, "api_base", "api_age > 18")
+    create(client, "api_user", "@api_base OR api_age < 5")
+    assert client.delete("/delete_rule", params={"rule_name": "api_base"}).status_code == 400
+
+    import_rules(client, [("api_user", "api_age < 5")], upsert=True)
+    assert client.delete("/delete_rule", params={"rule_name": "api_base"}).status_code == 200
+    assert client.get("/get_rule", params={"rule_name": "api_base"}).status_code == 404
+
+def test_evaluate_rules_matches_and_errors(client):
+    create(client, "api_senior", "api_years > 10")
+    create(client, "api_junior", "api_years < 3 OR api_team = 'Ops'")
+    create(client, "api_billing", "api_plan = 'pro' AND api_years > 1")
+
+    result = client.post("/evaluate_rules", json={"data": {"api_years": 12, "api_team": "Dev"}}).json()
+    assert "api_senior" in result["matches"] and "api_junior" not in result["matches"]
+    assert "InsufficientDataError" in result["errors"]["api_billing"]
+
+    names = ["api_senior", "api_junior"]
+    result = client.post("/evaluate_rules", json={"data": {"api_years": 10 ** 400}, "rule_names": names}).json()
+    assert result["matches"] == [] and set(result["errors"]) == set(names)
+    assert client.post("/evaluate_rules", json={"data": {}, "rule_names": ["api_missing"]}).status_code == 404
+
+def test_evaluate_rules_sees_other_workers(client, monkeypatch):
+    from rule_engine import main
+    create(client, "api_shift", "api_hours > 8")
+    create(client, "api_gone", "api_hours > 0")
+    create(client, "api_overtime", "@api_shift OR api_hours > 60")
+    assert sorted(client.post("/evaluate_rules", json={"data": {"api_hours": 9}}).json()["matches"]) == \
+        ["api_gone", "api_overtime", "api_shift"]
+
+    # another worker modifies and deletes rows, this worker's rule set doesn't know
+    rule_ast, rule_hash, rule_json, rule_bin = main.build_rule("api_hours > 10")
+    db = models.SessionLocal()
+    try:
+        main.database.modify_rule(db, "api_shift", new_rule_str="api_hours > 10",
+                                  new_rule_json=rule_json, new_rule_bin=rule_bin, new_rule_hash=rule_hash)
+        main.database.delete_rule(db, "api_gone")
+    finally:
+        db.close()
+    assert sorted(client.post("/evaluate_rules", json={"data": {"api_hours": 9}}).json()["matches"]) == \
+        ["api_gone", "api_overtime", "api_shift"]
+
+    monkeypatch.setattr(main.rule_set, "ttl", 0)
+    loads = []
+    get_rules = main.database.get_rules
+    monkeypatch.setattr(main.database, "get_rules",
+                        lambda db, rule_names: loads.append(sorted(rule_names)) or get_rules(db, rule_names))
+    assert client.post("/evaluate_rules", json={"data": {"api_hours": 9}}).json()["matches"] == []
+    assert loads == [["api_shift"]]
+    assert "api_gone" not in main.rule_set
+
+def test_list_rules_pages(client):
+    for i in range(5):
+        create(client, "api_page_{}".format(i), "api_rank > {}".format(i))
+
+    names, after = [], None
+    while True:
+        params = {"prefix": "api_page_", "limit": 2, "fields": "name,rule"}
+        if after is not None:
+            params["after"] = after
+        page = [json.loads(line) for line in client.get("/list_rules", params=params).text.splitlines()]
+        if not page:
+            break
+        assert len(page) <= 2
+        names.extend(row["name"] for row in page)
+        after = page[-1]["name"]
+    assert names == ["api_page_{}".format(i) for i in range(5)]
+    assert client.get("/list_rules", params={"fields": "name,size"}).status_code == 400
+
+def test_export_then_import(client):
+    create(client, "api_export", "api_rank >= 3 AND api_team != 'Ops'")
+    exported = [json.loads(line) for line in client.get("/export_rules").text.splitlines()]
+    assert {"name": "api_export", "rule": "api_rank >= 3 AND api_team != 'Ops'"} in exported
+
+    result = import_rules(client, [("api_export", "api_rank >= 4"), ("api_imported", "api_rank < 1")])
+    assert result["created"] == 1 and [error["name"] for error in result["errors"]] == ["api_export"]
+    assert evaluate(client, "api_imported", {"api_rank": 0}) is True
+
+def test_import_streams_in_batches(client, monkeypatch):
+    from rule_engine import bulk, main
+    monkeypatch.setattr(bulk, "DEFAULT_BATCH_SIZE", 2)
+    starts = []
+    parse_rules = bulk.parse_rules
+    monkeypatch.setattr(bulk, "parse_rules", lambda lines, start: starts.append(start) or parse_rules(lines, start=start))
+
+    def chunks():
+        # lines split across chunks, as a client streaming the upload sends them
+        yield b'{"name": "api_batch_1", "rule": "api_batch > 1"}\n{"name": "api_ba'
+        yield b'tch_2", "rule": "api_batch > 2"}\n\n{"name": "api_batch_3", "rule": "api_batch >'
+        yield b'"}\n{"name": "api_batch_4", "rule": "' + b' ' * main.streaming.DEFAULT_MAX_RECORD + b'api_batch > 4"}\n'
+        yield b'{"name": "api_batch_5", "rule": "api_batch > 5"}'
+    response = client.post("/import_rules", content=chunks())
+    assert response.status_code == 200, response.text
+    result = response.json()
+
+    assert result["created"] == 3
+    assert [(error["line"], error["name"]) for error in result["errors"]] == [(4, "api_batch_3"), (5, None)]
+    assert "Record longer than" in result["errors"][1]["error"]
+    assert starts[0] == 1 and len(starts) > 1     # parsed in more than one batch
+    assert evaluate(client, "api_batch_5", {"api_batch": 6}) is True
+
+def test_invalidation_while_loading_is_kept(client, monkeypatch):
+    from rule_engine import main
+    create(client, "api_racing", "api_rank > 1")
+    get_rule = main.database.get_rule
+
+    def get_rule_then_modified(db, rule_name):
+        # a modification lands between the read and the cache insert
+        rule = get_rule(db, rule_name)
+        main.rule_cache.invalidate(rule_name)
+        return rule
+    monkeypatch.setattr(main.database, "get_rule", get_rule_then_modified)
+
+    main.rule_cache.invalidate("api_racing")
+    assert evaluate(client, "api_racing", {"api_rank": 2}) is True
+    assert "api_racing" not in main.rule_cache
+
+def test_patch_rule(client):
+    create(client, "api_limit", "api_score > 50 AND api_region = 'EU'")
+    create(client, "api_limit_user", "@api_limit OR api_score < 0")
+    data = {"api_score": 60, "api_region": "EU"}
+    assert evaluate(client, "api_limit_user", data) is True
+
+    response = client.post("/patch_rule", json={"name": "api_limit", "patches": [
+        {"path": "/left", "action": "set_value", "value": 70},
+        {"action": "set_op", "value": "OR"},
+    ]})
+    assert response.status_code == 200, response.text
+    assert client.get("/list_rules", params={"prefix": "api_limit", "limit": 1, "fields": "rule"}).json() == \
+        {"name": "api_limit", "rule": "api_score > 70 OR api_region = 'EU'"}
+    assert evaluate(client, "api_limit", {"api_score": 60, "api_region": "US"}) is False
+    assert evaluate(client, "api_limit_user", {"api_score": 60, "api_region": "US"}) is False
+
+    # a rule holding a reference is patched as stored, the reference kept
+    response = client.post("/patch_rule", json={"name": "api_limit_user", "patches": [
+        {"path": "/right", "action": "replace", "value": "api_score < -5"}]})
+    assert response.status_code == 200, response.text
+    assert response.json()["left"]["type"] == "reference"
+    assert evaluate(client, "api_limit_user", {"api_score": -3, "api_region": "US"}) is False
+
+    assert client.post("/patch_rule", json={"name": "api_limit", "patches": [
+        {"path": "/left/left", "action": "set_op", "value": "AND"}]}).status_code == 400
+    assert client.post("/patch_rule", json={"name": "api_unknown", "patches": []}).status_code == 404
+
+def test_import_type_conflict_in_parallel(client, monkeypatch):
+    from functools import partial
+    from rule_engine import bulk
+    monkeypatch.setattr(bulk, "PARALLEL_MIN_RULES", 1)
+    monkeypatch.setattr(bulk, "parse_rules", partial(bulk.parse_rules, workers=2, chunk_size=2))
+
+    # the second worker sees the string comparision before the number one of the first chunk
+    result = import_rules(client, [("api_par_1", "api_par > 1"), ("api_par_2", "api_other > 1"),
+                                   ("api_par_3", "api_par = 'x'"), ("api_par_4", "api_par > 5")])
+    assert result["created"] == 3
+    assert [(error["line"], error["name"]) for error in result["errors"]] == [(3, "api_par_3")]
+    assert client.get("/get_catalog").json()["api_par"] == "NUMBER"
+    assert evaluate(client, "api_par_4", {"api_par": 6}) is True
+
+def test_streaming_upload(client):
+    create(client, "api_stream", "api_qty >= 10 AND api_unit = 'kg'")
+
+    def chunks():
+        # records split across chunks, as a client streaming the upload sends them
+        yield b'{"api_qty": 12, "api_unit": "kg"}\n{"api_qty": 3, '
+        yield b'"api_unit": "kg"}\n{"api_qty": 20}\nnot json\n'
+    response = client.post("/evaluate_rule_stream", params={"rule_name": "api_stream"}, content=chunks())
+    assert response.status_code == 200, response.text
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert results[:2] == [{"result": True}, {"result": False}]
+    assert "error" in results[2] and "error" in results[3]
+
+    response = client.post("/evaluate_rule_stream", params={"rule_name": "api_stream"},
+                           content="api_qty,api_unit\n15,kg\n", headers={"content-type": "text/csv"})
+    assert [json.loads(line) for line in response.text.splitlines()] == [{"result": True}]
+    assert client.post("/evaluate_rule_stream", params={"rule_name": "api_missing"}, content=b"").status_code == 404
+
+def test_patch_keeps_change_from_another_worker(client):
+    from rule_engine import main
+    create(client, "api_worker", "api_tenure > 30 AND api_unit = 'Sales'")
+    assert evaluate(client, "api_worker", {"api_tenure": 40, "api_unit": "Sales"}) is True   # cached
+
+    # another worker modifies the row, this worker's cache doesn't know
+    rule_ast, rule_hash, rule_json, rule_bin = main.build_rule("api_tenure > 30 AND api_unit = 'HR'")
+    db = models.SessionLocal()
+    try:
+        main.database.modify_rule(db, "api_worker", new_rule_str="api_tenure > 30 AND api_unit = 'HR'",
+                                  new_rule_json=rule_json, new_rule_bin=rule_bin, new_rule_hash=rule_hash)
+    finally:
+        db.close()
+
+    response = client.post("/patch_rule", json={"name": "api_worker", "patches": [
+        {"path": "/left", "action": "set_value", "value": 35}]})
+    assert response.status_code == 200, response.text
+    assert client.get("/list_rules", params={"prefix": "api_worker", "fields": "rule"}).json()["rule"] == \
+        "api_tenure > 35 AND api_unit = 'HR'"
+    assert evaluate(client, "api_worker", {"api_tenure": 40, "api_unit": "HR"}) is True
+
+def test_invalidation_while_patching_is_kept(client, monkeypatch):
+    from rule_engine import main
+    create(client, "api_patch_race", "api_rank > 1 AND api_team = 'Ops'")
+    modify_rule = main.database.modify_rule
+
+    def modify_rule_then_modified(db, rule_name, **kwargs):
+        # another modification lands between the patch's write and its cache insert
+        rule = modify_rule(db, rule_name, **kwargs)
+        main.rule_cache.invalidate(rule_name)
+        return rule
+    monkeypatch.setattr(main.database, "modify_rule", modify_rule_then_modified)
+
+    response = client.post("/patch_rule", json={"name": "api_patch_race", "patches": [
+        {"path": "/left", "action": "set_value", "value": 2}]})
+    assert response.status_code == 200, response.text
+    assert "api_patch_race" not in main.rule_cache
+
+def test_profile_keeps_references(client):
+    create(client, "api_prof_a", "api_wage > 10 AND api_role = 'dev'")
+    create(client, "api_prof_b", "@api_prof_a OR api_wage > 100")
+    stored = client.get("/get_rule", params={"rule_name": "api_prof_b"}).json()
+
+    response = client.post("/evaluate_rule", json={"rule_name": "api_prof_b", "profile": True,
+                                                   "data": {"api_wage": 20, "api_role": "dev"}})
+    assert response.status_code == 200, response.text
+    tree = response.json()["profile"]
+    assert tree["left"] == dict(stored["left"], profile=tree["left"]["profile"])
+    assert tree["left"]["profile"]["result"] is True
+
+    response = client.post("/evaluate_rule_batch", json={"rule_name": "api_prof_b", "profile": True,
+                                                         "data": [{"api_wage": 200, "api_role": "ops"}]})
+    assert response.json()["profile"]["left"]["type"] == "reference"
+
+def store_attribute(attr, attr_type):
+    """Store a catalog entry directly, as another worker would."""
+    db = models.SessionLocal()
+    try:
+        if db.query(models.CatalogEntry).filter(models.CatalogEntry.attr == attr).first() is None:
+            db.add(models.CatalogEntry(attr=attr, attr_type=attr_type))
+            db.commit()
+    finally:
+        db.close()
+
+def test_sync_catalog_batches_and_checks_version():
+    from sqlalchemy import event
+    from rule_engine import database
+    from rule_engine.catalog import Catalog
+    store_attribute("api_cat_taken", "STRING")
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper())
+    event.listen(models.engine, "before_cursor_execute", listener)
+    catalog = Catalog()
+    db = models.SessionLocal()
+    try:
+        for i in range(3):
+            catalog.register("api_cat_{}".format(i), "NUMBER")
+        catalog.register("api_cat_taken", "NUMBER")
+        database.sync_catalog(db, catalog)
+        assert statements.count("INSERT") == 1
+        assert catalog.pending() == {} and catalog["api_cat_taken"] == "STRING" and catalog["api_cat_0"] == "NUMBER"
+
+        # nothing pending and nothing new: a single query of the highest id
+        statements.clear()
+        assert database.sync_catalog(db, catalog) == 0
+        assert statements == ["SELECT"]
+    finally:
+        event.remove(models.engine, "before_cursor_execute", listener)
+        db.close()
+
+def test_attribute_stored_by_another_worker_rejects_rule(client):
+    store_attribute("api_conflict", "STRING")
+
+    response = client.post("/create_rule", json={"name": "api_conflicting", "rule": "api_conflict > 3"})
+    assert response.status_code == 400 and "api_conflict" in response.json()["detail"]
+    assert client.get("/get_rule", params={"rule_name": "api_conflicting"}).status_code == 404
+
+    store_attribute("api_conflict_import", "STRING")
+    result = import_rules(client, [("api_conflicting_import", "api_conflict_import > 3")])
+    assert result["created"] == 0 and result["errors"][0]["name"] == "api_conflicting_import"
+
+def test_catalog_checked_once_per_interval(client, monkeypatch):
+    from rule_engine import main
+    syncs = []
+    sync_catalog = main.database.sync_catalog
+    monkeypatch.setattr(main.database, "sync_catalog", lambda db, catalog: syncs.append(1) or sync_catalog(db, catalog))
+    monkeypatch.setattr(main, "CATALOG_SYNC_INTERVAL", 60)
+    monkeypatch.setattr(main, "catalog_checked_at", None)
+
+    for _ in range(3):
+        assert client.get("/get_catalog").status_code == 200
+    assert len(syncs) == 1
@@ -0,0 +1,51 @@
+import random
+from benchmarks import suite, large
+from benchmarks.synthetic import make_rule, make_records, ATTRIBUTES
+from rule_engine.abstract_tree import AST
+
+def test_make_rule_shape():
+    rule = make_rule(depth=2, width=3, rng=random.Random(1))
+    node = AST().create_rule(rule)
+
+    comparisions = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.type == "comparision":
+            comparisions += 1
+        else:
+            stack.extend((current.left, current.right))
+    assert comparisions == 9
+
+def test_synthetic_records_evaluate():
+    rule = make_rule(depth=3, width=2)
+    ast = AST()
+    ast.create_rule(rule)
+
+    for data in make_records(20):
+        assert set(data) == set(ATTRIBUTES)
+        assert ast.evaluate_rule(data) in (True, False)
+
+def test_suite_run_and_compare():
+    results = suite.run(rules=5, depth=1, width=2, records=10, repeat=1, number=1, api=False)
+
+    assert {'tokenize', 'parser', 'ast_to_json', 'json_to_ast', 'node_evaluate', 'combine_rules'} <= set(results['results'])
+    assert results['meta']['params']['rules'] == 5
+
+    slower = {'results': {name: dict(result, best_sec=result['best_sec'] * 2) for name, result in results['results'].items()}}
+    rows = suite.compare(results, slower)
+    assert all(row['regression'] for row in rows)
+    assert not any(row['regression'] for row in suite.compare(slower, results))
+
+    # a baseline below the timer resolution can't be compared
+    zero = {'results': {name: dict(result, best_sec=0.0) for name, result in results['results'].items()}}
+    rows = suite.compare(zero, slower)
+    assert all(row['ratio'] is None and not row['regression'] for row in rows)
+    assert "n/a" in suite.report(slower, rows)
+
+def test_large_rules_run():
+    results = large.run(sizes=[1500], repeat=1)
+
+    assert set(results) == {"chain/1500", "nested/1500"}
+    assert all(times["current"] is not None for stages in results.values() for times in stages.values())
+    assert results["nested/1500"]["parse"]["recursive"] is None
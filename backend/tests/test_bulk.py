@@ -0,0 +1,82 @@
+import json
+from collections import namedtuple
+from benchmarks.synthetic import make_rules
+from rule_engine import bulk
+from rule_engine.bulk import ParsedRule, FailedRule, parse_rules, export_ndjson
+
+StoredRule = namedtuple('StoredRule', ['rule_name', 'rule_str', 'rule_json', 'rule_bin'])
+
+def ndjson(rules):
+    return [json.dumps({"name": "rule_{}".format(i), "rule": rule}) for i, rule in enumerate(rules)]
+
+def test_parse_rules_reports_errors_by_line():
+    lines = [
+        json.dumps({"name": "ok", "rule": "age > 30 AND department = 'Sales'"}),
+        "",
+        "{not json",
+        json.dumps({"name": "bad", "rule": "age >"}),
+        json.dumps({"rule": "age > 30"}),
+        json.dumps({"name": "simplified", "rule": "age > 30 AND age > 30", "optimize": True}),
+    ]
+    results = parse_rules(lines, workers=1)
+
+    assert [type(res) for res in results] == [ParsedRule, FailedRule, FailedRule, FailedRule, ParsedRule]
+    assert [res.line for res in results] == [1, 3, 4, 5, 6]
+    assert results[2].name == "bad"
+    assert results[0].attrs == {"age": "NUMBER", "department": "STRING"}
+    assert json.loads(results[4].rule_json)["type"] == "comparision"
+
+def test_parse_rules_from_line():
+    lines = [json.dumps({"name": "later", "rule": "age > 40"}), "", ValueError("Record longer than 10 characters")]
+    results = parse_rules(lines, workers=1, start=101)
+
+    assert [res.line for res in results] == [101, 103]
+    assert results[1] == FailedRule(103, None, "Record longer than 10 characters")
+
+def test_first_rule_fixes_attribute_type():
+    lines = [
+        json.dumps({"name": "a", "rule": "bulk_level > 3"}),
+        json.dumps({"name": "b", "rule": "bulk_level = 'high'"}),
+    ]
+    results = parse_rules(lines, workers=1)
+
+    assert isinstance(results[0], ParsedRule)
+    assert isinstance(results[1], FailedRule) and "bulk_level" in results[1].error
+
+def test_parallel_parse_matches_serial(monkeypatch):
+    lines = ndjson(make_rules(60, depth=3, width=3, seed=4))
+    serial = parse_rules(lines, workers=1)
+    monkeypatch.setattr(bulk, "PARALLEL_MIN_RULES", 1)
+    parallel = parse_rules(lines, workers=2, chunk_size=7)
+
+    assert parallel == serial
+
+def test_export_round_trips():
+    lines = ndjson(make_rules(25, depth=2, width=3, seed=5))
+    stored = [StoredRule(rule.name, rule.rule_str, rule.rule_json, rule.rule_bin) for rule in parse_rules(lines, workers=1)]
+    stored.append(StoredRule("no_str", None, stored[0].rule_json, None))
+
+    chunks = list(export_ndjson(stored, chunk_size=10))
+    assert len(chunks) == 3
+    exported = parse_rules("".join(chunks).splitlines(), workers=1)
+    assert [rule.rule_json for rule in exported] == [rule.rule_json for rule in stored]
+
+def test_parallel_type_conflicts_match_serial(monkeypatch):
+    """
+    A worker only knows the earlier lines of its own chunk, the rules it rejects
+    over a type conflict are checked again in input order.
+    """
+    def conflicting(attr):
+        rules = ["{} > 1".format(attr)] + ["bulk_filler > {}".format(i) for i in range(199)]
+        rules += ["{} = 'x'".format(attr), "{} > 5".format(attr)] + ["bulk_filler > {}".format(i) for i in range(100)]
+        return ndjson(rules)
+
+    def outcome(results, attr):
+        return [(type(res).__name__, res.line, getattr(res, "error", "").replace(attr, "attr")) for res in results]
+
+    serial = parse_rules(conflicting("bulk_serial"), workers=1)
+    monkeypatch.setattr(bulk, "PARALLEL_MIN_RULES", 1)
+    parallel = parse_rules(conflicting("bulk_parallel"), workers=2)
+
+    assert outcome(parallel, "bulk_parallel") == outcome(serial, "bulk_serial")
+    assert [res.line for res in serial if isinstance(res, FailedRule)] == [201]
@@ -0,0 +1,73 @@
+import pytest
+from rule_engine.cache import RuleCache
+
+class FakeTimer:
+    """Manually advanced clock for TTL tests."""
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def test_cache_hit_and_miss():
+    cache = RuleCache(maxsize=2)
+    assert cache.get("rule1") is None
+
+    cache.put("rule1", "ast1")
+    assert cache.get("rule1") == "ast1"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+def test_cache_lru_eviction():
+    cache = RuleCache(maxsize=2)
+    cache.put("rule1", "ast1")
+    cache.put("rule2", "ast2")
+
+    # touching rule1 makes rule2 the least recently used entry
+    cache.get("rule1")
+    cache.put("rule3", "ast3")
+
+    assert "rule1" in cache
+    assert "rule2" not in cache
+    assert "rule3" in cache
+    assert cache.stats()["evictions"] == 1
+
+def test_cache_ttl_expiry():
+    timer = FakeTimer()
+    cache = RuleCache(maxsize=2, ttl=10, timer=timer)
+    cache.put("rule1", "ast1")
+
+    timer.now = 5
+    assert cache.get("rule1") == "ast1"
+
+    timer.now = 10
+    assert cache.get("rule1") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_cache_invalidate():
+    cache = RuleCache()
+    cache.put("rule1", "ast1")
+    cache.invalidate("rule1")
+    cache.invalidate("missing")
+
+    assert cache.get("rule1") is None
+    assert len(cache) == 0
+
+def test_cache_invalid_size():
+    with pytest.raises(ValueError):
+        RuleCache(maxsize=0)
+
+def test_cache_put_skips_invalidated_generation():
+    cache = RuleCache()
+    generation = cache.generation("rule1")
+    cache.invalidate("rule1")
+    assert cache.put("rule1", "stale", generation=generation) is False
+    assert "rule1" not in cache
+
+    generation = cache.generation("rule1")
+    assert cache.put("rule1", "ast1", generation=generation) is True
+    generation = cache.generation("rule1")
+    cache.clear()
+    assert cache.put("rule1", "stale", generation=generation) is False
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from rule_engine.catalog import Catalog, is_number
+
+def test_register_keeps_first_type():
+    catalog = Catalog()
+
+    assert catalog.register("age", "NUMBER") == "NUMBER"
+    assert catalog.register("age", "STRING") == "NUMBER"
+    assert catalog["age"] == "NUMBER"
+    assert "age" in catalog and "salary" not in catalog
+    assert catalog.get("salary") is None
+    assert catalog.snapshot() == {"age": "NUMBER"}
+
+def test_validators():
+    catalog = Catalog()
+    catalog.register("age", "NUMBER")
+    catalog.register("department", "STRING")
+
+    assert catalog.validator("age") is is_number
+    assert catalog.validator("age")(3.5) and not catalog.validator("age")("3.5")
+    assert catalog.validator("department")(12)
+    assert catalog.validator("salary") is None
+    assert catalog.attribute("department", "NUMBER").type == "STRING"
+
+def test_pending_and_load():
+    """
+    Registered attributes stay pending until loaded back from storage,
+    loaded types override the ones registered in memory.
+    """
+    catalog = Catalog()
+    catalog.register("age", "NUMBER")
+    catalog.register("department", "NUMBER")
+    assert catalog.pending() == {"age": "NUMBER", "department": "NUMBER"}
+
+    catalog.load({"age": "NUMBER", "department": "STRING"}, version=2)
+    assert catalog.pending() == {}
+    assert catalog["department"] == "STRING"
+    assert catalog.version == 2
+
+    catalog.load({"salary": "NUMBER"}, version=1)
+    assert catalog.version == 2
+
+def test_concurrent_registration():
+    """
+    Threads racing to register the same attributes all get the type that was stored first.
+    """
+    catalog = Catalog()
+
+    def register(i):
+        attr_type = "NUMBER" if i % 2 else "STRING"
+        return [catalog.register("attr_{}".format(j), attr_type) for j in range(200)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(register, range(16)))
+
+    for j in range(200):
+        assert len({result[j] for result in results}) == 1
+    assert len(catalog.pending()) == 200
@@ -0,0 +1,48 @@
+import pytest
+from rule_engine.abstract_tree import AST, ast_to_json
+from rule_engine.codec import encode, decode, version, FORMAT_VERSION
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def test_encode_decode_roundtrip(ast):
+    rule = "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) AND (salary > 50000.5 OR experience > 5)"
+    ast.create_rule(rule)
+
+    data = encode(ast.root)
+
+    assert version(data) == FORMAT_VERSION
+    assert ast_to_json(decode(data)) == ast_to_json(ast.root)
+    assert len(data) < len(ast_to_json(ast.root))
+
+def test_encode_decode_evaluated_constants(ast):
+    """
+    Constants converted by the interpreter (floats) or set by hand (ints) keep their type.
+    """
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    ast.root.right.right = "Sales"
+    ast.root.left.right = 40
+    ast.evaluate_rule({"age": 20, "department": "Sales"})
+
+    assert ast_to_json(decode(encode(ast.root))) == ast_to_json(ast.root)
+
+def test_decode_deep_combined_rule(ast):
+    combined = ast.combine_rules(["age > {}".format(i) for i in range(5000)], operator="OR")
+
+    decoded = decode(encode(combined))
+
+    assert decoded.right.right == "4999"
+    assert decoded.op == "OR"
+
+def test_decode_rejects_unknown_data():
+    assert version(b"") is None
+    assert version(None) is None
+    with pytest.raises(ValueError):
+        decode(b'{"type": "comparision"}')
+
+    data = bytearray(encode(AST().create_rule("age > 30")))
+    data[2] = FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        decode(bytes(data))
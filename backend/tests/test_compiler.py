@@ -0,0 +1,96 @@
+import pytest
+from rule_engine.abstract_tree import AST
+from rule_engine.compiler import CompiledRule, compile_closures, compile_source, operands
+from rule_engine.parser import Node
+
+RULE = "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) AND (salary > 50000 OR experience > 5)"
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def test_compiled_matches_interpreter(ast):
+    """
+    Compiled rule gives the same result as Node.evaluate for various records.
+    """
+    ast.create_rule(RULE)
+    compiled = ast.compile()
+
+    records = [
+        {"age": 35, "department": "Sales", "salary": 60000, "experience": 3},
+        {"age": 25, "department": "Marketing", "salary": 60000, "experience": 3},
+        {"age": 20, "department": "Marketing", "salary": 1000, "experience": 6},
+        {"age": 40.5, "department": "Sales", "salary": 100, "experience": 1},
+        {"age": 40, "department": "HR", "salary": 100000, "experience": 10},
+    ]
+    closures = compile_closures(ast.root)
+    for data in records:
+        assert compiled.evaluate(data) is ast.evaluate_rule(data)
+        assert closures(data) is ast.evaluate_rule(data)
+
+def test_compiled_number_equality(ast):
+    ast.create_rule("age = 30 OR age != 40")
+    compiled = ast.compile()
+
+    assert compiled({"age": 30}) is True
+    assert compiled({"age": 40}) is False
+
+def test_compiled_type_error(ast):
+    ast.create_rule("age > 30 AND salary > 50000")
+    compiled = ast.compile()
+
+    with pytest.raises(Exception) as excinfo:
+        compiled({"age": "thirty-five", "salary": 60000})
+    assert "TypeError" in str(excinfo.value)
+
+def test_compiled_missing_data(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    compiled = ast.compile()
+
+    with pytest.raises(Exception) as excinfo:
+        compiled({"age": 40, "Salary": 5000})
+    assert "InsufficientDataError" in str(excinfo.value)
+
+    # short circuiting skips the missing attribute, same as the interpreter
+    assert compiled({"age": 20}) is False
+
+def test_compiled_empty_rule():
+    assert CompiledRule(None)({}) is True
+
+def test_compiled_deep_combined_rule(ast):
+    """
+    Long chains from combine_rules are flattened instead of compiled recursively.
+    """
+    rules = ["age > {}".format(i) for i in range(3000)]
+    combined = ast.combine_rules(rules, operator="AND")
+
+    assert len(operands(combined)) == 3000
+    compiled = CompiledRule(combined)
+    assert compiled({"age": 5000}) is True
+    assert compiled({"age": 100}) is False
+
+def test_operands_keeps_order():
+    a = Node(type="comparision", left="a", op="=", right="x", attrType="STRING")
+    b = Node(type="comparision", left="b", op="=", right="x", attrType="STRING")
+    c = Node(type="comparision", left="c", op="=", right="x", attrType="STRING")
+    node = Node(type="operator", left=Node(type="operator", left=a, op="OR", right=b), op="OR", right=c)
+
+    assert operands(node) == [a, b, c]
+
+def test_compiled_deeply_nested_rule(ast):
+    """
+    Rules nested beyond what the Python compiler accepts fall back to an iterative evaluator.
+    """
+    rule = "age > 1"
+    for i in range(300):
+        op = "AND" if i % 2 else "OR"
+        rule = "(" + rule + ") " + op + " salary > {}".format(i)
+    ast.create_rule(rule)
+
+    with pytest.raises((RecursionError, MemoryError, SyntaxError)):
+        compile_source(ast.root)
+
+    compiled = ast.compile()
+    data = {"age": 5, "salary": 1000}
+    assert compiled(data) is ast.evaluate_rule(data)
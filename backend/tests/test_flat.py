@@ -0,0 +1,69 @@
+import random
+import pytest
+from rule_engine.abstract_tree import AST, ast_to_json
+from rule_engine.flat import FlatAST
+from rule_engine.parser import Node
+
+RULE = "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) AND (salary > 50000 OR experience > 5)"
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def outcome(func, data):
+    try:
+        return func(data)
+    except Exception as e:
+        return type(e).__name__
+
+def test_flat_matches_interpreter(ast):
+    ast.create_rule(RULE)
+    flat = ast.flatten()
+
+    rng = random.Random(9)
+    for _ in range(500):
+        data = {
+            "age": rng.choice([20, 25, 30, 35.5, "old"]),
+            "department": rng.choice(["Sales", "Marketing", "HR"]),
+            "salary": rng.choice([1000, 50000, 60000]),
+            "experience": rng.choice([1, 5, 10]),
+        }
+        if rng.random() < 0.2:
+            del data[rng.choice(list(data))]
+        assert outcome(flat.evaluate, data) == outcome(ast.evaluate_rule, data)
+
+def test_flat_interns_attributes_and_constants(ast):
+    ast.create_rule("(age > 30 AND age < 60) OR (salary > 30 AND age > 30)")
+    flat = ast.flatten()
+
+    assert len(flat) == 7
+    assert flat.attrs == ["age", "salary"]
+    assert flat.consts == ['30', '60']
+    assert flat.numbers == [30.0, 60.0]
+
+def test_flat_roundtrip(ast):
+    ast.create_rule(RULE)
+    node = ast.flatten().to_node()
+
+    assert ast_to_json(node) == ast_to_json(ast.root)
+
+def test_flat_empty_rule():
+    flat = FlatAST.from_node(None)
+
+    assert len(flat) == 0
+    assert flat.evaluate({}) is True
+    assert flat.to_node() is None
+
+def test_deeply_nested_rule_without_recursion():
+    """
+    Nesting far beyond the recursion limit evaluates with the interpreter and FlatAST alike.
+    """
+    node = Node(type="comparision", left="age", op=">", right=1, attrType="NUMBER")
+    for i in range(5000):
+        leaf = Node(type="comparision", left="salary", op=">", right=i, attrType="NUMBER")
+        node = Node(type="operator", left=node, op="AND" if i % 2 else "OR", right=leaf)
+    flat = FlatAST.from_node(node)
+
+    for data in ({"age": 5, "salary": 10000}, {"age": 0, "salary": 10}):
+        assert flat.evaluate(data) is node.evaluate(data)
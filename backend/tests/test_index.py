@@ -0,0 +1,97 @@
+import random
+import pytest
+from rule_engine.abstract_tree import AST
+from rule_engine.index import PredicateIndex
+
+def random_rule(rng, depth=3):
+    """Random rule string over age, salary and department."""
+    if depth == 0 or rng.random() < 0.3:
+        if rng.random() < 0.3:
+            return "department {} '{}'".format(rng.choice(["=", "!="]), rng.choice(["Sales", "HR", "Marketing"]))
+        attr = rng.choice(["age", "salary"])
+        return "{} {} {}".format(attr, rng.choice([">", ">=", "<", "<=", "=", "!="]), rng.randrange(0, 60, 5))
+    op = rng.choice(["AND", "OR"])
+    return "({}) {} ({})".format(random_rule(rng, depth - 1), op, random_rule(rng, depth - 1))
+
+def random_record(rng):
+    record = {"age": rng.randrange(0, 60, 5), "salary": rng.randrange(0, 60, 5),
+              "department": rng.choice(["Sales", "HR", "Marketing", "Legal"])}
+    for attr in ["age", "salary", "department"]:
+        if rng.random() < 0.1:
+            del record[attr]
+    if rng.random() < 0.05:
+        record["age"] = "unknown"
+    return record
+
+def outcome(evaluate, data):
+    try:
+        return evaluate(data)
+    except Exception as e:
+        return type(e).__name__
+
+def test_index_matches_interpreter():
+    rng = random.Random(7)
+    index = PredicateIndex()
+    asts = {}
+    for i in range(200):
+        asts["rule{}".format(i)] = AST().create_rule(random_rule(rng))
+        index.add("rule{}".format(i), asts["rule{}".format(i)])
+
+    for _ in range(200):
+        data = random_record(rng)
+        results = index.evaluate(data)
+        expected_matches = []
+        for name, node in asts.items():
+            expected = outcome(node.evaluate, data)
+            got = results[name]
+            assert (type(got).__name__ if isinstance(got, Exception) else bool(got)) == (expected if isinstance(expected, str) else bool(expected))
+            if expected is True:
+                expected_matches.append(name)
+        assert index.match(data) == expected_matches
+        errors = {}
+        assert index.match(data, errors=errors) == expected_matches
+        assert {name: type(e) for name, e in errors.items()} == \
+            {name: type(res) for name, res in results.items() if isinstance(res, Exception)}
+
+def test_index_deduplicates_predicates():
+    ast = AST()
+    index = PredicateIndex()
+    index.add("r1", ast.create_rule("age > 30 AND department = 'Sales'"))
+    index.add("r2", ast.create_rule("age > 30 OR salary > 50000"))
+    index.add("r3", ast.create_rule("age > 30.0 AND department = 'Sales'"))
+
+    assert len(index.predicates) == 3
+
+    index.remove("r1")
+    index.remove("r3")
+    assert len(index.predicates) == 2
+    assert "department" not in index.attrs
+
+def test_index_match_skips_rules_without_true_predicates():
+    ast = AST()
+    index = PredicateIndex()
+    for i in range(100):
+        index.add("r{}".format(i), ast.create_rule("age = {} AND salary > 10".format(i)))
+
+    true, bad = index.evaluate_predicates({"age": 42, "salary": 20})
+
+    assert len(true) == 2
+    assert index.match({"age": 42, "salary": 20}) == ["r42"]
+    assert index.match({"age": 42, "salary": 20}, ["r1", "r42"]) == ["r42"]
+
+def test_index_errors():
+    ast = AST()
+    index = PredicateIndex()
+    index.add("r1", ast.create_rule("age > 30 AND salary > 50000"))
+
+    results = index.evaluate({"age": "thirty", "salary": 1})
+    assert "TypeError" in str(results["r1"])
+
+    # ints beyond the float range error like in the interpreter
+    results = index.evaluate({"age": 10 ** 400, "salary": 1})
+    assert type(results["r1"]).__name__ == outcome(ast.create_rule("age > 30 AND salary > 50000").evaluate, {"age": 10 ** 400, "salary": 1})
+    assert index.match({"age": 10 ** 400, "salary": 10 ** 6}) == []
+
+    results = index.evaluate({"age": 40})
+    assert "InsufficientDataError" in str(results["r1"])
+    assert index.match({"age": 40}) == []
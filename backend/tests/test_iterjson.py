@@ -0,0 +1,30 @@
+import json
+import pytest
+from rule_engine import iterjson
+
+DOCUMENTS = [
+    '{"type": "operator", "op": "AND", "attrType": null, "left": {"a": [1, -2.5, 3e2, true, false]}, "right": {}}',
+    '[{"k\\u00e9y": "v\\"al\\\\ue\\n"}, [], [[]], "", 0, -0.0, 1E-3, NaN]',
+    ' \n{ "a" :\t[ 1 , { "b" : null } ] } ',
+    '"just a string"',
+]
+
+def test_loads_matches_json():
+    for doc in DOCUMENTS:
+        expected, decoded = json.loads(doc), iterjson.loads(doc)
+        assert json.dumps(decoded) == json.dumps(expected)
+    hook = lambda obj: sorted(obj)
+    assert iterjson.loads(DOCUMENTS[0], object_hook=hook) == json.loads(DOCUMENTS[0], object_hook=hook)
+
+def test_loads_without_recursion():
+    depth = 20000
+    doc = '{"left": ' * depth + '1' + '}' * depth
+    value = iterjson.loads(doc)
+    for _ in range(depth):
+        value = value["left"]
+    assert value == 1
+
+@pytest.mark.parametrize("doc", ['', '{', '[1,]', '{"a" 1}', '{"a": 1,}', '[1 2]', '1 2', '{1: 2}', 'tru', '"abc'])
+def test_loads_invalid(doc):
+    with pytest.raises(json.JSONDecodeError):
+        iterjson.loads(doc)
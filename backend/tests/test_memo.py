@@ -0,0 +1,53 @@
+import pytest
+from globalDS import catalog
+from rule_engine.abstract_tree import AST, ast_to_json
+from rule_engine.memo import ParseMemo, normalize, content_hash
+
+def test_normalized_text_hits():
+    memo = ParseMemo(maxsize=8)
+    node = memo.parse("age > 30 AND department = 'Sales'")
+
+    assert memo.parse("  age >  30\tAND department = ' Sales'  ") is not node
+    assert memo.parse("age > 30 AND department = 'Sales'") is node
+    assert memo.parse(" age > 30  AND\ndepartment = 'Sales' ") is node
+    stats = memo.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 2, 2)
+    assert stats["hit_rate"] == 0.5
+
+def test_normalize_keeps_tokens():
+    assert normalize(" a  >\n3 ") == "a > 3"
+    assert normalize("a > = 3") != normalize("a >= 3")
+
+def test_content_hash_ignores_spacing_and_parentheses():
+    memo = ParseMemo()
+    first = memo.lookup("(age > 30) AND (department = 'Sales')")
+    second = memo.lookup("age > 30 AND department='Sales'")
+
+    assert first.rule_hash == second.rule_hash == content_hash(second.node)
+    assert first.rule_hash != memo.lookup("age > 30 OR department = 'Sales'").rule_hash
+    assert first.attrs == (("age", "NUMBER"), ("department", "STRING"))
+
+def test_stale_entry_after_catalog_change():
+    """
+    A hit whose attribute type was changed in the catalog (loaded from another
+    worker) is parsed again, failing like a first parse would.
+    """
+    memo = ParseMemo()
+    memo.parse("memo_level > 3")
+    catalog.load({"memo_level": "STRING"})
+    try:
+        with pytest.raises(Exception, match="different type"):
+            memo.parse("memo_level > 3")
+        assert memo.stats()["stale"] == 1 and len(memo) == 0
+    finally:
+        catalog.load({"memo_level": "NUMBER"})
+
+def test_combine_rules_through_memo():
+    memo = ParseMemo()
+    ast = AST(memo=memo)
+    rules = ["age > 30", "salary > 5000", "age > 30"]
+    combined = ast.combine_rules(rules, "OR")
+
+    assert memo.stats()["hits"] == 1
+    assert ast_to_json(combined) == ast_to_json(AST().combine_rules(rules, "OR"))
+    assert combined.left.left is combined.right
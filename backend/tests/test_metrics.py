@@ -0,0 +1,72 @@
+import pytest
+from rule_engine import metrics
+from rule_engine.abstract_tree import AST
+from rule_engine.adaptive import AdaptiveRule
+from rule_engine.metrics import Counter, Histogram
+from rule_engine.parser import parse
+
+@pytest.fixture
+def enabled(monkeypatch):
+    """Fixture enabling metrics, cleared before and after each test."""
+    monkeypatch.setattr(metrics, "enabled", True)
+    metrics.clear()
+    yield
+    metrics.clear()
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "lex")
+    histogram.observe(0.5, "lex", count=2)
+    histogram.observe(3, "lex")
+
+    assert histogram.samples() == [
+        'latency_seconds_bucket{stage="lex",le="0.1"} 1',
+        'latency_seconds_bucket{stage="lex",le="1.0"} 3',
+        'latency_seconds_bucket{stage="lex",le="+Inf"} 4',
+        'latency_seconds_sum{stage="lex"} 4.05',
+        'latency_seconds_count{stage="lex"} 4',
+    ]
+
+def test_counter_escapes_label_values():
+    counter = Counter("errors_total", "Errors.", ("type",))
+    counter.inc('a "b"\\')
+    counter.inc('a "b"\\', amount=2)
+
+    assert counter.samples() == ['errors_total{type="a \\"b\\"\\\\"} 3']
+
+def test_nothing_recorded_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", False)
+    metrics.clear()
+    parse("age > 30")
+    evaluate = lambda data: True
+    assert metrics.instrument("rule", evaluate) is evaluate
+    metrics.record_batch("rule", 0.1, [True])
+
+    assert metrics.STAGE_SECONDS.count("lex") == 0 and metrics.EVALUATIONS.value("rule") == 0
+
+def test_stages_and_evaluations(enabled):
+    AST().create_rule("age > 30 AND department = 'Sales'")
+    evaluate = metrics.instrument("adults", AST().create_rule("age > 30").evaluate)
+    evaluate({"age": 40})
+    with pytest.raises(Exception):
+        evaluate({})
+    metrics.record_batch("adults", 0.002, [True, False, ValueError("bad")])
+
+    assert metrics.STAGE_SECONDS.count("lex") == metrics.STAGE_SECONDS.count("parse") == 2
+    assert metrics.STAGE_SECONDS.count("evaluate") == metrics.EVALUATIONS.value("adults") == 5
+    assert metrics.ERRORS.value("InsufficientDataError") == 1 and metrics.ERRORS.value("ValueError") == 1
+    text = metrics.render()
+    assert "# TYPE rule_engine_stage_seconds histogram" in text
+    assert 'rule_engine_evaluations_total{rule="adults"} 5' in text
+
+def test_sampled_predicates_short_circuit(enabled):
+    """
+    Every sampled evaluation counts the comparisions short-circuiting would
+    have evaluated and skipped, in the current evaluation order.
+    """
+    rule = AdaptiveRule(AST().create_rule("age > 30 AND (salary > 5000 OR experience > 3)"), sample_every=1)
+    rule.evaluate({"age": 20, "salary": 0, "experience": 0})
+    assert (metrics.PREDICATES.value("evaluated"), metrics.PREDICATES.value("short_circuited")) == (1, 2)
+
+    rule.evaluate({"age": 40, "salary": 9000, "experience": 0})
+    assert (metrics.PREDICATES.value("evaluated"), metrics.PREDICATES.value("short_circuited")) == (3, 3)
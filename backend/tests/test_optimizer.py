@@ -0,0 +1,76 @@
+import random
+import pytest
+from rule_engine.abstract_tree import AST, ast_to_json
+from rule_engine.optimizer import optimize, count_nodes
+from rule_engine.compiler import nesting_depth, operands
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def rule_of(node):
+    """ Comparisions of an optimized AST as text, in evaluation order """
+    if node.type == "comparision":
+        return "{} {} {}".format(node.left, node.op, node.right)
+    return "(" + " {} ".format(node.op).join(rule_of(child) for child in operands(node)) + ")"
+
+def test_merges_ranges(ast):
+    ast.create_rule("age > 30 AND salary > 100 AND age > 40 AND age <= 60")
+
+    # the merged comparisions take the place of the first one on the attribute
+    assert rule_of(optimize(ast.root)) == "(age > 40 AND age <= 60 AND salary > 100)"
+
+def test_removes_duplicates_and_absorbed(ast):
+    ast.create_rule("(dept = 'Sales' OR age > 30) AND dept = 'Sales' AND (dept = 'Sales' OR age > 30)")
+
+    assert rule_of(optimize(ast.root)) == "dept = Sales"
+
+def test_folds_contradiction(ast):
+    ast.create_rule("(age > 30 AND age < 10) OR (dept = 'HR' AND dept = 'Sales') OR salary > 5")
+
+    assert rule_of(optimize(ast.root)) == "salary > 5"
+
+def test_whole_rule_constant_keeps_witness(ast):
+    ast.create_rule("salary > 5 AND age > 30 AND age < 10")
+    node = optimize(ast.root)
+
+    assert rule_of(node) == "(age > 30 AND age < 10)"
+    assert node.evaluate({"age": 20, "salary": 10}) is False
+
+    ast.create_rule("age > 30 OR salary > 5 OR age <= 30")
+    assert rule_of(optimize(ast.root)) == "(age > 30 OR age <= 30)"
+
+def test_combined_rules_are_balanced(ast):
+    rules = ["age > {} AND dept = 'Sales'".format(i % 50) for i in range(2000)]
+    combined = ast.combine_rules(rules, "OR")
+    optimized = ast.combine_rules(rules, "OR", optimize=True)
+
+    assert count_nodes(optimized) < count_nodes(combined) / 10
+    assert nesting_depth(optimized) < 5
+    assert ast_to_json(optimize(optimized)) == ast_to_json(optimized)
+
+def test_optimized_matches_interpreter(ast):
+    """
+    Randomized rules over a small domain give the same results once optimized.
+    """
+    rng = random.Random(14)
+
+    def comparision():
+        if rng.random() < 0.7:
+            return "{} {} {}".format(rng.choice("ab"), rng.choice([">", ">=", "<", "<=", "=", "!="]), rng.randint(0, 6))
+        return "{} {} '{}'".format(rng.choice("st"), rng.choice(["=", "!="]), rng.choice("xyz"))
+
+    def expr(depth):
+        if depth == 0 or rng.random() < 0.3:
+            return comparision()
+        op = " {} ".format(rng.choice(["AND", "OR"]))
+        return op.join("(" + expr(depth - 1) + ")" for _ in range(rng.randint(2, 4)))
+
+    for _ in range(300):
+        node = ast.create_rule(expr(3))
+        optimized = optimize(node)
+        assert count_nodes(optimized) <= count_nodes(node)
+        for _ in range(20):
+            data = {"a": rng.randint(-1, 7), "b": rng.random() * 7, "s": rng.choice("xyzw"), "t": rng.choice("xyzw")}
+            assert optimized.evaluate(data) is node.evaluate(data)
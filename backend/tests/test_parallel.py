@@ -0,0 +1,59 @@
+import pickle
+import pytest
+from rule_engine.abstract_tree import AST
+from rule_engine.error import TypeError, InsufficientDataError
+from rule_engine.parallel import ParallelEvaluator, evaluate_parallel
+
+RULE = "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) AND (salary > 50000 OR experience > 5)"
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def records(count):
+    departments = ["Sales", "Marketing", "HR"]
+    return [{"age": 18 + i % 50, "department": departments[i % 3], "salary": 1000 * (i % 90), "experience": i % 10}
+            for i in range(count)]
+
+def test_parallel_matches_serial_in_order(ast):
+    ast.create_rule(RULE)
+    data = records(1000)
+
+    results = list(evaluate_parallel(ast.root, data, workers=2, chunk_size=64))
+    assert results == ast.evaluate_many(data)
+
+def test_parallel_errors_inline(ast):
+    ast.create_rule("age > 30 AND salary > 50000")
+    data = [{"age": 40, "salary": 60000}, {"age": "forty", "salary": 1}, {"salary": 1}, {"age": 20}]
+
+    with ParallelEvaluator(ast.root, workers=2, chunk_size=1) as evaluator:
+        results = list(evaluator.evaluate(iter(data)))
+        # the pool is reused across calls
+        assert list(evaluator.evaluate(data[:1])) == [True]
+
+    assert results[0] is True
+    assert isinstance(results[1], TypeError)
+    assert isinstance(results[2], InsufficientDataError)
+    assert str(results[2]) == str(InsufficientDataError("age"))
+    assert results[3] is False
+
+def test_rule_errors_pickle():
+    error = TypeError(attr="age", val="forty", ref="30")
+    copy = pickle.loads(pickle.dumps(error))
+
+    assert type(copy) is TypeError
+    assert str(copy) == str(error)
+    assert copy.attr == "age"
+
+def test_parallel_ndjson(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    lines = ['{"age": 40, "department": "Sales"}\n', '\n', '{"age": 20}\n', 'not json\n', '{"department": "HR"}\n']
+
+    with ParallelEvaluator(ast.root, workers=2, chunk_size=2) as evaluator:
+        output = "".join(evaluator.evaluate_ndjson(lines)).splitlines()
+
+    assert output[:2] == ['{"result": true}', '{"result": false}']
+    assert "Invalid JSON" in output[2]
+    assert "InsufficientDataError" in output[3]
+    assert len(output) == 4
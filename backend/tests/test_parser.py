@@ -66,3 +66,51 @@ def test_parser_invalid_data_type():
         node = parser.expr()
 
     assert "TypeError" in str(e.value)
+
+def test_lexer_token_offsets():
+    rule = "age >= 30.5 && dept = 'Sales'"
+    lexer = Lexer(rule)
+
+    tokens = []
+    token = lexer.get_next_token()
+    while token.type != 'EOF':
+        tokens.append(token)
+        token = lexer.get_next_token()
+
+    assert [(t.type, t.value) for t in tokens] == [
+        (STRING, 'age'), (COMPARISION, '>='), (NUMBER, '30.5'), ('AND', 'AND'),
+        (STRING, 'dept'), (COMPARISION, '='), (STRING, 'Sales'),
+    ]
+    assert [t.pos for t in tokens] == [0, 4, 7, 12, 15, 20, 23]
+    assert token.pos == len(rule)
+
+def test_tokenize_numbers():
+    assert tokenize("salary > 50000") == ['salary', '>', '50000']
+    assert tokenize("a >= 1.25 OR b = -50") == ['a', '>=', '1.25', 'OR', 'b', '=', '-50']
+
+def test_lexer_invalid_token_position():
+    lexer = Lexer("age > 30 @ salary = 5000")
+
+    with pytest.raises(Exception) as e:
+        while lexer.get_next_token().type != 'EOF':
+            pass
+    assert "at position 9" in str(e.value)
+
+def test_parse_nesting_beyond_recursion_limit():
+    depth = 5000
+    rule = "".join("(a{} > {} OR ".format(i % 7, i) for i in range(depth)) + "nest_name = 'x'" + ")" * depth
+    node = Parser(Lexer(rule)).expr()
+
+    for _ in range(depth):
+        assert node.type == "operator" and node.left.type == "comparision"
+        node = node.right
+    assert (node.left, node.right) == ("nest_name", "x")
+
+def test_parser_groups_left_across_parentheses():
+    node = Parser(Lexer("a > 1 AND (b > 2 OR c > 3) OR ((d > 4))")).expr()
+
+    assert node.op == "OR" and node.right.left == "d"
+    assert node.left.op == "AND" and node.left.right.op == "OR"
+
+    with pytest.raises(Exception, match="SyntaxError"):
+        Parser(Lexer("(a > 1 AND (b > 2)")).expr()
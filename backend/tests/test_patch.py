@@ -0,0 +1,85 @@
+import pytest
+from benchmarks.synthetic import make_rules, make_records
+from rule_engine.abstract_tree import AST, ast_to_rule, ast_to_json
+from rule_engine.compiler import CompiledRule, SEGMENT_MIN_OPERANDS
+from rule_engine.patch import Patch, apply_patch, apply_patches
+from rule_engine.ruleset import RuleSet
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def test_ast_to_rule_round_trip(ast):
+    for rule in make_rules(100, depth=4, width=3, seed=11):
+        node = ast.create_rule(rule)
+        assert ast_to_json(ast.create_rule(ast_to_rule(node))) == ast_to_json(node)
+
+def test_patches_share_untouched_subtrees(ast):
+    root = ast.create_rule("(age > 30 AND department = 'Sales') OR (age < 25 AND salary > 5000)")
+    before = ast_to_json(root)
+
+    patched = apply_patches(root, [
+        Patch("/left/left", "set_value", 40),
+        Patch("/right", "set_op", "||"),
+        Patch("/left/right", "set_value", "Marketing"),
+    ])
+
+    assert ast_to_rule(patched) == "(age > 40 AND department = 'Marketing') OR (age < 25 OR salary > 5000)"
+    assert ast_to_json(root) == before
+    assert patched.right.left is root.right.left and patched.right.right is root.right.right
+
+def test_replace_subtree(ast):
+    root = ast.create_rule("age > 30 AND salary > 5000")
+    patched = apply_patch(root, Patch(["right"], "replace", "salary > 5000 OR experience >= 4"))
+
+    assert ast_to_rule(patched) == "age > 30 AND (salary > 5000 OR experience >= 4)"
+    assert patched.left is root.left
+    assert apply_patch(root, Patch("/", "replace", "age = 1")).type == "comparision"
+
+@pytest.mark.parametrize("patch", [
+    Patch("/middle", "set_op", "AND"),
+    Patch("/left/left", "set_op", "AND"),
+    Patch("/left", "set_op", "XOR"),
+    Patch("", "set_op", ">"),
+    Patch("", "set_value", "30"),
+    Patch("/left", "set_value", "3e5"),
+    Patch("/right", "set_value", "two words"),
+    Patch("/left", "rename", "x"),
+])
+def test_invalid_patches(ast, patch):
+    root = ast.create_rule("age > 30 AND department = 'Sales'")
+    with pytest.raises(ValueError):
+        apply_patch(root, patch)
+
+def test_patch_recompiles_changed_segments(ast):
+    rule = " AND ".join("attr_{} > {}".format(i, i) for i in range(SEGMENT_MIN_OPERANDS + 8))
+    root = ast.create_rule(rule)
+    compiled = CompiledRule(root)
+    path = "/left" * 5 + "/right"
+    patched = compiled.patch(apply_patch(root, Patch(path, "set_op", "<")))
+
+    reused = [operand_id for operand_id, segment in patched.segments.items() if compiled.segments.get(operand_id) == segment]
+    assert len(reused) == len(compiled.segments) - 1
+
+    data = {"attr_{}".format(i): i + 1 for i in range(SEGMENT_MIN_OPERANDS + 8)}
+    assert compiled.evaluate(data) is True and patched.evaluate(data) is False
+    data["attr_{}".format(SEGMENT_MIN_OPERANDS + 2)] = 0    # the patched comparision, 6th operand from the right
+    assert patched.evaluate(data) is True
+
+def test_rule_set_patch_keeps_shared_predicates(ast):
+    rule_set = RuleSet()
+    root = ast.create_rule("age > 30 AND department = 'Sales'")
+    rule_set.add("rule", root)
+    rule_set.add("other", ast.create_rule("age > 30"))
+    pids = dict((key, pred.pid) for key, pred in rule_set.index.predicates.items())
+
+    patched = apply_patch(root, Patch("/right", "set_value", "Marketing"))
+    rule_set.patch("rule", patched)
+
+    assert len(rule_set.index.predicates) == 2
+    for key, pred in rule_set.index.predicates.items():
+        if key in pids:
+            assert pred.pid == pids[key]
+    for data in make_records(200):
+        assert rule_set.evaluate(data)["rule"] == CompiledRule(patched).evaluate(data)
@@ -0,0 +1,85 @@
+import json
+import pytest
+from rule_engine.abstract_tree import AST, ast_to_json
+from rule_engine.error import InsufficientDataError
+from rule_engine.parser import Node
+from rule_engine.profile import RuleProfile
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def strip(tree):
+    """The profile tree without its profile entries, for comparing with ast_to_json."""
+    tree = dict(tree)
+    del tree["profile"]
+    if tree["type"] == "operator":
+        tree["left"], tree["right"] = strip(tree["left"]), strip(tree["right"])
+    return tree
+
+def test_single_record_profile(ast):
+    root = ast.create_rule("age > 30 AND (salary > 5000 OR experience > 3)")
+    profile = RuleProfile(root)
+
+    assert profile.evaluate({"age": 40, "salary": 9000, "experience": 1}) is True
+    tree = profile.to_dict()
+    assert strip(tree) == json.loads(ast_to_json(root))
+    assert tree["profile"]["visits"] == 1 and tree["profile"]["result"] is True
+    assert tree["right"]["left"]["profile"]["result"] is True
+    assert tree["right"]["right"]["profile"] == {"visits": 0, "skipped": 1, "passes": 0, "errors": 0, "time_ns": 0}
+    assert tree["profile"]["time_ns"] >= tree["right"]["profile"]["time_ns"] > 0
+
+def test_batch_profile_matches_evaluate(ast):
+    root = ast.create_rule("(age < 30 OR department = 'Sales') AND salary > 5000")
+    records = [
+        {"age": 20, "department": "HR", "salary": 9000},
+        {"age": 40, "department": "Sales", "salary": 1000},
+        {"age": 40, "department": "HR", "salary": 9000},
+        {"age": 40},
+    ]
+    profile = RuleProfile(root)
+    results = profile.evaluate_many(records)
+
+    assert results[:3] == [root.evaluate(data) for data in records[:3]]
+    assert isinstance(results[3], InsufficientDataError)
+    tree = profile.to_dict()
+    assert "result" not in tree["profile"]
+    left, salary = tree["left"], tree["right"]
+    assert (left["left"]["profile"]["visits"], left["left"]["profile"]["passes"]) == (4, 1)
+    assert (left["right"]["profile"]["visits"], left["right"]["profile"]["skipped"]) == (3, 1)
+    assert (salary["profile"]["visits"], salary["profile"]["skipped"], salary["profile"]["passes"]) == (2, 1, 1)
+    assert left["right"]["profile"]["errors"] == tree["profile"]["errors"] == 1
+    assert left["left"]["profile"]["errors"] == salary["profile"]["errors"] == 0
+
+def test_shared_subtrees_are_profiled_per_position(ast):
+    leaf = ast.create_rule("age > 30")
+    root = Node(type="operator", left=leaf, op="OR", right=leaf)
+    profile = RuleProfile(root)
+    profile.evaluate({"age": 40})
+
+    tree = profile.to_dict()
+    assert tree["left"]["profile"]["visits"] == 1 and tree["right"]["profile"]["skipped"] == 1
+
+def test_strict_profile_validates_first(ast):
+    profile = RuleProfile(ast.create_rule("age > 30 OR salary > 5000"), strict=True)
+
+    with pytest.raises(InsufficientDataError):
+        profile.evaluate({"age": 40})
+    assert profile.to_dict()["profile"]["visits"] == 0
+
+def test_references_are_profiled_as_one_node(ast):
+    referenced = ast.create_rule("age > 30 AND department = 'Sales'")
+    root = ast.create_rule("@prof_ref OR salary > 100")
+    profile = RuleProfile(root, references={"prof_ref": referenced})
+
+    assert profile.evaluate({"age": 40, "department": "Sales", "salary": 0}) is True
+    tree = profile.to_dict()
+    assert strip(tree) == json.loads(ast_to_json(root))
+    assert tree["left"]["type"] == "reference" and tree["left"]["profile"]["result"] is True
+    assert tree["right"]["profile"]["skipped"] == 1
+
+    with pytest.raises(InsufficientDataError):
+        RuleProfile(root, strict=True, references={"prof_ref": referenced}).evaluate({"salary": 0})
+    with pytest.raises(ValueError):
+        RuleProfile(root)
@@ -0,0 +1,62 @@
+import json
+import pytest
+from rule_engine import codec
+from rule_engine.abstract_tree import AST, ast_to_rule, ast_to_json
+from rule_engine.bulk import FailedRule, parse_rules
+from rule_engine.compiler import CompiledRule
+from rule_engine.parser import tokenize
+from rule_engine.references import references, resolve
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def test_parse_references(ast):
+    root = ast.create_rule("@adult AND (salary > 5000 OR @sales.v2) AND @adult")
+
+    assert references(root) == ["adult", "sales.v2"]
+    assert root.left.left.type == "reference" and root.left.left.left == "adult"
+    assert ast_to_rule(root) == "@adult AND (salary > 5000 OR @sales.v2) AND @adult"
+    assert tokenize("@adult OR @b") == ["@", "adult", "OR", "@", "b"]
+
+def test_resolve_shares_referenced_asts(ast):
+    stored = {"adult": ast.create_rule("age >= 18"), "sales": ast.create_rule("department = 'Sales'")}
+    root = ast.create_rule("(@adult AND @sales) OR salary > 5000")
+
+    resolved = resolve(root, stored.__getitem__)
+
+    assert resolved.left.left is stored["adult"] and resolved.left.right is stored["sales"]
+    assert resolved.right is root.right
+    assert references(root) == ["adult", "sales"] and references(resolved) == []
+    assert CompiledRule(resolved).evaluate({"age": 20, "department": "Sales", "salary": 1}) is True
+
+    plain = ast.create_rule("age > 30")
+    assert resolve(plain, stored.__getitem__) is plain
+
+def test_resolve_propagates_lookup_errors(ast):
+    def lookup(name):
+        raise ValueError("Referenced rule not found: {}".format(name))
+
+    with pytest.raises(ValueError, match="missing"):
+        resolve(ast.create_rule("age > 30 OR @missing"), lookup)
+
+def test_combine_parsed_asts(ast):
+    adult, sales = ast.create_rule("age >= 18"), ast.create_rule("department = 'Sales'")
+    combined = ast.combine([adult, sales], "OR")
+
+    assert combined.left is adult and combined.right is sales
+    assert ast_to_json(combined) == ast_to_json(AST().combine_rules(["age >= 18", "department = 'Sales'"], "OR"))
+    with pytest.raises(ValueError):
+        ast.combine([], "AND")
+
+def test_stored_forms(ast):
+    """
+    Rules with references are stored as JSON only, and can't be imported in bulk.
+    """
+    root = ast.create_rule("@adult AND age > 30")
+
+    assert codec.encode_or_none(root) is None
+    assert codec.encode_or_none(root.right) is not None
+    results = parse_rules([json.dumps({"name": "composite", "rule": "@adult AND age > 30"})], workers=1)
+    assert isinstance(results[0], FailedRule)
@@ -0,0 +1,89 @@
+import pytest
+from rule_engine.abstract_tree import AST
+from rule_engine.ruleset import RuleSet
+
+@pytest.fixture
+def rule_set():
+    """Fixture with a few compiled rules."""
+    rule_set = RuleSet()
+    ast = AST()
+    rule_set.add("senior_sales", ast.create_rule("age > 30 AND department = 'Sales'"))
+    rule_set.add("junior", ast.create_rule("age < 25"))
+    rule_set.add("well_paid", ast.create_rule("salary > 50000 OR experience > 5"))
+    return rule_set
+
+def test_match_all_rules(rule_set):
+    data = {"age": 35, "department": "Sales", "salary": 60000, "experience": 3}
+
+    assert sorted(rule_set.match(data)) == ["senior_sales", "well_paid"]
+
+def test_match_named_rules(rule_set):
+    data = {"age": 35, "department": "Sales", "salary": 60000, "experience": 3}
+
+    assert rule_set.match(data, ["junior", "well_paid"]) == ["well_paid"]
+
+    with pytest.raises(KeyError):
+        rule_set.match(data, ["missing"])
+
+def test_evaluate_reports_errors(rule_set):
+    data = {"age": 20}
+
+    results = rule_set.evaluate(data)
+
+    assert results["junior"] is True
+    assert results["senior_sales"] is False
+    assert "InsufficientDataError" in str(results["well_paid"])
+    assert rule_set.match(data) == ["junior"]
+
+def test_replace_and_remove(rule_set):
+    ast = AST()
+    rule_set.add("junior", ast.create_rule("age < 18"))
+    assert rule_set.match({"age": 20}, ["junior"]) == []
+
+    rule_set.remove("junior")
+    assert "junior" not in rule_set
+    assert len(rule_set) == 2
+
+def test_expires_after_ttl():
+    now = [0.0]
+    rule_set = RuleSet(ttl=5, timer=lambda: now[0])
+    assert not rule_set.loaded and not rule_set.expired()
+
+    rule_set.loaded = True
+    now[0] = 4.9
+    assert not rule_set.expired()
+    now[0] = 5.0
+    assert rule_set.expired()
+
+    rule_set.loaded = True      # refreshed
+    assert not rule_set.expired()
+    rule_set.clear()
+    assert not rule_set.loaded and not rule_set.expired()
+
+def test_hashes_kept_without_new_one(rule_set):
+    ast = AST()
+    rule_set.add("junior", ast.create_rule("age < 20"), "h1")
+    rule_set.add("junior", ast.create_rule("age < 21"))
+    assert rule_set.hashes["junior"] == "h1"
+
+    rule_set.remove("junior")
+    assert "junior" not in rule_set.hashes
+
+def test_patch_reuses_compiled_direct_rule(monkeypatch):
+    from rule_engine.compiler import CompiledRule
+    from rule_engine.parser import Node
+    rule_set = RuleSet()
+    # a NUMBER attribute compared to a string can't be indexed
+    odd = Node("comparision", "rs_level", "=", "abc", "NUMBER")
+    rule_set.add("odd", Node("operator", odd, "AND", Node("comparision", "rs_level", ">", 1, "NUMBER")))
+    assert rule_set.index.direct == {"odd"}
+    assert isinstance(rule_set.rules["odd"], Node)
+
+    patched = []
+    original = CompiledRule.patch
+    monkeypatch.setattr(CompiledRule, "patch", lambda self, node: patched.append(node) or original(self, node))
+    node = Node("operator", odd, "AND", Node("comparision", "rs_level", ">", 5, "NUMBER"))
+    rule_set.patch("odd", node)
+
+    assert patched == [node]
+    assert rule_set.index.rules["odd"].compiled.node is node
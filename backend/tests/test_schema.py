@@ -0,0 +1,57 @@
+import pytest
+from benchmarks.synthetic import make_rules, make_records
+from rule_engine.abstract_tree import AST
+from rule_engine.compiler import CompiledRule, compile_strict
+from rule_engine.error import TypeError, InsufficientDataError
+from rule_engine.schema import RuleSchema
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def test_schema_fields(ast):
+    ast.create_rule("(age > 30 AND department = 'Sales') OR (age < 25 AND salary > 5000)")
+    schema = RuleSchema(ast.root)
+
+    assert [(field.attr, field.type, field.ref) for field in schema] == [
+        ("age", "NUMBER", "30"), ("department", "STRING", "Sales"), ("salary", "NUMBER", "5000")]
+    assert schema.number_attrs == ["age", "salary"]
+    assert schema.other_attrs == ["department"]
+
+def test_validate_fails_fast(ast):
+    ast.create_rule("age > 30 OR salary > 5000")
+    schema = RuleSchema(ast.root)
+
+    schema.validate({"age": 40, "salary": 10.5})
+    with pytest.raises(InsufficientDataError):
+        schema.validate({"age": 40})
+    with pytest.raises(TypeError, match="attribute: salary"):
+        schema.validate({"age": 40, "salary": "high"})
+
+def test_strict_matches_on_valid_records(ast):
+    records = make_records(300)
+    for rule in make_rules(20, depth=3, width=3, seed=8):
+        node = ast.create_rule(rule)
+        strict = compile_strict(node)
+        compiled = CompiledRule(node)
+        assert [strict(data) for data in records] == compiled.evaluate_many(records)
+
+def test_strict_rejects_unreached_attributes(ast):
+    """
+    Short-circuiting never reads salary here, the strict evaluator still requires it.
+    """
+    ast.create_rule("age > 30 OR salary > 5000")
+    compiled = CompiledRule(ast.root)
+
+    assert compiled.evaluate({"age": 40}) is True
+    with pytest.raises(InsufficientDataError):
+        compiled.strict({"age": 40})
+    with pytest.raises(TypeError):
+        compiled.strict({"age": 40, "salary": "high"})
+    assert compiled.strict({"age": True, "salary": 10 ** 3}) is False
+    with pytest.raises(OverflowError):
+        compiled.strict({"age": 10 ** 400, "salary": 1})
+
+    results = compiled.evaluate_many([{"age": 40}, {"age": 40, "salary": 1}], strict=True)
+    assert isinstance(results[0], InsufficientDataError) and results[1] is True
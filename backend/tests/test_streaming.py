@@ -0,0 +1,118 @@
+import asyncio
+import csv
+import io
+import json
+import random
+import pytest
+from rule_engine.abstract_tree import AST
+from rule_engine.streaming import LineSplitter, CSVParser, evaluate_stream, NDJSON, CSV
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+def collect(chunks, evaluate, fmt, **kwargs):
+    async def run():
+        return [output async for output in evaluate_stream(chunks, evaluate, fmt, **kwargs)]
+    return "".join(asyncio.run(run())).splitlines()
+
+def test_line_splitter_across_chunks():
+    splitter = LineSplitter()
+    data = "première\nline two\nlast".encode()
+
+    lines = []
+    for i in range(len(data)):
+        lines.extend(splitter.feed(data[i:i + 1]))
+    lines.extend(splitter.flush())
+    assert lines == ["première", "line two", "last"]
+
+def test_line_splitter_quoted_newlines():
+    splitter = LineSplitter(quoted=True)
+
+    assert splitter.feed(b'a,"multi\nline') == []
+    assert splitter.feed(b' value",b\nc,d\n') == ['a,"multi\nline value",b', 'c,d']
+
+def test_line_splitter_quotes_inside_unquoted_fields():
+    splitter = LineSplitter(quoted=True)
+
+    # the quote is literal, as in csv.reader, the next lines are records of their own
+    assert splitter.feed(b'name,size\ntv,5 "inch\nradio,3\n') == ['name,size', 'tv,5 "inch', 'radio,3']
+    assert splitter.feed(b'"say ""hi""\nthere","x"y\nz,w\n') == ['"say ""hi""\nthere","x"y', 'z,w']
+
+def test_line_splitter_matches_csv_reader():
+    rng = random.Random(3)
+    cells = ['plain', 'with,comma', 'multi\nline', 'say "hi"', '5 "inch', '', '"', 'a""b']
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for _ in range(300):
+        writer.writerow(rng.choice(cells) for _ in range(rng.randrange(1, 5)))
+        if rng.random() < 0.2:
+            out.write('tv,5 "inch,b"c\n')     # literal quotes, left unquoted
+    data = out.getvalue().encode()
+
+    splitter = LineSplitter(quoted=True)
+    lines, pos = [], 0
+    while pos < len(data):
+        size = rng.randrange(1, 40)
+        lines.extend(splitter.feed(data[pos:pos + size]))
+        pos += size
+    lines.extend(splitter.flush())
+    assert [row for line in lines for row in csv.reader([line])] == list(csv.reader(io.StringIO(out.getvalue())))
+
+def test_line_splitter_drops_long_records():
+    splitter = LineSplitter(quoted=True, max_record=10)
+    lines = splitter.feed(b'a,b\n"never closed')
+    lines += splitter.feed(b' and much longer than the limit\n' * 1000)
+    lines += splitter.flush()
+
+    assert lines[0] == 'a,b' and len(lines) == 2
+    assert isinstance(lines[1], ValueError)
+    assert splitter._parts == []
+
+    splitter = LineSplitter(max_record=10)
+    lines = splitter.feed(b'{"a": 1}\n{"a": "' + b'x' * 50 + b'"}\n{"a": 2}\n')
+    assert lines[0] == '{"a": 1}' and isinstance(lines[1], ValueError) and lines[2] == '{"a": 2}'
+
+def test_csv_parser_converts_numbers(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    parser = CSVParser()
+
+    records = parser.parse(['age,department,code', '40,Sales,007', '35.5,,x'])
+    assert records == [{"age": 40, "department": "Sales", "code": "007"}, {"age": 35.5, "code": "x"}]
+
+def test_evaluate_stream_ndjson(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    compiled = ast.compile()
+    records = [{"age": 40, "department": "Sales"}, {"age": 20, "department": "Sales"}, {"department": "HR"}] * 50
+    body = "".join(json.dumps(record) + "\n" for record in records).encode() + b"not json\n"
+
+    output = collect(chunked(body, 13), compiled.evaluate, NDJSON)
+
+    assert len(output) == len(records) + 1
+    assert output[:2] == ['{"result": true}', '{"result": false}']
+    assert "InsufficientDataError" in output[2]
+    assert "Invalid JSON" in output[-1]
+
+def test_evaluate_stream_csv(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    body = b'age,department\n40,Sales\nforty,Sales\n20,HR'
+
+    output = collect(chunked(body, 5), ast.compile().evaluate, CSV)
+
+    assert output[0] == '{"result": true}'
+    assert "TypeError" in output[1]
+    assert output[2] == '{"result": false}'
+
+def test_evaluate_stream_reports_long_records(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+    body = b'age,department\n40,"Sales' + b' and more' * 20 + b'"\n40,Sales\n'
+
+    output = collect(chunked(body, 7), ast.compile().evaluate, CSV, max_record=40)
+
+    assert "longer than 40" in output[0]
+    assert output[1] == '{"result": true}'
@@ -0,0 +1,75 @@
+import pytest
+np = pytest.importorskip("numpy")
+
+from rule_engine.abstract_tree import AST
+from rule_engine.vectorized import evaluate_columns
+
+RULE = "((age > 30 AND department = 'Sales') OR (age < 25 AND department = 'Marketing')) AND (salary > 50000 OR experience > 5)"
+
+RECORDS = [
+    {"age": 35, "department": "Sales", "salary": 60000, "experience": 3},
+    {"age": 25, "department": "Marketing", "salary": 60000, "experience": 3},
+    {"age": 20, "department": "Marketing", "salary": 1000, "experience": 6},
+    {"age": 40, "department": "HR", "salary": 100000, "experience": 10},
+    {"age": 31, "department": "Sales", "salary": 100, "experience": 1},
+]
+
+@pytest.fixture
+def ast():
+    """Fixture to initialize an AST for each test."""
+    return AST()
+
+def to_columns(records):
+    return {key: np.array([record[key] for record in records]) for key in records[0]}
+
+def test_columns_match_interpreter(ast):
+    ast.create_rule(RULE)
+
+    result = evaluate_columns(ast.root, to_columns(RECORDS))
+
+    assert result.tolist() == [ast.evaluate_rule(data) for data in RECORDS]
+
+def test_columns_string_inequality(ast):
+    ast.create_rule("department != 'Sales'")
+
+    result = evaluate_columns(ast.root, {"department": ["Sales", "HR", "Sales", "Legal"]})
+
+    assert result.tolist() == [False, True, False, True]
+
+def test_columns_missing_attribute(ast):
+    ast.create_rule("age > 30 AND department = 'Sales'")
+
+    with pytest.raises(Exception) as excinfo:
+        evaluate_columns(ast.root, {"age": np.array([40, 20])})
+    assert "InsufficientDataError" in str(excinfo.value)
+
+    # no row reaches the department comparision, same as the interpreter
+    assert evaluate_columns(ast.root, {"age": np.array([10, 20])}).tolist() == [False, False]
+
+def test_columns_type_error(ast):
+    ast.create_rule("age > 30 AND salary > 50000")
+
+    with pytest.raises(Exception) as excinfo:
+        evaluate_columns(ast.root, {"age": np.array([35, "thirty"], dtype=object), "salary": np.array([1, 2])})
+    assert "TypeError" in str(excinfo.value)
+
+def test_columns_pandas_categorical(ast):
+    pd = pytest.importorskip("pandas")
+    ast.create_rule(RULE)
+
+    frame = pd.DataFrame(RECORDS)
+    frame["department"] = frame["department"].astype("category")
+
+    result = evaluate_columns(ast.root, frame)
+
+    assert result.tolist() == [ast.evaluate_rule(data) for data in RECORDS]
+
+def test_columns_pyarrow_table(ast):
+    pa = pytest.importorskip("pyarrow")
+    ast.create_rule(RULE)
+
+    table = pa.Table.from_pylist(RECORDS)
+
+    result = evaluate_columns(ast.root, table)
+
+    assert result.tolist() == [ast.evaluate_rule(data) for data in RECORDS]